@@ -1,8 +1,11 @@
+from __future__ import annotations
+
+import gc
 import sys
 from argparse import ArgumentParser
 from enum import Enum
 
-from protocol import Backend, make_parser
+from protocol import Backend, ControlLineCache, EventPool, Parser, make_parser
 
 from benchmarks import data_factory
 from benchmarks.stats_logger import StatsLogger
@@ -13,6 +16,57 @@ class Scenario(str, Enum):
     msg_ping_pong_msg = "msg_ping_pong_msg"
     ping_pong = "ping_pong"
     msg_hmsg = "msg_hmsg"
+    info_msg = "info_msg"
+
+
+class Api(str, Enum):
+    # Parse data then pop the list of events
+    list = "list"
+    # Iterate over events as they are parsed
+    iter = "iter"
+    # Parse data then pop the batch of messages and the list of events
+    batch = "batch"
+    # Parse several reads at once then pop the list of events
+    many = "many"
+
+
+def allocated_blocks(
+    parser: Parser,
+    reads: list[bytes] | list[list[bytes]],
+    api: Api,
+    pool: EventPool | None,
+) -> int:
+    """Return the number of memory blocks allocated by parsing the reads.
+
+    Everything handed over by the parser is kept alive until blocks are
+    counted, so that blocks cannot be freed and reused in between. Events
+    are still returned to the pool, and only their fields are kept.
+    """
+    kept: list[object] = []
+    gc.disable()
+    try:
+        blocks = sys.getallocatedblocks()
+        for op in reads:
+            if isinstance(op, list):
+                parser.parse_many(op)
+                events = parser.events_received()
+            elif api == Api.iter:
+                events = parser.parse_iter(op)
+            else:
+                parser.parse(op)
+                if api == Api.batch:
+                    kept.append(parser.batch_received())
+                events = parser.events_received()
+            for event in events:
+                if pool is None:
+                    kept.append(event)
+                else:
+                    kept.extend([getattr(event, slot) for slot in event.__slots__])
+                    pool.put(event)
+        return sys.getallocatedblocks() - blocks
+    finally:
+        del kept
+        gc.enable()
 
 
 def main():
@@ -30,6 +84,42 @@ def main():
     parser.add_argument(
         "--parser", "-p", type=str, default="default", help="Parser backend"
     )
+    parser.add_argument(
+        "--read-size",
+        "-c",
+        type=int,
+        default=0,
+        help="Coalesce ops into reads of this size in bytes (default to one op per read)",
+    )
+    parser.add_argument(
+        "--api",
+        "-a",
+        type=str,
+        default="list",
+        help="Parser API used to consume events (list, iter, batch or many)",
+    )
+    parser.add_argument(
+        "--chunks",
+        "-k",
+        type=int,
+        default=8,
+        help="Number of reads parsed at once with the many API",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="store_true",
+        help="Decode message subjects and INFO fields lazily (they are never read)",
+    )
+    parser.add_argument(
+        "--control-line-cache",
+        action="store_true",
+        help="Cache parsed MSG and HMSG control lines",
+    )
+    parser.add_argument(
+        "--pool",
+        action="store_true",
+        help="Take message events from a pool and return them once consumed",
+    )
     parser.add_argument(
         "--output-dir", "-o", type=str, default=None, help="Output directory"
     )
@@ -41,6 +131,13 @@ def main():
         print(f"ERROR: Invalid parser: {args.parser}", file=sys.stderr)
         print(f"Allowed parsers: {[b.value for b in Backend]}", file=sys.stderr)
         sys.exit(1)
+    # Parse the API
+    try:
+        api = Api(args.api)
+    except ValueError:
+        print(f"ERROR: Invalid API: {args.api}", file=sys.stderr)
+        print(f"Allowed APIs: {[a.value for a in Api]}", file=sys.stderr)
+        sys.exit(1)
     # Parse the scenario and generate the data
     try:
         scenario = Scenario(args.scenario)
@@ -64,16 +161,56 @@ def main():
         factor = 2
         opts = {"message_size": 1024, "subject_size": 64, "header_size": 64}
         data = data_factory.msg_hmsg(args.messages, **opts)
+    elif scenario == Scenario.info_msg:
+        factor = 2
+        opts = {"message_size": 64, "subject_size": 16, "connect_urls": 256}
+        data = data_factory.info_msg(args.messages, **opts)
     else:
         print(f"Scenario not implemented: {scenario}", file=sys.stderr)
         sys.exit(1)
+    # Coalesce ops into large reads
+    scenario_name = scenario.value
+    if args.read_size > 0:
+        n_ops = len(data)
+        data = data_factory.coalesce(data, args.read_size)
+        factor = n_ops / len(data)
+        scenario_name = f"{scenario.value}_read_{args.read_size}"
+        opts["read_size"] = args.read_size
+    reads: list[bytes] | list[list[bytes]] = data
+    if api == Api.many:
+        # Parse groups of reads at once
+        reads = data_factory.group(data, args.chunks)
+        factor = factor * len(data) / len(reads)
+        scenario_name = f"{scenario_name}_many_{args.chunks}"
+        opts["chunks"] = args.chunks
+    elif api != Api.list:
+        scenario_name = f"{scenario_name}_{api.value}"
+    if args.lazy:
+        scenario_name = f"{scenario_name}_lazy"
+    if args.control_line_cache:
+        scenario_name = f"{scenario_name}_cached"
+    if args.pool:
+        scenario_name = f"{scenario_name}_pooled"
+    pool: EventPool | None = None
+
+    def new_parser() -> Parser:
+        nonlocal pool
+        pool = EventPool() if args.pool else None
+        return make_parser(
+            backend,
+            lazy=args.lazy,
+            batch=api == Api.batch,
+            control_line_cache=ControlLineCache() if args.control_line_cache else None,
+            event_pool=pool,
+        )
+
     # Create the parser
-    parser = make_parser(backend)
+    parser = new_parser()
     parser_type = type(parser).__name__
     # Parse the data
     report = StatsLogger(
         output_dir=args.output_dir,
-        scenario=scenario.value,
+        scenario=scenario_name,
         parser=parser_type,
         n_messages=args.messages,
         repeat=args.repeat,
@@ -81,19 +218,51 @@ def main():
     )
     print("#" * 60)
     for idx in range(args.repeat):
-        parser = make_parser(backend)
+        parser = new_parser()
         with report.iteration() as iteration:
-            for op in data:
+            for op in reads:
                 timer = iteration.observe()
                 timer.reset()
-                parser.parse(op)
+                if isinstance(op, list):
+                    parser.parse_many(op)
+                    for event in parser.events_received():
+                        if pool is not None:
+                            pool.put(event)
+                elif pool is not None:
+                    # Events are returned to the pool once consumed
+                    if api == Api.iter:
+                        for event in parser.parse_iter(op):
+                            pool.put(event)
+                    else:
+                        parser.parse(op)
+                        if api == Api.batch:
+                            parser.batch_received()
+                        for event in parser.events_received():
+                            pool.put(event)
+                elif api == Api.iter:
+                    for _ in parser.parse_iter(op):
+                        pass
+                elif api == Api.batch:
+                    parser.parse(op)
+                    parser.batch_received()
+                    for _ in parser.events_received():
+                        pass
+                else:
+                    parser.parse(op)
+                    for _ in parser.events_received():
+                        pass
                 timer.end()
+            # Allocations are counted out of the timed loop, by parsing the
+            # reads again once the parser and its pool are warmed up
+            iteration.allocated_blocks = allocated_blocks(parser, reads, api, pool)
         results = iteration.result()
+        blocks_per_op = results.allocated_blocks / (len(reads) * factor)
         print(
-            f"[{backend}] {scenario} - iteration {idx+1}/{args.repeat} - {int(results.p50 / factor)} ns/op"
+            f"[{backend}] {scenario_name} - iteration {idx + 1}/{args.repeat} - {int(results.p50 / factor)} ns/op"
+            f" - {blocks_per_op:.2f} allocated blocks/op"
         )
     results = report.results()
-    print(f"[{backend}] {scenario} 🕑 {int(results.score/ factor)} ns/op")
+    print(f"[{backend}] {scenario_name} 🕑 {int(results.score / factor)} ns/op")
     # Dump the profile
     report.write_to_file()
 
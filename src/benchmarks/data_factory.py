@@ -159,6 +159,21 @@ def msg_hmsg(
     ] * n
 
 
+def info_msg(
+    n: int,
+    connect_urls: int = 0,
+    sid: int = 1,
+    subject_size: int = 16,
+    reply_subject_size: int = 0,
+    message_size: int = 0,
+) -> list[bytes]:
+    urls = [f"10.0.{idx // 256}.{idx % 256}:4222" for idx in range(connect_urls)]
+    return [
+        info(connect_urls=urls).encode(),
+        msg(sid, subject_size, reply_subject_size, message_size),
+    ] * n
+
+
 def msg_ok_ping_msg_pong_msg_ok(
     n: int,
     sid: int = 1,
@@ -175,3 +190,17 @@ def msg_ok_ping_msg_pong_msg_ok(
         msg(sid, subject_size, reply_subject_size, message_size),
         ok(),
     ] * n
+
+
+def coalesce(data: list[bytes], read_size: int) -> list[bytes]:
+    """Join ops into a single stream and split it into reads of `read_size` bytes.
+
+    Reads are not aligned on op boundaries, so ops may be split across reads.
+    """
+    stream = b"".join(data)
+    return [stream[i : i + read_size] for i in range(0, len(stream), read_size)]
+
+
+def group(data: list[bytes], n: int) -> list[list[bytes]]:
+    """Group reads into lists of `n` reads, as queued for a single wakeup."""
+    return [data[i : i + n] for i in range(0, len(data), n)]
@@ -0,0 +1,255 @@
+"""End-to-end benchmarks of the client connection.
+
+A stand-in server runs in a separate process, and the client connection
+sends and receives messages through a real TCP socket, so that the cost of
+the whole pipeline is measured instead of the parser or the encoder alone.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import multiprocessing
+import sys
+from argparse import ArgumentParser, Namespace
+from enum import Enum
+
+from connection import Connection, WriteBufferFullError
+from protocol import Backend
+
+from benchmarks import server
+from benchmarks.stats_logger import StatsLogger
+
+
+DEFAULT_FLUSH_THRESHOLD = 32 * 1024
+DEFAULT_LARGE_PAYLOAD_THRESHOLD = 64 * 1024
+
+
+class Scenario(str, Enum):
+    # The server streams messages to a subscription
+    stream = "stream"
+    # Each message is published then received before the next one is published
+    echo = "echo"
+    # Messages are published as fast as the connection accepts them
+    publish = "publish"
+
+
+async def stream(
+    connection: Connection, report: StatsLogger, n: int, block: int
+) -> StatsLogger.Iteration:
+    loop = asyncio.get_running_loop()
+    done: asyncio.Future[None] = loop.create_future()
+    received = 0
+    with report.iteration() as iteration:
+        timer = iteration.observe()
+
+        def handler(
+            subject: str,
+            reply_to: str,
+            payload: bytearray | memoryview,
+            header: bytearray | memoryview,
+        ) -> None:
+            nonlocal received
+            received += 1
+            if received % block == 0:
+                # Observe the duration of each block of messages
+                timer.end()
+                if received == n:
+                    done.set_result(None)
+                else:
+                    timer.reset()
+
+        timer.reset()
+        sid = connection.subscribe(server.STREAM_SUBJECT, handler)
+        await done
+        connection.unsubscribe(sid)
+    return iteration
+
+
+async def echo(
+    connection: Connection, report: StatsLogger, n: int, message_size: int
+) -> StatsLogger.Iteration:
+    loop = asyncio.get_running_loop()
+    waiter: asyncio.Future[None] = loop.create_future()
+    payload = b"x" * message_size
+
+    def handler(
+        subject: str,
+        reply_to: str,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
+    ) -> None:
+        waiter.set_result(None)
+
+    sid = connection.subscribe("bench.echo", handler)
+    await connection.flush()
+    with report.iteration() as iteration:
+        for _ in range(n):
+            waiter = loop.create_future()
+            timer = iteration.observe()
+            timer.reset()
+            connection.publish("bench.echo", payload)
+            await waiter
+            timer.end()
+    connection.unsubscribe(sid)
+    return iteration
+
+
+async def publish(
+    connection: Connection, report: StatsLogger, n: int, message_size: int, block: int
+) -> StatsLogger.Iteration:
+    payload = b"x" * message_size
+    with report.iteration() as iteration:
+        for _ in range(n // block):
+            timer = iteration.observe()
+            timer.reset()
+            for _ in range(block):
+                try:
+                    connection.publish("bench.publish", payload)
+                except WriteBufferFullError:
+                    await connection.drain()
+                    connection.publish("bench.publish", payload)
+            timer.end()
+        await connection.flush()
+    return iteration
+
+
+async def run(args: Namespace, backend: Backend, port: int) -> None:
+    scenario = Scenario(args.scenario)
+    scenario_name = f"e2e_{scenario.value}_{args.message_size}"
+    if args.zero_copy:
+        scenario_name = f"{scenario_name}_zero_copy"
+    if args.flush_threshold != DEFAULT_FLUSH_THRESHOLD:
+        scenario_name = f"{scenario_name}_flush_{args.flush_threshold}"
+    if args.large_payload_threshold != DEFAULT_LARGE_PAYLOAD_THRESHOLD:
+        scenario_name = f"{scenario_name}_large_{args.large_payload_threshold}"
+    factor = args.block if scenario != Scenario.echo else 1
+    report: StatsLogger | None = None
+    print("#" * 60)
+    for idx in range(args.repeat):
+        connection = Connection(
+            backend,
+            zero_copy=args.zero_copy,
+            flush_threshold=args.flush_threshold,
+            large_payload_threshold=args.large_payload_threshold,
+        )
+        await connection.connect(port=port)
+        if report is None:
+            report = StatsLogger(
+                output_dir=args.output_dir,
+                scenario=scenario_name,
+                parser=type(connection.parser).__name__,
+                n_messages=args.messages,
+                repeat=args.repeat,
+                message_size=args.message_size,
+                block=factor,
+                flush_threshold=args.flush_threshold,
+                large_payload_threshold=args.large_payload_threshold,
+            )
+        if scenario == Scenario.stream:
+            iteration = await stream(connection, report, args.messages, args.block)
+        elif scenario == Scenario.publish:
+            iteration = await publish(
+                connection, report, args.messages, args.message_size, args.block
+            )
+        else:
+            iteration = await echo(connection, report, args.messages, args.message_size)
+        await connection.close()
+        results = iteration.result()
+        ns_per_msg = results.p50 / factor
+        print(
+            f"[{backend}] {scenario_name} - iteration {idx + 1}/{args.repeat}"
+            f" - {int(ns_per_msg)} ns/msg"
+            f" - {args.message_size * 1e3 / ns_per_msg:.1f} MB/s"
+        )
+    assert report is not None
+    results = report.results()
+    ns_per_msg = results.score / factor
+    print(
+        f"[{backend}] {scenario_name} 🕑 {int(ns_per_msg)} ns/msg"
+        f" - {args.message_size * 1e3 / ns_per_msg:.1f} MB/s"
+    )
+    report.write_to_file()
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--messages", "-n", type=int, default=100_000, help="Number of messages"
+    )
+    parser.add_argument(
+        "--repeat", "-r", type=int, default=10, help="Number of repetitions"
+    )
+    parser.add_argument(
+        "--scenario", "-s", type=str, default="stream", help="Benchmark scenario"
+    )
+    parser.add_argument(
+        "--parser", "-p", type=str, default="default", help="Parser backend"
+    )
+    parser.add_argument(
+        "--message-size", "-m", type=int, default=128, help="Payload size in bytes"
+    )
+    parser.add_argument(
+        "--block",
+        "-b",
+        type=int,
+        default=1000,
+        help="Number of streamed messages observed at once",
+    )
+    parser.add_argument(
+        "--zero-copy",
+        action="store_true",
+        help="Receive payloads as views into the parser buffer",
+    )
+    parser.add_argument(
+        "--flush-threshold",
+        "-f",
+        type=int,
+        default=DEFAULT_FLUSH_THRESHOLD,
+        help="Size of the pending-write buffer written at once (1 writes each op)",
+    )
+    parser.add_argument(
+        "--large-payload-threshold",
+        "-l",
+        type=int,
+        default=DEFAULT_LARGE_PAYLOAD_THRESHOLD,
+        help="Size of payloads published without being copied into the write buffer",
+    )
+    parser.add_argument(
+        "--output-dir", "-o", type=str, default=None, help="Output directory"
+    )
+    args = parser.parse_args()
+    try:
+        backend = Backend(args.parser)
+    except ValueError:
+        print(f"ERROR: Invalid parser: {args.parser}", file=sys.stderr)
+        print(f"Allowed parsers: {[b.value for b in Backend]}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        scenario = Scenario(args.scenario)
+    except ValueError:
+        print(f"ERROR: Invalid scenario: {args.scenario}", file=sys.stderr)
+        print(f"Allowed scenarios: {[s.value for s in Scenario]}", file=sys.stderr)
+        sys.exit(1)
+    if scenario != Scenario.echo and (
+        args.messages % args.block or args.messages < 2 * args.block
+    ):
+        print("ERROR: Messages must be a multiple of the block size", file=sys.stderr)
+        sys.exit(1)
+    # Run the server in another process
+    pipe, child_pipe = multiprocessing.Pipe()
+    process = multiprocessing.Process(
+        target=server.run,
+        args=(child_pipe, args.messages, args.message_size),
+        daemon=True,
+    )
+    process.start()
+    try:
+        port = pipe.recv()
+        asyncio.run(run(args, backend, port))
+    finally:
+        process.terminate()
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Benchmarks of the client protocol encoder.
+
+Operations are appended to the same write buffer, which is cleared after
+each block of operations as a connection would do once the buffer was
+written to the socket.
+"""
+
+from __future__ import annotations
+
+import sys
+from argparse import ArgumentParser
+from enum import Enum
+from secrets import token_hex
+from typing import Callable
+
+from protocol.encoder import encode_hpub, encode_pub, encode_sub, encode_unsub
+
+from benchmarks.stats_logger import StatsLogger
+
+
+class Scenario(str, Enum):
+    pub = "pub"
+    pub_reply = "pub_reply"
+    hpub = "hpub"
+    sub_unsub = "sub_unsub"
+
+
+class Encoder(str, Enum):
+    # Encode operations with the protocol.encoder functions
+    encoder = "encoder"
+    # Encode operations with f-strings, as done before the encoder existed
+    fstring = "fstring"
+
+
+def fstring_pub(
+    buf: bytearray, subject: str, payload: bytes = b"", reply_to: str = ""
+) -> None:
+    if reply_to:
+        control_line = f"PUB {subject} {reply_to} {len(payload)}\r\n"
+    else:
+        control_line = f"PUB {subject} {len(payload)}\r\n"
+    buf += control_line.encode() + payload + b"\r\n"
+
+
+def fstring_hpub(
+    buf: bytearray,
+    subject: str,
+    header: bytes,
+    payload: bytes = b"",
+    reply_to: str = "",
+) -> None:
+    sizes = f"{len(header)} {len(header) + len(payload)}"
+    if reply_to:
+        control_line = f"HPUB {subject} {reply_to} {sizes}\r\n"
+    else:
+        control_line = f"HPUB {subject} {sizes}\r\n"
+    buf += control_line.encode() + header + payload + b"\r\n"
+
+
+def fstring_sub(buf: bytearray, subject: str, sid: int, queue: str = "") -> None:
+    if queue:
+        buf += f"SUB {subject} {queue} {sid}\r\n".encode()
+    else:
+        buf += f"SUB {subject} {sid}\r\n".encode()
+
+
+def fstring_unsub(buf: bytearray, sid: int) -> None:
+    buf += f"UNSUB {sid}\r\n".encode()
+
+
+def make_op(
+    scenario: Scenario,
+    encoder: Encoder,
+    subject: str,
+    reply_to: str,
+    header: bytes,
+    payload: bytes,
+) -> Callable[[bytearray, int], None]:
+    """Return a function appending the operation of the scenario to a buffer."""
+    if encoder == Encoder.encoder:
+        pub, hpub, sub, unsub = encode_pub, encode_hpub, encode_sub, encode_unsub
+    else:
+        pub, hpub, sub, unsub = fstring_pub, fstring_hpub, fstring_sub, fstring_unsub
+    if scenario == Scenario.pub:
+        return lambda buf, sid: pub(buf, subject, payload)
+    if scenario == Scenario.pub_reply:
+        return lambda buf, sid: pub(buf, subject, payload, reply_to)
+    if scenario == Scenario.hpub:
+        return lambda buf, sid: hpub(buf, subject, header, payload)
+
+    def sub_unsub(buf: bytearray, sid: int) -> None:
+        sub(buf, subject, sid)
+        unsub(buf, sid)
+
+    return sub_unsub
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--messages", "-n", type=int, default=100_000, help="Number of operations"
+    )
+    parser.add_argument(
+        "--repeat", "-r", type=int, default=10, help="Number of repetitions"
+    )
+    parser.add_argument(
+        "--scenario", "-s", type=str, default="pub", help="Benchmark scenario"
+    )
+    parser.add_argument(
+        "--encoder",
+        "-e",
+        type=str,
+        default="encoder",
+        help="Encoder used (encoder or fstring)",
+    )
+    parser.add_argument(
+        "--message-size", "-m", type=int, default=128, help="Payload size in bytes"
+    )
+    parser.add_argument(
+        "--block",
+        "-b",
+        type=int,
+        default=100,
+        help="Number of operations observed at once",
+    )
+    parser.add_argument(
+        "--output-dir", "-o", type=str, default=None, help="Output directory"
+    )
+    args = parser.parse_args()
+    try:
+        scenario = Scenario(args.scenario)
+    except ValueError:
+        print(f"ERROR: Invalid scenario: {args.scenario}", file=sys.stderr)
+        print(f"Allowed scenarios: {[s.value for s in Scenario]}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        encoder = Encoder(args.encoder)
+    except ValueError:
+        print(f"ERROR: Invalid encoder: {args.encoder}", file=sys.stderr)
+        print(f"Allowed encoders: {[e.value for e in Encoder]}", file=sys.stderr)
+        sys.exit(1)
+    if args.messages % args.block:
+        print("ERROR: Messages must be a multiple of the block size", file=sys.stderr)
+        sys.exit(1)
+    op = make_op(
+        scenario,
+        encoder,
+        subject=token_hex(16),
+        reply_to=token_hex(16),
+        header=b"NATS/1.0\r\n" + token_hex(32).encode() + b"\r\n\r\n",
+        payload=b"x" * args.message_size,
+    )
+    scenario_name = f"encode_{scenario.value}_{args.message_size}"
+    report = StatsLogger(
+        output_dir=args.output_dir,
+        scenario=scenario_name,
+        parser=encoder.value,
+        n_messages=args.messages,
+        repeat=args.repeat,
+        message_size=args.message_size,
+        block=args.block,
+    )
+    blocks = range(1, args.messages + 1, args.block)
+    print("#" * 60)
+    for idx in range(args.repeat):
+        buf = bytearray()
+        with report.iteration() as iteration:
+            for first_sid in blocks:
+                timer = iteration.observe()
+                timer.reset()
+                for sid in range(first_sid, first_sid + args.block):
+                    op(buf, sid)
+                timer.end()
+                buf.clear()
+        results = iteration.result()
+        print(
+            f"[{encoder.value}] {scenario_name} - iteration {idx + 1}/{args.repeat}"
+            f" - {int(results.p50 / args.block)} ns/op"
+        )
+    results = report.results()
+    print(
+        f"[{encoder.value}] {scenario_name} 🕑 {int(results.score / args.block)} ns/op"
+    )
+    report.write_to_file()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Stand-in NATS server used to benchmark client connections.
+
+Only the operations sent by `connection.Connection` are supported. Messages
+published are delivered to the subscriptions on the same subject, and
+subscribing to `STREAM_SUBJECT` streams pre-encoded messages to the
+subscription as fast as the socket accepts them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from multiprocessing.connection import Connection as Pipe
+
+from benchmarks import data_factory
+
+STREAM_SUBJECT = "bench.stream"
+
+
+class StandInServer:
+    def __init__(
+        self,
+        stream_messages: int = 0,
+        stream_message_size: int = 0,
+        max_payload: int = 64 * 1024 * 1024,
+    ) -> None:
+        self.stream_messages = stream_messages
+        self.stream_message_size = stream_message_size
+        self.info = data_factory.info(max_payload=max_payload).encode()
+        # Streams are encoded once for each sid
+        self._streams: dict[int, bytes] = {}
+        # Subscriptions of all clients by subject
+        self._subscriptions: dict[bytes, dict[int, asyncio.StreamWriter]] = {}
+
+    def stream(self, sid: int) -> bytes:
+        """Return the messages streamed to a subscription."""
+        if sid not in self._streams:
+            payload = b"x" * self.stream_message_size
+            op = b"MSG %s %d %d\r\n%s\r\n" % (
+                STREAM_SUBJECT.encode(),
+                sid,
+                len(payload),
+                payload,
+            )
+            self._streams[sid] = op * self.stream_messages
+        return self._streams[sid]
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        writer.write(self.info)
+        sids: list[tuple[bytes, int]] = []
+        try:
+            while True:
+                line = await reader.readuntil(b"\r\n")
+                op, _, args = line[:-2].partition(b" ")
+                if op == b"PUB" or op == b"HPUB":
+                    # Sizes are the last tokens, one for PUB and two for HPUB
+                    n_sizes, msg_op = (1, b"MSG") if op == b"PUB" else (2, b"HMSG")
+                    tokens = args.split(b" ")
+                    size = int(tokens[-1])
+                    payload = await reader.readexactly(size + 2)
+                    subscriptions = self._subscriptions.get(tokens[0], {})
+                    reply = b" " + tokens[1] if len(tokens) == n_sizes + 2 else b""
+                    sizes = b" ".join(tokens[-n_sizes:])
+                    for sid, subscriber in subscriptions.items():
+                        subscriber.write(
+                            b"%s %s %d%s %s\r\n"
+                            % (msg_op, tokens[0], sid, reply, sizes)
+                        )
+                        subscriber.write(payload)
+                elif op == b"PING":
+                    writer.write(b"PONG\r\n")
+                elif op == b"SUB":
+                    tokens = args.split(b" ")
+                    subject, sid = tokens[0], int(tokens[-1])
+                    self._subscriptions.setdefault(subject, {})[sid] = writer
+                    sids.append((subject, sid))
+                    if subject == STREAM_SUBJECT.encode():
+                        writer.write(self.stream(sid))
+                elif op == b"UNSUB":
+                    sid = int(args.split(b" ")[0])
+                    for subject, subscribed in sids:
+                        if subscribed == sid:
+                            self._subscriptions[subject].pop(sid, None)
+                elif op not in (b"CONNECT", b"PONG"):
+                    writer.write(b"-ERR 'Unknown Protocol Operation'\r\n")
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            for subject, sid in sids:
+                self._subscriptions[subject].pop(sid, None)
+            writer.close()
+
+
+def run(
+    pipe: Pipe,
+    stream_messages: int = 0,
+    stream_message_size: int = 0,
+) -> None:
+    """Run a stand-in server until the process is terminated.
+
+    The port the server listens on is sent to the pipe once it is ready.
+    This function is meant to be the target of a separate process, so that
+    the server does not run on the event loop of the benchmarked client.
+    """
+
+    async def serve() -> None:
+        server = StandInServer(stream_messages, stream_message_size)
+        listener = await asyncio.start_server(server.handle_client, "127.0.0.1", 0)
+        pipe.send(listener.sockets[0].getsockname()[1])
+        await listener.serve_forever()
+
+    asyncio.run(serve())
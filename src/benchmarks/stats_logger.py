@@ -23,6 +23,8 @@ class IterationResult:
     maximum: int
     minimum: int
     standard_deviation: float
+    # Number of memory blocks allocated by parsing the reads once
+    allocated_blocks: int = 0
 
 
 @dataclass
@@ -100,6 +102,7 @@ class StatsLogger:
         def __init__(self, stats_logger: StatsLogger) -> None:
             self._durations: list[float] = []
             self._stats_logger = stats_logger
+            self.allocated_blocks = 0
 
         def __enter__(self) -> StatsLogger.Iteration:
             return self
@@ -124,6 +127,7 @@ class StatsLogger:
                 maximum=int(max(ns_durations)),
                 minimum=int(min(ns_durations)),
                 standard_deviation=stdev(ns_durations),
+                allocated_blocks=self.allocated_blocks,
             )
 
         def observe(self) -> Timer:
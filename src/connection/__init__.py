@@ -0,0 +1,17 @@
+from .connection import (
+    Connection,
+    ConnectionClosedError,
+    ServerError,
+    StaleConnectionError,
+    WriteBufferFullError,
+)
+from .histogram import RttHistogram
+
+__all__ = [
+    "Connection",
+    "ConnectionClosedError",
+    "RttHistogram",
+    "ServerError",
+    "StaleConnectionError",
+    "WriteBufferFullError",
+]
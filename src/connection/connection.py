@@ -1,6 +1,456 @@
-from protocol import Backend, make_parser
+"""asyncio NATS client connection."""
 
+from __future__ import annotations
 
-class Connection:
-    def __init__(self, parser_backend: Backend | None = None) -> None:
-        self.parser = make_parser(parser_backend)
+import asyncio
+import sys
+from collections import deque
+from typing import Any, Callable
+
+from protocol import Backend, MsgHandler, make_parser
+from protocol.common import ErrorEvent, InfoEvent, Operation
+from protocol.encoder import (
+    CRLF,
+    PONG_OP,
+    encode_connect,
+    encode_hpub,
+    encode_hpub_control_line,
+    encode_ping,
+    encode_pub,
+    encode_pub_control_line,
+    encode_sub,
+    encode_unsub,
+)
+
+from .histogram import RttHistogram
+
+# Socket transports send the buffers given to writelines() with sendmsg()
+# since Python 3.12, they were joined into a single buffer before.
+WRITELINES_SENDMSG = sys.version_info >= (3, 12)
+
+# Errors sent by the server when it rejects an operation, it keeps the
+# connection open after them. Other errors are followed by a close.
+NON_FATAL_ERRORS = ("permissions violation",)
+
+
+class ConnectionClosedError(Exception):
+    """Connection closed error."""
+
+    def __init__(self) -> None:
+        super().__init__("nats: connection closed")
+
+
+class ServerError(Exception):
+    """Error sent by the server using a -ERR operation."""
+
+    def __init__(self, message: str) -> None:
+        super().__init__(f"nats: {message}")
+        self.message = message
+
+
+class StaleConnectionError(Exception):
+    """Stale connection error."""
+
+    def __init__(self) -> None:
+        super().__init__("nats: stale connection")
+
+
+class WriteBufferFullError(Exception):
+    """Write buffer full error."""
+
+    def __init__(self) -> None:
+        super().__init__("nats: write buffer full")
+
+
+class Connection(asyncio.BufferedProtocol):
+    """NATS client connection running on an asyncio event loop.
+
+    The connection is the `asyncio.BufferedProtocol` of its transport:
+    bytes are received directly into the parser buffer, and messages are
+    dispatched to the handler of their subscription from the parse loop.
+
+    Operations sent are encoded into a pending-write buffer, which is
+    written to the transport on the next iteration of the event loop, once
+    it holds `flush_threshold` bytes, or when the connection is flushed.
+    Once the transport holds `max_pending_size` bytes not sent yet,
+    publishing raises `WriteBufferFullError` until `drain()` returned.
+
+    Payloads of at least `large_payload_threshold` bytes are not copied
+    into the pending-write buffer, they are handed to the transport along
+    with the buffer instead.
+
+    PINGs sent by the server are answered as soon as they are parsed,
+    before the operations received after them are dispatched. A PING is
+    sent every `ping_interval` seconds, and the connection is closed with
+    `StaleConnectionError` once `max_outstanding_pings` PINGs are waiting
+    for their PONG. Round-trip times of all PINGs are observed by
+    `rtt_histogram`.
+
+    Errors sent by the server close the connection with `ServerError`,
+    except the non-fatal ones such as permissions violations: they are
+    passed to `on_error` and kept in `last_error` instead.
+    """
+
+    def __init__(
+        self,
+        parser_backend: Backend | None = None,
+        zero_copy: bool = False,
+        max_bytes_per_read: int | None = None,
+        name: str | None = None,
+        flush_threshold: int = 32 * 1024,
+        max_pending_size: int = 2 * 1024 * 1024,
+        large_payload_threshold: int = 64 * 1024,
+        ping_interval: float | None = 120.0,
+        max_outstanding_pings: int = 2,
+        on_error: Callable[[ServerError], None] | None = None,
+    ) -> None:
+        if flush_threshold <= 0:
+            raise ValueError(f"invalid flush threshold: {flush_threshold}")
+        if large_payload_threshold < 0:
+            raise ValueError(f"invalid payload threshold: {large_payload_threshold}")
+        if max_pending_size < flush_threshold:
+            raise ValueError(f"invalid max pending size: {max_pending_size}")
+        if ping_interval is not None and ping_interval <= 0:
+            raise ValueError(f"invalid ping interval: {ping_interval}")
+        if max_outstanding_pings <= 0:
+            raise ValueError(f"invalid max outstanding pings: {max_outstanding_pings}")
+        # Messages, PINGs and PONGs are dispatched by the parser as soon as
+        # they are parsed, other operations are returned as events.
+        self._handlers: dict[int, MsgHandler] = {}
+        self.parser = make_parser(
+            parser_backend,
+            zero_copy=zero_copy,
+            handlers=self._handlers,
+            max_bytes=max_bytes_per_read,
+            on_ping=self._on_ping,
+            on_pong=self._on_pong,
+        )
+        self.name = name
+        self.server_info: InfoEvent | None = None
+        self._transport: asyncio.Transport | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._info_received: asyncio.Future[InfoEvent] | None = None
+        self._closed: asyncio.Future[None] | None = None
+        # Loop time at which each PING waiting for its PONG was sent, with
+        # the future resolved by the PONG when a caller waits for it
+        self._pings: deque[tuple[float, asyncio.Future[None] | None]] = deque()
+        self._ping_interval = ping_interval
+        self._max_outstanding_pings = max_outstanding_pings
+        self._keepalive_handle: asyncio.TimerHandle | None = None
+        self.rtt_histogram = RttHistogram()
+        self._error: BaseException | None = None
+        self._on_error = on_error
+        self.last_error: ServerError | None = None
+        self._next_sid = 1
+        # Only checked once the server advertised a limit
+        self._max_payload: int | None = None
+        # Operations encoded but not written to the transport yet
+        self._pending = bytearray()
+        self._flush_threshold = flush_threshold
+        self._max_pending_size = max_pending_size
+        self._large_payload_threshold = large_payload_threshold
+        # True while the transport buffer is above max_pending_size
+        self._write_paused = False
+        self._drain_waiters: list[asyncio.Future[None]] = []
+
+    def __repr__(self) -> str:
+        return f"<nats connection parser={type(self.parser).__name__}>"
+
+    @property
+    def is_closed(self) -> bool:
+        """True once the connection was closed or lost."""
+        return self._closed is None or self._closed.done()
+
+    @property
+    def pending_size(self) -> int:
+        """Number of bytes encoded but not written to the transport yet."""
+        return len(self._pending)
+
+    async def connect(
+        self, host: str = "127.0.0.1", port: int = 4222, timeout: float = 2.0
+    ) -> None:
+        """Open the connection and run the INFO/CONNECT handshake.
+
+        The handshake completes once the server replied with a PONG to the
+        PING sent after CONNECT, so that errors about the connect options are
+        raised by this method.
+        """
+        loop = asyncio.get_running_loop()
+        self._loop = loop
+        self._info_received = loop.create_future()
+        self._closed = loop.create_future()
+        transport, _ = await asyncio.wait_for(
+            loop.create_connection(lambda: self, host, port),
+            timeout,
+        )
+        try:
+            info = await asyncio.wait_for(self._info_received, timeout)
+            self.server_info = info
+            if info.max_payload is not None:
+                self._max_payload = info.max_payload
+                self.parser.set_limits(max_payload=info.max_payload)
+            options: dict[str, Any] = {
+                "verbose": False,
+                "pedantic": False,
+                "lang": "python",
+                "version": "0.1.0",
+                "protocol": 1,
+                "headers": bool(info.headers),
+            }
+            if self.name is not None:
+                options["name"] = self.name
+            encode_connect(self._write_buffer(), options)
+            await asyncio.wait_for(self._ping(), timeout)
+        except BaseException:
+            transport.close()
+            raise
+        if self._ping_interval is not None:
+            self._keepalive_handle = loop.call_later(
+                self._ping_interval, self._keepalive
+            )
+
+    async def close(self) -> None:
+        """Close the connection and wait until it is closed."""
+        if self._closed is None:
+            return
+        if self._transport is not None:
+            self._flush_pending()
+            self._transport.close()
+        await asyncio.shield(self._closed)
+
+    async def flush(self, timeout: float | None = None) -> None:
+        """Wait until the server processed the operations sent so far."""
+        await asyncio.wait_for(self._ping(), timeout)
+
+    async def drain(self) -> None:
+        """Write the pending operations and wait until publishing is possible.
+
+        Producers publishing in a loop should await this method, publishing
+        raises `WriteBufferFullError` while the write buffer is full.
+        """
+        if self.is_closed:
+            raise ConnectionClosedError()
+        self._flush_pending()
+        if self._write_paused:
+            assert self._loop is not None
+            waiter = self._loop.create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+
+    def publish(
+        self,
+        subject: str,
+        payload: bytes = b"",
+        reply_to: str = "",
+        header: bytes = b"",
+    ) -> None:
+        """Publish a message on a subject.
+
+        The header must be encoded already, starting with the `NATS/1.0`
+        version line and ending with an empty line.
+        """
+        size = len(payload) + len(header)
+        if self._max_payload is not None and size > self._max_payload:
+            raise ValueError(f"nats: maximum payload exceeded: {size}")
+        if self._write_paused:
+            raise WriteBufferFullError()
+        pending = self._write_buffer()
+        if len(payload) < self._large_payload_threshold:
+            if header:
+                encode_hpub(pending, subject, header, payload, reply_to)
+            else:
+                encode_pub(pending, subject, payload, reply_to)
+            if len(pending) >= self._flush_threshold:
+                self._flush_pending()
+            return
+        if header:
+            encode_hpub_control_line(
+                pending, subject, len(header), len(payload), reply_to
+            )
+            pending += header
+        else:
+            encode_pub_control_line(pending, subject, len(payload), reply_to)
+        self._write_payload(payload)
+
+    def subscribe(self, subject: str, handler: MsgHandler, queue: str = "") -> int:
+        """Subscribe to a subject and return the subscription id.
+
+        The handler is called with `(subject, reply_to, payload, header)`
+        for each message received. In zero-copy mode, payload and header
+        are views into the parser buffer which must be copied to be used
+        once the handler returned.
+        """
+        sid = self._next_sid
+        self._next_sid += 1
+        encode_sub(self._write_buffer(), subject, sid, queue)
+        self._handlers[sid] = handler
+        return sid
+
+    def unsubscribe(self, sid: int) -> None:
+        """Remove a subscription. Messages already received are dropped."""
+        if self._handlers.pop(sid, None) is not None:
+            encode_unsub(self._write_buffer(), sid)
+
+    def _write_buffer(self) -> bytearray:
+        """Return the pending-write buffer to encode an operation into."""
+        if self._transport is None or self.is_closed:
+            raise ConnectionClosedError()
+        if not self._pending:
+            # Write the operations once the current callback returned
+            assert self._loop is not None
+            self._loop.call_soon(self._flush_pending)
+        return self._pending
+
+    def _flush_pending(self) -> None:
+        """Write the pending operations to the transport."""
+        if self._pending and self._transport is not None and not self.is_closed:
+            # The transport may keep a reference to the data written, so the
+            # buffer is replaced instead of being cleared
+            data, self._pending = self._pending, bytearray()
+            self._transport.write(data)
+
+    def _write_payload(self, payload: bytes) -> None:
+        """Write the pending operations followed by a payload and CRLF.
+
+        The payload is written to the transport without being copied.
+        """
+        assert self._transport is not None
+        data, self._pending = self._pending, bytearray()
+        if WRITELINES_SENDMSG:
+            # Buffers are sent together with a single sendmsg() call
+            self._transport.writelines((data, payload, CRLF))
+        else:
+            # Each write sends as much as the socket accepts, and only the
+            # bytes left are copied into the transport buffer
+            self._transport.write(data)
+            self._transport.write(payload)
+            self._transport.write(CRLF)
+
+    def _ping(self) -> asyncio.Future[None]:
+        """Send a PING and return a future resolved by its PONG."""
+        assert self._loop is not None
+        pong = self._loop.create_future()
+        self._send_ping(pong)
+        return pong
+
+    def _send_ping(self, pong: asyncio.Future[None] | None) -> None:
+        """Send a PING along with the pending operations."""
+        assert self._loop is not None
+        encode_ping(self._write_buffer())
+        self._flush_pending()
+        self._pings.append((self._loop.time(), pong))
+
+    def _keepalive(self) -> None:
+        """Send a PING, unless too many PINGs are waiting for their PONG."""
+        if self.is_closed or self._ping_interval is None:
+            return
+        if len(self._pings) >= self._max_outstanding_pings:
+            self._abort(StaleConnectionError())
+            return
+        self._send_ping(None)
+        assert self._loop is not None
+        self._keepalive_handle = self._loop.call_later(
+            self._ping_interval, self._keepalive
+        )
+
+    def _on_ping(self) -> None:
+        # The PONG is written from the parse loop, before the operations
+        # received after the PING are dispatched and without waiting for
+        # the pending-write buffer to be flushed.
+        if self._transport is not None and not self.is_closed:
+            self._transport.write(PONG_OP)
+
+    def _on_pong(self) -> None:
+        if not self._pings:
+            return
+        sent_at, pong = self._pings.popleft()
+        assert self._loop is not None
+        self.rtt_histogram.observe(self._loop.time() - sent_at)
+        if pong is not None and not pong.done():
+            pong.set_result(None)
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        assert isinstance(transport, asyncio.Transport)
+        self._transport = transport
+        transport.set_write_buffer_limits(high=self._max_pending_size)
+
+    def pause_writing(self) -> None:
+        self._write_paused = True
+
+    def resume_writing(self) -> None:
+        self._write_paused = False
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.parser.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        try:
+            # Messages are dispatched to handlers while parsing
+            self.parser.buffer_updated(nbytes)
+        except Exception as e:
+            self._abort(e)
+            return
+        self._process_events()
+
+    def _process_events(self) -> None:
+        """Handle the operations other than messages parsed so far."""
+        for event in self.parser.events_received():
+            kind = event.kind
+            if kind == Operation.INFO:
+                assert isinstance(event, InfoEvent)
+                if self._info_received is not None and not self._info_received.done():
+                    self._info_received.set_result(event)
+                else:
+                    # Async INFO sent when the cluster topology changes
+                    self.server_info = event
+            elif kind == Operation.ERR:
+                assert isinstance(event, ErrorEvent)
+                error = ServerError(event.message)
+                if not event.message.startswith(NON_FATAL_ERRORS):
+                    self._abort(error)
+                    return
+                self.last_error = error
+                if self._on_error is not None:
+                    self._on_error(error)
+        if self.parser.pending() and self._loop is not None:
+            # Parse the bytes left once other callbacks had a chance to run
+            self._loop.call_soon(self._resume)
+
+    def _resume(self) -> None:
+        if self.is_closed:
+            return
+        try:
+            self.parser.resume()
+        except Exception as e:
+            self._abort(e)
+            return
+        self._process_events()
+
+    def _abort(self, error: BaseException) -> None:
+        """Close the connection after an error."""
+        if self._error is None:
+            self._error = error
+        if self._transport is not None:
+            self._transport.abort()
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        error = self._error or exc or ConnectionClosedError()
+        if self._info_received is not None and not self._info_received.done():
+            self._info_received.set_exception(error)
+        if self._keepalive_handle is not None:
+            self._keepalive_handle.cancel()
+        while self._pings:
+            _, pong = self._pings.popleft()
+            if pong is not None and not pong.done():
+                pong.set_exception(error)
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+        self.parser.close()
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(None)
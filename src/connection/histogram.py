@@ -0,0 +1,96 @@
+"""Rolling histogram of round-trip times."""
+
+from __future__ import annotations
+
+from bisect import bisect_left
+from collections import deque
+from typing import Sequence
+
+# Upper bounds of the buckets in seconds, from 100us to 5s
+DEFAULT_BOUNDS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+)
+
+
+class RttHistogram:
+    """Histogram of the last round-trip times measured, in seconds.
+
+    Samples are counted in the first bucket whose upper bound is greater
+    than or equal to the sample, samples above the last bound are counted
+    in an overflow bucket bounded by infinity. Once `window` samples were
+    observed, each new sample replaces the oldest one.
+    """
+
+    __slots__ = ["window", "bounds", "_samples", "_counts"]
+
+    def __init__(
+        self, window: int = 128, bounds: Sequence[float] = DEFAULT_BOUNDS
+    ) -> None:
+        if window <= 0:
+            raise ValueError(f"invalid histogram window: {window}")
+        if not bounds or any(a >= b for a, b in zip(bounds, bounds[1:])):
+            raise ValueError(f"invalid histogram bounds: {bounds}")
+        self.window = window
+        self.bounds = (*bounds, float("inf"))
+        self._samples: deque[float] = deque()
+        self._counts = [0] * len(self.bounds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def __repr__(self) -> str:
+        last = self.last
+        return (
+            f"RttHistogram(window={self.window}, size={len(self._samples)}, "
+            f"last={'-' if last is None else f'{last * 1e3:.3f}ms'})"
+        )
+
+    @property
+    def last(self) -> float | None:
+        """Last round-trip time observed, None before the first one."""
+        return self._samples[-1] if self._samples else None
+
+    def observe(self, rtt: float) -> None:
+        """Add a round-trip time, evicting the oldest one when the window is full."""
+        samples = self._samples
+        if len(samples) == self.window:
+            self._counts[bisect_left(self.bounds, samples.popleft())] -= 1
+        samples.append(rtt)
+        self._counts[bisect_left(self.bounds, rtt)] += 1
+
+    def buckets(self) -> list[tuple[float, int]]:
+        """Return the `(upper_bound, count)` pairs of all buckets."""
+        return list(zip(self.bounds, self._counts))
+
+    def mean(self) -> float:
+        """Return the mean of the samples, 0 before the first sample."""
+        samples = self._samples
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def percentile(self, q: float) -> float:
+        """Return the sample at the q-th percentile, 0 before the first sample."""
+        if not 0 <= q <= 100:
+            raise ValueError(f"invalid percentile: {q}")
+        if not self._samples:
+            return 0.0
+        samples = sorted(self._samples)
+        return samples[min(len(samples) - 1, int(len(samples) * q / 100))]
+
+    def clear(self) -> None:
+        """Remove all samples."""
+        self._samples.clear()
+        self._counts = [0] * len(self.bounds)
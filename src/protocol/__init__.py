@@ -1,4 +1,52 @@
-from .common import Parser
+from .common import (
+    ControlLineCache,
+    EventBatch,
+    EventPool,
+    JsonLoads,
+    LimitExceededError,
+    MsgCallback,
+    MsgHandler,
+    Parser,
+    PayloadChunkCallback,
+    PayloadSpool,
+    PingPongCallback,
+    SubjectCache,
+)
+from .encoder import (
+    encode_connect,
+    encode_hpub,
+    encode_hpub_control_line,
+    encode_ping,
+    encode_pong,
+    encode_pub,
+    encode_pub_control_line,
+    encode_sub,
+    encode_unsub,
+)
 from .factory import Backend, make_parser
 
-__all__ = ["Parser", "Backend", "make_parser"]
+__all__ = [
+    "Parser",
+    "Backend",
+    "ControlLineCache",
+    "EventBatch",
+    "EventPool",
+    "JsonLoads",
+    "LimitExceededError",
+    "MsgCallback",
+    "MsgHandler",
+    "PayloadChunkCallback",
+    "PayloadSpool",
+    "PingPongCallback",
+    "SubjectCache",
+    "encode_connect",
+    "encode_hpub",
+    "encode_hpub_control_line",
+    "encode_ping",
+    "encode_pong",
+    "encode_pub",
+    "encode_pub_control_line",
+    "encode_sub",
+    "encode_unsub",
+    "make_parser",
+]
@@ -3,8 +3,13 @@
 from __future__ import annotations
 
 import json
+import mmap
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
 from enum import IntEnum, auto
-from typing import Protocol
+from typing import IO, Any, Callable, Iterable, Iterator, Protocol, Union
 
 
 class ProtocolError(Exception):
@@ -14,6 +19,16 @@ class ProtocolError(Exception):
         super().__init__("nats: protocol error")
 
 
+class LimitExceededError(ProtocolError):
+    """Protocol limit exceeded error."""
+
+    def __init__(self, limit: str, size: int, max_size: int) -> None:
+        Exception.__init__(self, f"nats: {limit} exceeded: {size} > {max_size}")
+        self.limit = limit
+        self.size = size
+        self.max_size = max_size
+
+
 class ParserClosedError(Exception):
     """Parser closed error."""
 
@@ -49,6 +64,12 @@ class Event:
     def __repr__(self) -> str:
         return f"Event(Operation.{self.kind.name})"
 
+    def release(self) -> None:
+        """Release the buffers held by the event.
+
+        This is a no-op for events which do not carry any payload.
+        """
+
 
 class Parser(Protocol):
     def close(self) -> None:
@@ -59,10 +80,73 @@ class Parser(Protocol):
         """Parse the data."""
         raise NotImplementedError
 
+    def parse_many(self, chunks: Iterable[bytes | bytearray | memoryview]) -> None:
+        """Parse several chunks received at once.
+
+        Chunks may be the buffers filled by `socket.recvmsg_into()`, or reads
+        queued while the reader was busy. This is equivalent to calling
+        `parse()` for each chunk, but chunks are appended to the buffer first
+        and parsed in a single pass.
+        """
+        raise NotImplementedError
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Return a writable buffer to receive bytes into.
+
+        This can be used as `asyncio.BufferedProtocol.get_buffer()` or with
+        `socket.recv_into()` so that received bytes are written directly into
+        the parser buffer. `buffer_updated()` must be called once bytes were
+        written.
+        """
+        raise NotImplementedError
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """Parse the bytes written into the buffer returned by `get_buffer()`."""
+        raise NotImplementedError
+
     def events_received(self) -> list[Event]:
         """Return the list of events received."""
         raise NotImplementedError
 
+    def parse_iter(self, data: bytes | bytearray) -> Iterator[Event]:
+        """Parse the data and yield events lazily as they are parsed.
+
+        Events not collected using `events_received()` yet are yielded first.
+        """
+        raise NotImplementedError
+
+    def batch_received(self) -> EventBatch:
+        """Pop and return the messages received in batch mode.
+
+        Other operations are still returned by `events_received()`.
+        """
+        raise NotImplementedError
+
+    def pending(self) -> bool:
+        """Return True when the previous call stopped at the budget.
+
+        Bytes received are then left to parse by `resume()` or the next call.
+        """
+        raise NotImplementedError
+
+    def resume(self) -> None:
+        """Continue parsing the bytes left by the previous call without new data.
+
+        The budget applies to each call to `resume()` as well.
+        """
+        raise NotImplementedError
+
+    def set_limits(
+        self, max_control_line: int | None = None, max_payload: int | None = None
+    ) -> None:
+        """Update the protocol limits. Limits set to None are left unchanged.
+
+        The maximum payload size is usually updated from `InfoEvent.max_payload`
+        once the server INFO was received. `LimitExceededError` is raised when
+        a limit is exceeded.
+        """
+        raise NotImplementedError
+
 
 class OkEvent(Event):
     """NATS Protocol OK event."""
@@ -114,14 +198,31 @@ class MsgEvent(Event):
         sid: int,
         subject: str,
         reply_to: str,
-        payload: bytearray,
+        payload: bytearray | memoryview,
     ) -> None:
-        super().__init__(Operation.MSG)
+        self.kind = Operation.MSG
         self.sid = sid
         self.subject = subject
         self.reply_to = reply_to
         self.payload = payload
-        self.header = bytearray()
+        self.header: bytearray | memoryview = bytearray()
+
+    def copy(self) -> MsgEvent:
+        """Return a copy of the event which owns its payload.
+
+        In zero-copy mode, the payload is a read-only view into the
+        parser buffer. Use this method to keep the message around
+        after the view is released.
+        """
+        return MsgEvent(self.sid, self.subject, self.reply_to, bytearray(self.payload))
+
+    def release(self) -> None:
+        """Release the payload view of an event parsed in zero-copy mode.
+
+        The payload must not be accessed after the event is released.
+        """
+        if isinstance(self.payload, memoryview):
+            self.payload.release()
 
 
 class HMsgEvent(Event):
@@ -134,8 +235,8 @@ class HMsgEvent(Event):
         sid: int,
         subject: str,
         reply_to: str,
-        payload: bytearray,
-        header: bytearray,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
     ) -> None:
         self.kind = Operation.HMSG
         self.sid = sid
@@ -144,6 +245,419 @@ class HMsgEvent(Event):
         self.payload = payload
         self.header = header
 
+    def copy(self) -> HMsgEvent:
+        """Return a copy of the event which owns its header and payload.
+
+        In zero-copy mode, the header and the payload are read-only
+        views into the parser buffer. Use this method to keep the
+        message around after the views are released.
+        """
+        return HMsgEvent(
+            self.sid,
+            self.subject,
+            self.reply_to,
+            bytearray(self.payload),
+            bytearray(self.header),
+        )
+
+    def release(self) -> None:
+        """Release the header and payload views of an event parsed in zero-copy mode.
+
+        The header and the payload must not be accessed after the event is released.
+        """
+        if isinstance(self.payload, memoryview):
+            self.payload.release()
+        if isinstance(self.header, memoryview):
+            self.header.release()
+
+
+def parse_msg_args(args: bytes) -> tuple[int, str, str]:
+    """Parse the sid, subject and reply subject of a MSG or HMSG control line.
+
+    Args:
+        args: The control line arguments preceding the sizes.
+    """
+    tokens = args.split()
+    if len(tokens) == 3:
+        subject, raw_sid, reply_to = tokens
+    elif len(tokens) == 2:
+        subject, raw_sid = tokens
+        reply_to = b""
+    else:
+        raise ProtocolError()
+    try:
+        sid = int(raw_sid)
+    except ValueError as e:
+        raise ProtocolError() from e
+    return sid, subject.decode(), reply_to.decode()
+
+
+class LazyMsgEvent(MsgEvent):
+    """NATS Protocol message event decoded on first access.
+
+    The control line arguments are kept as raw bytes, and `sid`,
+    `subject` and `reply_to` are only decoded when one of them is
+    read. A `ProtocolError` is raised at that time if the arguments
+    are not valid.
+    """
+
+    __slots__ = ["_args", "_sid", "_subject", "_reply_to"]
+
+    def __init__(self, args: bytes, payload: bytearray | memoryview) -> None:
+        self.kind = Operation.MSG
+        self.payload = payload
+        self.header = bytearray()
+        self._args: bytes | None = args
+        self._sid = 0
+        self._subject = self._reply_to = ""
+
+    def _decode(self) -> None:
+        assert self._args is not None
+        self._sid, self._subject, self._reply_to = parse_msg_args(self._args)
+        self._args = None
+
+    @property
+    def sid(self) -> int:
+        if self._args is not None:
+            self._decode()
+        return self._sid
+
+    @sid.setter
+    def sid(self, value: int) -> None:
+        if self._args is not None:
+            self._decode()
+        self._sid = value
+
+    @property
+    def subject(self) -> str:
+        if self._args is not None:
+            self._decode()
+        return self._subject
+
+    @subject.setter
+    def subject(self, value: str) -> None:
+        if self._args is not None:
+            self._decode()
+        self._subject = value
+
+    @property
+    def reply_to(self) -> str:
+        if self._args is not None:
+            self._decode()
+        return self._reply_to
+
+    @reply_to.setter
+    def reply_to(self, value: str) -> None:
+        if self._args is not None:
+            self._decode()
+        self._reply_to = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MsgEvent):
+            return False
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in MsgEvent.__slots__
+        )
+
+
+class LazyHMsgEvent(HMsgEvent):
+    """NATS Protocol message with headers event decoded on first access.
+
+    The control line arguments are kept as raw bytes, and `sid`,
+    `subject` and `reply_to` are only decoded when one of them is
+    read. A `ProtocolError` is raised at that time if the arguments
+    are not valid.
+    """
+
+    __slots__ = ["_args", "_sid", "_subject", "_reply_to"]
+
+    def __init__(
+        self,
+        args: bytes,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
+    ) -> None:
+        self.kind = Operation.HMSG
+        self.payload = payload
+        self.header = header
+        self._args: bytes | None = args
+        self._sid = 0
+        self._subject = self._reply_to = ""
+
+    def _decode(self) -> None:
+        assert self._args is not None
+        self._sid, self._subject, self._reply_to = parse_msg_args(self._args)
+        self._args = None
+
+    @property
+    def sid(self) -> int:
+        if self._args is not None:
+            self._decode()
+        return self._sid
+
+    @sid.setter
+    def sid(self, value: int) -> None:
+        if self._args is not None:
+            self._decode()
+        self._sid = value
+
+    @property
+    def subject(self) -> str:
+        if self._args is not None:
+            self._decode()
+        return self._subject
+
+    @subject.setter
+    def subject(self, value: str) -> None:
+        if self._args is not None:
+            self._decode()
+        self._subject = value
+
+    @property
+    def reply_to(self) -> str:
+        if self._args is not None:
+            self._decode()
+        return self._reply_to
+
+    @reply_to.setter
+    def reply_to(self, value: str) -> None:
+        if self._args is not None:
+            self._decode()
+        self._reply_to = value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, HMsgEvent):
+            return False
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in HMsgEvent.__slots__
+        )
+
+
+# Kinds of the messages appended to batches, enum members are slow to
+# look up for each message.
+_MSG_KIND = Operation.MSG
+_HMSG_KIND = Operation.HMSG
+
+
+class EventBatch:
+    """NATS Protocol messages stored as columns.
+
+    Row `i` of each column describes the i-th message parsed. Payloads
+    and headers are copied into a single `data` buffer, and subjects are
+    stored as indexes into the `subjects` table. Reply subject index is
+    -1 when there is no reply subject, and header offset and size are 0
+    for MSG operations.
+
+    Messages appended with `append_range()` are copied along with the
+    bytes received between them, so `data` may hold control lines
+    between payloads: use the offset and size columns to read them.
+    """
+
+    __slots__ = [
+        "kind",
+        "sid",
+        "subject",
+        "reply_to",
+        "payload_offset",
+        "payload_size",
+        "header_offset",
+        "header_size",
+        "subjects",
+        "data",
+        "_subject_index",
+        "_args_index",
+        "_source",
+        "_source_start",
+        "_source_end",
+        "_source_delta",
+        "_rows",
+    ]
+
+    def __init__(self) -> None:
+        self.kind = array("b")
+        self.sid = array("q")
+        self.subject = array("q")
+        self.reply_to = array("q")
+        self.payload_offset = array("q")
+        self.payload_size = array("q")
+        self.header_offset = array("q")
+        self.header_size = array("q")
+        self.subjects: list[str] = []
+        self.data = bytearray()
+        # Subjects are decoded the first time their raw bytes are seen
+        self._subject_index: dict[bytes, int] = {}
+        # Sid, subject and reply subject indexes of the raw control line
+        # arguments preceding the sizes
+        self._args_index: dict[bytes, tuple[int, int, int]] = {}
+        # Range of the parser buffer holding the messages appended with
+        # append_range() and not copied into data yet, the offset of its
+        # bytes in data is their offset in the buffer plus _source_delta.
+        self._source: bytearray | None = None
+        self._source_start = 0
+        self._source_end = 0
+        self._source_delta = 0
+        # Columns of these messages, one row after the other, as extending
+        # a list is cheaper than appending to each array.
+        self._rows: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self.kind)
+
+    def __repr__(self) -> str:
+        return f"EventBatch(messages={len(self.kind)}, size={len(self.data)})"
+
+    def _subject_id(self, raw_subject: bytes, subject: str | None = None) -> int:
+        """Return the index of a subject, adding it to the table when missing."""
+        subject_index = self._subject_index
+        idx = subject_index.get(raw_subject)
+        if idx is None:
+            idx = subject_index[raw_subject] = len(self.subjects)
+            self.subjects.append(raw_subject.decode() if subject is None else subject)
+        return idx
+
+    def append(
+        self,
+        sid: int,
+        subject: str,
+        reply_to: str,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview | None,
+    ) -> None:
+        """Append a message to the batch, copying its payload and header."""
+        if self._source is not None:
+            self.flush()
+        self.subject.append(self._subject_id(subject.encode(), subject))
+        self.reply_to.append(
+            self._subject_id(reply_to.encode(), reply_to) if reply_to else -1
+        )
+        self.sid.append(sid)
+        data = self.data
+        if header is None:
+            self.kind.append(Operation.MSG)
+            self.header_offset.append(0)
+            self.header_size.append(0)
+        else:
+            self.kind.append(Operation.HMSG)
+            self.header_offset.append(len(data))
+            self.header_size.append(len(header))
+            data += header
+        self.payload_offset.append(len(data))
+        self.payload_size.append(len(payload))
+        data += payload
+
+    def append_range(
+        self,
+        args: bytes,
+        buffer: bytearray,
+        start: int,
+        header_size: int,
+        total_size: int,
+    ) -> None:
+        """Append a message received at `start` in a parser buffer.
+
+        The message is only copied into `data` by `flush()`, which must be
+        called before the buffer is modified. Messages appended from the
+        same buffer are copied at once, along with the bytes between them.
+
+        Args:
+            args: The control line arguments preceding the sizes.
+            buffer: The parser buffer holding the header and payload.
+            start: The offset of the header, or of the payload for MSG
+                operations, in the buffer.
+            header_size: The header size announced by the control line,
+                0 for MSG operations.
+            total_size: The total size announced by the control line.
+        """
+        parsed = self._args_index.get(args)
+        if parsed is None:
+            parsed = self._parse_args(args)
+        if self._source is not buffer:
+            if self._source is not None:
+                self.flush()
+            self._source = buffer
+            self._source_start = start
+            self._source_delta = len(self.data) - start
+        self._source_end = start + total_size
+        offset = start + self._source_delta
+        if header_size:
+            # The empty line ending the header is not part of the header
+            self._rows += (
+                *parsed,
+                _HMSG_KIND,
+                offset,
+                header_size - 4,
+                offset + header_size,
+                total_size - header_size,
+            )
+        else:
+            self._rows += (*parsed, _MSG_KIND, 0, 0, offset, total_size)
+
+    def _parse_args(self, args: bytes) -> tuple[int, int, int]:
+        tokens = args.split()
+        if len(tokens) == 3:
+            raw_subject, raw_sid, raw_reply_to = tokens
+        elif len(tokens) == 2:
+            raw_subject, raw_sid = tokens
+            raw_reply_to = b""
+        else:
+            raise ProtocolError()
+        try:
+            sid = int(raw_sid)
+        except ValueError as e:
+            raise ProtocolError() from e
+        parsed = self._args_index[args] = (
+            sid,
+            self._subject_id(raw_subject),
+            self._subject_id(raw_reply_to) if raw_reply_to else -1,
+        )
+        return parsed
+
+    def flush(self) -> None:
+        """Copy the messages appended with `append_range()` into `data`."""
+        source = self._source
+        if source is None:
+            return
+        self.data += memoryview(source)[self._source_start : self._source_end]
+        self._source = None
+        rows = self._rows
+        self.sid.fromlist(rows[0::8])
+        self.subject.fromlist(rows[1::8])
+        self.reply_to.fromlist(rows[2::8])
+        self.kind.fromlist(rows[3::8])
+        self.header_offset.fromlist(rows[4::8])
+        self.header_size.fromlist(rows[5::8])
+        self.payload_offset.fromlist(rows[6::8])
+        self.payload_size.fromlist(rows[7::8])
+        rows.clear()
+
+    def payload(self, i: int) -> memoryview:
+        """Return a view of the payload of the i-th message."""
+        offset = self.payload_offset[i]
+        return memoryview(self.data)[offset : offset + self.payload_size[i]]
+
+    def header(self, i: int) -> memoryview:
+        """Return a view of the header of the i-th message."""
+        offset = self.header_offset[i]
+        return memoryview(self.data)[offset : offset + self.header_size[i]]
+
+    def event(self, i: int) -> MsgEvent | HMsgEvent:
+        """Return the i-th message as an event which owns its payload."""
+        reply_to = self.reply_to[i]
+        args = (
+            self.sid[i],
+            self.subjects[self.subject[i]],
+            self.subjects[reply_to] if reply_to >= 0 else "",
+            bytearray(self.payload(i)),
+        )
+        if self.kind[i] == Operation.MSG:
+            return MsgEvent(*args)
+        return HMsgEvent(*args, bytearray(self.header(i)))
+
+    def events(self) -> Iterator[MsgEvent | HMsgEvent]:
+        """Iterate over the messages of the batch as events."""
+        for i in range(len(self.kind)):
+            yield self.event(i)
+
 
 class Version:
     __slots__ = ["major", "minor", "patch", "dev"]
@@ -285,11 +799,69 @@ class InfoEvent(Event):
         self.xkey = xkey
 
 
-def parse_info(data: bytearray | bytes) -> InfoEvent:
+class LazyInfoEvent(InfoEvent):
+    """NATS Protocol INFO event decoded on first access.
+
+    The decoded JSON object is kept in `raw`, and each field is only
+    read from it, and the server version parsed, when it is first
+    accessed. A `ProtocolError` is raised at that time if a required
+    field is missing or if the version is not valid.
+    """
+
+    __slots__ = ["raw"]
+
+    def __init__(self, raw: dict[str, Any]) -> None:
+        self.kind = Operation.INFO
+        self.raw = raw
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for fields which were not accessed yet
+        if name not in _INFO_FIELDS:
+            raise AttributeError(name)
+        raw = self.raw
+        try:
+            if name == "version":
+                value = parse_version(raw["version"])
+            elif name in _INFO_REQUIRED_FIELDS:
+                value = raw[name]
+            else:
+                value = raw.get(name)
+        except (KeyError, ValueError):
+            raise ProtocolError() from None
+        setattr(self, name, value)
+        return value
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, InfoEvent):
+            return False
+        return all(
+            getattr(self, slot) == getattr(other, slot) for slot in InfoEvent.__slots__
+        )
+
+
+_INFO_FIELDS = frozenset(InfoEvent.__slots__[1:])
+_INFO_REQUIRED_FIELDS = frozenset(
+    ["server_id", "server_name", "version", "go", "host", "port", "headers", "proto"]
+)
+
+
+def parse_info(
+    data: bytearray | bytes,
+    json_loads: JsonLoads | None = None,
+    lazy: bool = False,
+) -> InfoEvent:
+    raw_info: dict[str, Any]
     try:
-        raw_info = json.loads(data.decode())
+        if json_loads is None:
+            raw_info = json.loads(data.decode())
+        else:
+            raw_info = json_loads(data)
     except ValueError:
         raise ProtocolError()
+    if type(raw_info) is not dict:
+        raise ProtocolError()
+    if lazy:
+        return LazyInfoEvent(raw_info)
     return InfoEvent(
         server_id=raw_info["server_id"],
         server_name=raw_info["server_name"],
@@ -343,9 +915,287 @@ def parse_version(version: str) -> Version:
     return semver
 
 
+class SubjectCache:
+    """Bounded LRU cache of decoded subjects and reply subjects.
+
+    Subjects are decoded and interned once, then the same `str` object
+    is returned each time the same raw subject is received. A cache can
+    be shared by several parsers.
+    """
+
+    __slots__ = ["maxsize", "hits", "misses", "_subjects"]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"invalid cache size: {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._subjects: OrderedDict[bytes, str] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._subjects)
+
+    def __repr__(self) -> str:
+        return (
+            f"SubjectCache(maxsize={self.maxsize}, size={len(self._subjects)}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+    def decode(self, raw: bytes | bytearray) -> str:
+        """Return the decoded subject, evicting the least recently used one when full."""
+        # bytearray is not hashable, bytes are returned as is
+        key = bytes(raw)
+        subjects = self._subjects
+        subject = subjects.get(key)
+        if subject is not None:
+            subjects.move_to_end(key)
+            self.hits += 1
+            return subject
+        self.misses += 1
+        subject = subjects[key] = sys.intern(key.decode())
+        if len(subjects) > self.maxsize:
+            subjects.popitem(last=False)
+        return subject
+
+    def clear(self) -> None:
+        """Remove all subjects from the cache and reset counters."""
+        self._subjects.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class ControlLineCache:
+    """Bounded LRU cache of parsed MSG and HMSG control lines.
+
+    Keys are the raw control line bytes, values are the parsed
+    `(subject, sid, reply_to, header_size, total_size)` tuples, with
+    `header_size` set to 0 for MSG operations. Messages of a fixed size
+    received on the same subscription share the same control line.
+    A cache can be shared by several parsers.
+    """
+
+    __slots__ = ["maxsize", "hits", "misses", "_lines"]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"invalid cache size: {maxsize}")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lines: OrderedDict[bytes, tuple[str, int, str, int, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._lines)
+
+    def __repr__(self) -> str:
+        return (
+            f"ControlLineCache(maxsize={self.maxsize}, size={len(self._lines)}, "
+            f"hits={self.hits}, misses={self.misses})"
+        )
+
+    @property
+    def hit_ratio(self) -> float:
+        """Ratio of lookups which found a control line, 0 before the first lookup."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def get(self, key: bytes) -> tuple[str, int, str, int, int] | None:
+        """Return the parsed arguments of a control line, or None when not cached."""
+        lines = self._lines
+        args = lines.get(key)
+        if args is None:
+            self.misses += 1
+            return None
+        lines.move_to_end(key)
+        self.hits += 1
+        return args
+
+    def put(self, key: bytes, args: tuple[str, int, str, int, int]) -> None:
+        """Store the parsed arguments of a control line, evicting the oldest one."""
+        lines = self._lines
+        lines[key] = args
+        if len(lines) > self.maxsize:
+            lines.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all control lines from the cache and reset counters."""
+        self._lines.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+class PayloadSpool:
+    """Temporary file storage for the payloads of large messages.
+
+    Chunks passed to `write()` are appended to an anonymous temporary file,
+    which is mapped in memory by `release()` once the payload is complete.
+    Payloads are returned as read-only `memoryview` backed by the file, so
+    their pages are loaded on access and can be reclaimed by the system.
+    A spool holds the payload of a single message and must not be shared
+    between parsers.
+    """
+
+    __slots__ = ["directory", "spilled", "_file"]
+
+    def __init__(self, directory: str | None = None) -> None:
+        self.directory = directory
+        self.spilled = 0
+        self._file: IO[bytes] | None = None
+
+    def __repr__(self) -> str:
+        return f"PayloadSpool(directory={self.directory!r}, spilled={self.spilled})"
+
+    def write(self, sid: int, chunk: bytearray | memoryview, final: bool) -> None:
+        """Append a payload chunk to the temporary file."""
+        file = self._file
+        if file is None:
+            file = self._file = tempfile.TemporaryFile(dir=self.directory)
+        file.write(chunk)
+
+    def release(self) -> memoryview:
+        """Return the payload written so far and start a new payload."""
+        file = self._file
+        if file is None:
+            return memoryview(b"")
+        self._file = None
+        self.spilled += 1
+        with file:
+            file.flush()
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(mapped)
+
+    def close(self) -> None:
+        """Remove the temporary file of an incomplete payload."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class EventPool:
+    """Free lists of message events reused by parsers.
+
+    Parsers created with a pool take `MsgEvent` and `HMsgEvent` events
+    from the pool instead of allocating a new event for each message.
+    Events are returned to the pool using `put()` once they were
+    processed, and must not be used after that. Lazy events are not
+    pooled. A pool can be shared by several parsers.
+
+    MSG events taken from a pool share the read-only `EMPTY_HEADER` as
+    header, instead of each having an empty `bytearray`.
+    """
+
+    __slots__ = ["maxsize", "allocated", "reused", "_msgs", "_hmsgs"]
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        if maxsize <= 0:
+            raise ValueError(f"invalid pool size: {maxsize}")
+        self.maxsize = maxsize
+        self.allocated = 0
+        self.reused = 0
+        self._msgs: list[MsgEvent] = []
+        self._hmsgs: list[HMsgEvent] = []
+
+    def __len__(self) -> int:
+        return len(self._msgs) + len(self._hmsgs)
+
+    def __repr__(self) -> str:
+        return (
+            f"EventPool(maxsize={self.maxsize}, size={len(self)}, "
+            f"allocated={self.allocated}, reused={self.reused})"
+        )
+
+    def msg(
+        self, sid: int, subject: str, reply_to: str, payload: bytearray | memoryview
+    ) -> MsgEvent:
+        """Return a MSG event, reusing a free event when there is one."""
+        msgs = self._msgs
+        if not msgs:
+            self.allocated += 1
+            event = MsgEvent(sid, subject, reply_to, payload)
+            event.header = EMPTY_HEADER
+            return event
+        self.reused += 1
+        event = msgs.pop()
+        event.sid = sid
+        event.subject = subject
+        event.reply_to = reply_to
+        event.payload = payload
+        return event
+
+    def hmsg(
+        self,
+        sid: int,
+        subject: str,
+        reply_to: str,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
+    ) -> HMsgEvent:
+        """Return a HMSG event, reusing a free event when there is one."""
+        hmsgs = self._hmsgs
+        if not hmsgs:
+            self.allocated += 1
+            return HMsgEvent(sid, subject, reply_to, payload, header)
+        self.reused += 1
+        event = hmsgs.pop()
+        event.sid = sid
+        event.subject = subject
+        event.reply_to = reply_to
+        event.payload = payload
+        event.header = header
+        return event
+
+    def put(self, event: Event) -> None:
+        """Return an event to the pool once it was processed.
+
+        References to the payload and header are dropped, so that
+        buffers can be reclaimed. Events other than `MsgEvent` and
+        `HMsgEvent` are ignored, and events are dropped when the pool
+        is full. Events already returned to the pool are ignored as
+        well, so that they are not handed out twice.
+        """
+        if type(event) is MsgEvent:
+            msgs = self._msgs
+            # The payload of free events is EMPTY_HEADER
+            if event.payload is not EMPTY_HEADER and len(msgs) < self.maxsize:
+                event.payload = event.header = EMPTY_HEADER
+                msgs.append(event)
+        elif type(event) is HMsgEvent:
+            hmsgs = self._hmsgs
+            if event.payload is not EMPTY_HEADER and len(hmsgs) < self.maxsize:
+                event.payload = event.header = EMPTY_HEADER
+                hmsgs.append(event)
+
+    def clear(self) -> None:
+        """Drop all free events and reset counters."""
+        self._msgs.clear()
+        self._hmsgs.clear()
+        self.allocated = 0
+        self.reused = 0
+
+
 PING_EVENT = PingEvent()
 PONG_EVENT = PongEvent()
 OK_EVENT = OkEvent()
 
 CRLF = b"\r\n"
 CRLF_SIZE = len(CRLF)
+
+# Header passed to message callbacks for MSG operations, and header of the
+# MSG events taken from an EventPool
+EMPTY_HEADER = memoryview(b"")
+
+# Callback invoked with (subject, reply_to, payload, header) for a single sid
+MsgHandler = Callable[
+    [str, str, Union[bytearray, memoryview], Union[bytearray, memoryview]], None
+]
+# Callback invoked with (sid, subject, reply_to, payload, header)
+MsgCallback = Callable[
+    [int, str, str, Union[bytearray, memoryview], Union[bytearray, memoryview]], None
+]
+# Callback invoked with (sid, chunk, final) for the payloads of large messages
+PayloadChunkCallback = Callable[[int, Union[bytearray, memoryview], bool], None]
+# Callback invoked for PING or PONG operations instead of producing an event
+PingPongCallback = Callable[[], None]
+# Function decoding the JSON object of INFO operations, such as `json.loads`
+JsonLoads = Callable[[Union[bytearray, bytes]], Any]
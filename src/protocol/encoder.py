@@ -0,0 +1,169 @@
+"""protocol.encoder module.
+
+Client operations are encoded into a `bytearray` supplied by the caller, so
+that several operations can be appended to the same write buffer. The
+encoded prefixes of control lines (operation name, subject and reply
+subject) are cached, and sizes are formatted directly as bytes.
+"""
+
+from __future__ import annotations
+
+import json
+from typing import Any, Tuple, Union
+
+PING_OP = b"PING\r\n"
+PONG_OP = b"PONG\r\n"
+CRLF = b"\r\n"
+
+Payload = Union[bytes, bytearray, memoryview]
+
+# Maximum number of prefixes kept by each cache, caches are cleared when full
+PREFIX_CACHE_SIZE = 4096
+# Sizes below this value are formatted once when the module is imported
+SIZE_TABLE_SIZE = 4096
+
+# Size and sid fields ending control lines, indexed by value
+_sizes = [b"%d\r\n" % size for size in range(SIZE_TABLE_SIZE)]
+
+# Control line prefixes are keyed by subject, or by (subject, reply_to) and
+# (subject, queue) tuples when the second token is not empty
+_PrefixKey = Union[str, Tuple[str, str]]
+_pub_prefixes: dict[_PrefixKey, bytes] = {}
+_hpub_prefixes: dict[_PrefixKey, bytes] = {}
+_sub_prefixes: dict[_PrefixKey, bytes] = {}
+
+
+def _token(value: str, name: str) -> bytes:
+    """Encode a subject, reply subject or queue group."""
+    token = value.encode()
+    if token.split() != [token]:
+        raise ValueError(f"nats: invalid {name}: {value!r}")
+    return token
+
+
+def _prefix(
+    cache: dict[_PrefixKey, bytes],
+    op: bytes,
+    subject: str,
+    second: str,
+    second_name: str,
+) -> bytes:
+    """Encode a control line prefix and store it in the cache."""
+    prefix = op + _token(subject, "subject") + b" "
+    if second:
+        prefix += _token(second, second_name) + b" "
+    if len(cache) >= PREFIX_CACHE_SIZE:
+        cache.clear()
+    cache[(subject, second) if second else subject] = prefix
+    return prefix
+
+
+def encode_pub(
+    buf: bytearray, subject: str, payload: Payload = b"", reply_to: str = ""
+) -> None:
+    """Append a PUB operation to the buffer."""
+    prefix = _pub_prefixes.get((subject, reply_to) if reply_to else subject)
+    if prefix is None:
+        prefix = _prefix(_pub_prefixes, b"PUB ", subject, reply_to, "reply subject")
+    size = len(payload)
+    buf += prefix
+    buf += _sizes[size] if 0 <= size < SIZE_TABLE_SIZE else b"%d\r\n" % size
+    buf += payload
+    buf += CRLF
+
+
+def encode_hpub(
+    buf: bytearray,
+    subject: str,
+    header: Payload,
+    payload: Payload = b"",
+    reply_to: str = "",
+) -> None:
+    """Append an HPUB operation to the buffer.
+
+    The header must be encoded already, starting with the `NATS/1.0`
+    version line and ending with an empty line.
+    """
+    prefix = _hpub_prefixes.get((subject, reply_to) if reply_to else subject)
+    if prefix is None:
+        prefix = _prefix(_hpub_prefixes, b"HPUB ", subject, reply_to, "reply subject")
+    header_size = len(header)
+    buf += prefix
+    buf += b"%d %d\r\n" % (header_size, header_size + len(payload))
+    buf += header
+    buf += payload
+    buf += CRLF
+
+
+def encode_pub_control_line(
+    buf: bytearray, subject: str, payload_size: int, reply_to: str = ""
+) -> None:
+    """Append the control line of a PUB operation to the buffer.
+
+    The payload followed by CRLF must be sent right after the control line.
+    This allows sending large payloads without copying them into the buffer.
+    """
+    prefix = _pub_prefixes.get((subject, reply_to) if reply_to else subject)
+    if prefix is None:
+        prefix = _prefix(_pub_prefixes, b"PUB ", subject, reply_to, "reply subject")
+    buf += prefix
+    buf += b"%d\r\n" % payload_size
+
+
+def encode_hpub_control_line(
+    buf: bytearray,
+    subject: str,
+    header_size: int,
+    payload_size: int,
+    reply_to: str = "",
+) -> None:
+    """Append the control line of an HPUB operation to the buffer.
+
+    The header, the payload and CRLF must be sent right after the control
+    line, see `encode_pub_control_line()`.
+    """
+    prefix = _hpub_prefixes.get((subject, reply_to) if reply_to else subject)
+    if prefix is None:
+        prefix = _prefix(_hpub_prefixes, b"HPUB ", subject, reply_to, "reply subject")
+    buf += prefix
+    buf += b"%d %d\r\n" % (header_size, header_size + payload_size)
+
+
+def encode_sub(buf: bytearray, subject: str, sid: int, queue: str = "") -> None:
+    """Append a SUB operation to the buffer."""
+    if sid < 0:
+        raise ValueError(f"nats: invalid sid: {sid!r}")
+    prefix = _sub_prefixes.get((subject, queue) if queue else subject)
+    if prefix is None:
+        prefix = _prefix(_sub_prefixes, b"SUB ", subject, queue, "queue group")
+    buf += prefix
+    buf += _sizes[sid] if sid < SIZE_TABLE_SIZE else b"%d\r\n" % sid
+
+
+def encode_unsub(buf: bytearray, sid: int, max_msgs: int | None = None) -> None:
+    """Append an UNSUB operation to the buffer.
+
+    When `max_msgs` is set, the server removes the subscription once this
+    number of messages was delivered.
+    """
+    if max_msgs is None:
+        buf += b"UNSUB %d\r\n" % sid
+    else:
+        buf += b"UNSUB %d %d\r\n" % (sid, max_msgs)
+
+
+def encode_connect(buf: bytearray, options: dict[str, Any]) -> None:
+    """Append a CONNECT operation to the buffer."""
+    buf += b"CONNECT "
+    buf += json.dumps(options, separators=(",", ":")).encode()
+    buf += CRLF
+
+
+def encode_ping(buf: bytearray) -> None:
+    """Append a PING operation to the buffer."""
+    buf += PING_OP
+
+
+def encode_pong(buf: bytearray) -> None:
+    """Append a PONG operation to the buffer."""
+    buf += PONG_OP
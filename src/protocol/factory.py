@@ -2,40 +2,213 @@ from __future__ import annotations
 
 import sys
 from enum import Enum
-from typing import Literal
+from typing import Literal, Mapping, Protocol
 
-from .common import Parser
+from .common import (
+    ControlLineCache,
+    EventPool,
+    JsonLoads,
+    MsgCallback,
+    MsgHandler,
+    Parser,
+    PayloadChunkCallback,
+    PayloadSpool,
+    PingPongCallback,
+    SubjectCache,
+)
 from .parser_300 import Parser300
 from .parser_re import ParserRE
+from .parser_sm import ParserSM
 
 
-def __default_parser() -> type[Parser]:
+class ParserType(Protocol):
+    """Signature shared by the constructors of all parser backends."""
+
+    def __call__(
+        self,
+        zero_copy: bool = False,
+        on_msg: MsgCallback | None = None,
+        handlers: Mapping[int, MsgHandler] | None = None,
+        subject_cache: SubjectCache | None = None,
+        lazy: bool = False,
+        batch: bool = False,
+        control_line_cache: ControlLineCache | None = None,
+        max_control_line: int | None = None,
+        max_payload: int | None = None,
+        large_payload_threshold: int | None = None,
+        on_payload_chunk: PayloadChunkCallback | None = None,
+        payload_spool: PayloadSpool | None = None,
+        event_pool: EventPool | None = None,
+        json_loads: JsonLoads | None = None,
+        max_events: int | None = None,
+        max_bytes: int | None = None,
+        on_ping: PingPongCallback | None = None,
+        on_pong: PingPongCallback | None = None,
+    ) -> Parser: ...
+
+
+def __default_parser() -> ParserType:
     return Parser300
 
 
 if sys.version_info[1] >= 10:
     from .parser_310 import Parser310
 
-    def __parser_310() -> type[Parser]:
+    def __parser_310() -> ParserType:
         return Parser310
 
 
 else:
 
-    def __parser_310() -> type[Parser]:
+    def __parser_310() -> ParserType:
         raise RuntimeError("python 3.10 or later is required")
 
 
+try:
+    from .parser_numpy import ParserNumpy
+
+    def __parser_numpy() -> ParserType:
+        return ParserNumpy
+
+except ImportError:
+
+    def __parser_numpy() -> ParserType:
+        raise RuntimeError("numpy is required")
+
+
 class Backend(str, Enum):
     PARSER_300 = "300"
     PARSER_310 = "310"
     PARSER_RE = "re"
+    PARSER_NUMPY = "numpy"
+    PARSER_SM = "sm"
 
 
 def make_parser(
-    backend: Backend | Literal["300", "310", "re"] | None = None,
+    backend: Backend | Literal["300", "310", "re", "numpy", "sm"] | None = None,
+    zero_copy: bool = False,
+    on_msg: MsgCallback | None = None,
+    handlers: Mapping[int, MsgHandler] | None = None,
+    subject_cache: SubjectCache | None = None,
+    lazy: bool = False,
+    batch: bool = False,
+    control_line_cache: ControlLineCache | None = None,
+    max_control_line: int | None = None,
+    max_payload: int | None = None,
+    large_payload_threshold: int | None = None,
+    on_payload_chunk: PayloadChunkCallback | None = None,
+    payload_spool: PayloadSpool | None = None,
+    event_pool: EventPool | None = None,
+    json_loads: JsonLoads | None = None,
+    max_events: int | None = None,
+    max_bytes: int | None = None,
+    on_ping: PingPongCallback | None = None,
+    on_pong: PingPongCallback | None = None,
 ) -> Parser:
-    parser_type: type[Parser]
+    """Create a new parser.
+
+    Args:
+        backend: The parser implementation to use. Defaults to `Backend.PARSER_300`.
+            `Backend.PARSER_NUMPY` requires numpy, and is slower than the parsers
+            written in pure Python.
+            `Backend.PARSER_SM` does not resume a generator on each call.
+        zero_copy: Use read-only `memoryview` into the parser buffer for message
+            payloads and headers instead of `bytearray` copies. The buffer is kept
+            alive until views are released using `Event.release()`.
+        on_msg: Callback invoked with `(sid, subject, reply_to, payload, header)` for
+            each MSG and HMSG operation instead of producing message events.
+        handlers: Callbacks invoked with `(subject, reply_to, payload, header)` for
+            messages received on their sid. They take precedence over `on_msg`.
+            The mapping is not copied, so subscriptions may be added or removed
+            while parsing. Messages without handler are delivered to `on_msg`,
+            or as events when `on_msg` is not set.
+        subject_cache: Cache used to decode subjects and reply subjects, so that
+            repeated subjects are decoded once and share the same `str` object.
+            Subjects are decoded without cache by default.
+        lazy: Return `LazyMsgEvent` and `LazyHMsgEvent` events, which decode sid,
+            subject and reply subject when one of them is first read. Invalid
+            arguments raise `ProtocolError` on access instead of during parsing.
+            Ignored when `on_msg` or `handlers` are set, and the subject cache
+            is not used for lazy events. INFO operations are also returned as
+            `LazyInfoEvent` events, which read their fields from the decoded
+            JSON object on first access.
+        batch: Store messages into an `EventBatch` returned by `batch_received()`
+            instead of producing one event per message. Payloads and headers are
+            copied into the batch once per read, along with the bytes received
+            between them, and subjects are decoded once per batch. Other
+            operations are still returned as events, and messages dispatched to
+            callbacks are not added to the batch.
+        control_line_cache: Cache of parsed MSG and HMSG control lines, so that
+            messages repeatedly received on the same subscription skip argument
+            parsing and decoding. Only the total size is parsed on cache hits.
+            Ignored by `Backend.PARSER_RE`, for lazy events and for batches.
+        max_control_line: Maximum size in bytes of a control line. The parser
+            raises `LimitExceededError` once more bytes are buffered without
+            finding the end of the control line. Not limited by default.
+        max_payload: Maximum size in bytes of message headers and payloads.
+            `LimitExceededError` is raised on MSG and HMSG operations announcing
+            larger messages, before their payload is buffered. Not limited by
+            default, use `Parser.set_limits()` to apply `InfoEvent.max_payload`
+            once the server INFO was received.
+        large_payload_threshold: Size in bytes above which message payloads are
+            passed to `on_payload_chunk` as they are received instead of being
+            buffered. Must be set together with `on_payload_chunk` or
+            `payload_spool`.
+        on_payload_chunk: Callback invoked with `(sid, chunk, final)` for each
+            chunk of a large payload, `final` is True for the last chunk. The
+            message is then delivered as usual with an empty payload, so that
+            subject, reply subject and header are still available.
+        payload_spool: Spool where payloads larger than `large_payload_threshold`
+            are written as they are received. Messages are delivered with a
+            read-only `memoryview` of the memory-mapped temporary file as
+            payload, so that resident memory does not grow with the payload
+            size. Cannot be used together with `on_payload_chunk`, and must
+            not be shared between parsers.
+        event_pool: Pool of `MsgEvent` and `HMsgEvent` events reused instead
+            of allocating an event for each message. Consumers return events
+            to the pool using `EventPool.put()` once they were processed.
+            Lazy events are not pooled, and pooled MSG events share the
+            read-only `EMPTY_HEADER` as header.
+        json_loads: Function used to decode the JSON object of INFO operations
+            from bytes, such as `orjson.loads` when installed. It must raise
+            `ValueError` on invalid input. Defaults to `json.loads`.
+        max_events: Maximum number of events produced by each call to `parse()`,
+            `parse_many()`, `buffer_updated()` or `resume()`. Messages dispatched
+            to callbacks or stored in the batch are only bounded by `max_bytes`.
+        max_bytes: Number of bytes after which each call stops parsing. Calls
+            may parse more bytes, up to the end of the control line or payload
+            being parsed when the budget is spent. When a call stops at the
+            budget, `Parser.pending()` returns True and the remaining bytes are
+            parsed by `Parser.resume()` or by the next call. Calls are not
+            bounded by default.
+        on_ping: Callback invoked as soon as a PING operation is parsed instead
+            of producing an event, so that the PONG reply can be sent before the
+            operations following the PING are dispatched.
+        on_pong: Callback invoked as soon as a PONG operation is parsed instead
+            of producing an event.
+
+    Header is an empty read-only `memoryview` for MSG operations. In zero-copy
+    mode, payload and header keep the parser buffer alive until callbacks
+    release them. Exceptions raised by callbacks close the parser.
+    INFO, +OK and -ERR operations are always returned as events, and PING and
+    PONG operations are returned as events when their callback is not set.
+    """
+    if on_payload_chunk is not None and payload_spool is not None:
+        raise ValueError("on_payload_chunk and payload_spool cannot be set together")
+    if (large_payload_threshold is None) != (
+        on_payload_chunk is None and payload_spool is None
+    ):
+        raise ValueError(
+            "large_payload_threshold must be set together with "
+            "on_payload_chunk or payload_spool"
+        )
+    if large_payload_threshold is not None and large_payload_threshold < 0:
+        raise ValueError(f"invalid payload threshold: {large_payload_threshold}")
+    if max_events is not None and max_events <= 0:
+        raise ValueError(f"invalid events budget: {max_events}")
+    if max_bytes is not None and max_bytes <= 0:
+        raise ValueError(f"invalid bytes budget: {max_bytes}")
+    parser_type: ParserType
     if backend is None:
         parser_type = __default_parser()
     elif backend == Backend.PARSER_300:
@@ -44,6 +217,29 @@ def make_parser(
         parser_type = __parser_310()
     elif backend == Backend.PARSER_RE:
         parser_type = ParserRE
+    elif backend == Backend.PARSER_NUMPY:
+        parser_type = __parser_numpy()
+    elif backend == Backend.PARSER_SM:
+        parser_type = ParserSM
     else:
         raise ValueError(f"unknown parser implementation: {backend}")
-    return parser_type()
+    return parser_type(
+        zero_copy=zero_copy,
+        on_msg=on_msg,
+        handlers=handlers,
+        subject_cache=subject_cache,
+        lazy=lazy,
+        batch=batch,
+        control_line_cache=control_line_cache,
+        max_control_line=max_control_line,
+        max_payload=max_payload,
+        large_payload_threshold=large_payload_threshold,
+        on_payload_chunk=on_payload_chunk,
+        payload_spool=payload_spool,
+        event_pool=event_pool,
+        json_loads=json_loads,
+        max_events=max_events,
+        max_bytes=max_bytes,
+        on_ping=on_ping,
+        on_pong=on_pong,
+    )
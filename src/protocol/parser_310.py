@@ -4,7 +4,8 @@ NATS protocol parser.
 
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, Iterator
+import sys
+from typing import TYPE_CHECKING, Iterable, Iterator, Mapping
 
 from .common import (
     CRLF,
@@ -12,13 +13,28 @@ from .common import (
     OK_EVENT,
     PING_EVENT,
     PONG_EVENT,
+    EMPTY_HEADER,
+    ControlLineCache,
     ErrorEvent,
     Event,
+    EventBatch,
+    EventPool,
     HMsgEvent,
+    JsonLoads,
+    LazyHMsgEvent,
+    LazyMsgEvent,
+    LimitExceededError,
+    MsgCallback,
     MsgEvent,
+    MsgHandler,
     ParserClosedError,
+    PayloadChunkCallback,
+    PingPongCallback,
+    PayloadSpool,
     ProtocolError,
+    SubjectCache,
     parse_info,
+    parse_msg_args,
 )
 
 STOP_OP = bytearray(CRLF)
@@ -26,23 +42,118 @@ STOP_HEADER = bytearray(b"\r\n\r\n")
 PING_OP = bytearray(b"PING\r\n")
 PONG_OP = bytearray(b"PONG\r\n")
 OK_OP = bytearray(b"+OK\r\n")
+OK_OP_LEN = len(OK_OP)
 PING_OR_PONG_OP_LEN = len(PING_OP)
 
 AWAITING_CONTROL_LINE = 0
 AWAITING_HMSG_PAYLOAD = 1
 AWAITING_MSG_PAYLOAD = 2
+STREAMING_PAYLOAD = 3
+
+# Default size of the buffer returned by get_buffer()
+RECEIVE_BUFFER_SIZE = 64 * 1024
 
 
 class Parser310:
     """NATS Protocol parser."""
 
-    __slots__ = ["_closed", "_state", "_data_received", "_events_received", "__loop__"]
+    __slots__ = [
+        "_closed",
+        "_state",
+        "_zero_copy",
+        "_handlers",
+        "_on_msg",
+        "_on_ping",
+        "_on_pong",
+        "_subject_cache",
+        "_lazy",
+        "_batch",
+        "_control_line_cache",
+        "_max_control_line",
+        "_max_payload",
+        "_max_events",
+        "_max_bytes",
+        "_pending",
+        "_large_payload_threshold",
+        "_on_payload_chunk",
+        "_payload_spool",
+        "_event_pool",
+        "_json_loads",
+        "_data_received",
+        "_pos",
+        "_end",
+        "_view",
+        "_events_received",
+        "_streaming",
+        "__loop__",
+    ]
 
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        zero_copy: bool = False,
+        on_msg: MsgCallback | None = None,
+        handlers: Mapping[int, MsgHandler] | None = None,
+        subject_cache: SubjectCache | None = None,
+        lazy: bool = False,
+        batch: bool = False,
+        control_line_cache: ControlLineCache | None = None,
+        max_control_line: int | None = None,
+        max_payload: int | None = None,
+        large_payload_threshold: int | None = None,
+        on_payload_chunk: PayloadChunkCallback | None = None,
+        payload_spool: PayloadSpool | None = None,
+        event_pool: EventPool | None = None,
+        json_loads: JsonLoads | None = None,
+        max_events: int | None = None,
+        max_bytes: int | None = None,
+        on_ping: PingPongCallback | None = None,
+        on_pong: PingPongCallback | None = None,
+    ) -> None:
         # Initialize the parser state.
         self._closed = False
+        self._zero_copy = zero_copy
+        # Messages are dispatched to callbacks instead of producing events
+        # when a handler is registered for their sid or when on_msg is set.
+        self._handlers = handlers
+        self._on_msg = on_msg
+        # Decoded subjects are looked up in the cache when there is one.
+        self._subject_cache = subject_cache
+        self._lazy = lazy
+        self._batch = EventBatch() if batch else None
+        # Spooled payloads are written to a temporary file by the sink
+        self._payload_spool = payload_spool
+        self._event_pool = event_pool
+        self._json_loads = json_loads
+        if payload_spool is not None:
+            on_payload_chunk = payload_spool.write
+        # Payloads larger than the threshold are passed to the sink as
+        # they are received instead of being buffered.
+        self._large_payload_threshold = large_payload_threshold
+        self._on_payload_chunk = on_payload_chunk
+        self._control_line_cache = control_line_cache
+        # Limits are checked against operations received from the server,
+        # and are not enforced until they are set.
+        self._max_control_line = sys.maxsize
+        self._max_payload = sys.maxsize
+        self.set_limits(max_control_line, max_payload)
+        # Each call stops once its budget is spent, and the remaining bytes
+        # are parsed by the next call or by resume().
+        self._max_events = sys.maxsize if max_events is None else max_events
+        self._max_bytes = sys.maxsize if max_bytes is None else max_bytes
+        # PING and PONG operations are passed to callbacks as soon as they
+        # are parsed instead of producing events, when callbacks are set.
+        self._on_ping = on_ping
+        self._on_pong = on_pong
+        self._pending = False
+        # Bytes between _pos and _end are waiting to be parsed, bytes after
+        # _end are spare room for the next bytes received.
         self._data_received = bytearray()
+        self._pos = 0
+        self._end = 0
+        self._view: memoryview | None = None
         self._events_received: list[Event] = []
+        # When streaming, the parser pauses after each event
+        self._streaming = False
         # Initialize the parser iterator
         self.__loop__ = self.__parse__()
 
@@ -52,6 +163,30 @@ class Parser310:
     def close(self) -> None:
         """Close the parser."""
         self._closed = True
+        if self._payload_spool is not None:
+            self._payload_spool.close()
+
+    def set_limits(
+        self, max_control_line: int | None = None, max_payload: int | None = None
+    ) -> None:
+        """Update the protocol limits. Limits set to None are left unchanged."""
+        if max_control_line is not None:
+            if max_control_line <= 0:
+                raise ValueError(f"invalid control line limit: {max_control_line}")
+            self._max_control_line = max_control_line
+        if max_payload is not None:
+            if max_payload < 0:
+                raise ValueError(f"invalid payload limit: {max_payload}")
+            self._max_payload = max_payload
+
+    def batch_received(self) -> EventBatch:
+        """Pop and return the messages received in batch mode."""
+        batch = self._batch
+        if batch is None:
+            return EventBatch()
+        batch.flush()
+        self._batch = EventBatch()
+        return batch
 
     def events_received(self) -> list[Event]:
         """Pop and return the events generated by the parser."""
@@ -60,268 +195,697 @@ class Parser310:
         return events
 
     def parse(self, data: bytes | bytearray) -> None:
-        self._data_received.extend(data)
+        self._write(data)
+        try:
+            self.__loop__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
+
+    def parse_many(self, chunks: Iterable[bytes | bytearray | memoryview]) -> None:
+        """Parse several chunks received at once.
+
+        Chunks are appended to the buffer and parsed in a single pass.
+        """
+        for data in chunks:
+            self._write(data)
+        try:
+            self.__loop__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
+
+    def parse_iter(self, data: bytes | bytearray) -> Iterator[Event]:
+        """Parse the data and yield events one by one as they are parsed.
+
+        Events are not decoded until the previous one is consumed. If the
+        iterator is not exhausted, remaining bytes are parsed on next call.
+        """
+        yield from self.events_received()
+        self._write(data)
+        while True:
+            self._streaming = True
+            try:
+                self.__loop__.__next__()
+            except StopIteration:
+                raise ParserClosedError()
+            finally:
+                self._streaming = False
+            if not self._events_received:
+                return
+            yield from self.events_received()
+
+    def pending(self) -> bool:
+        """Return True when the previous call stopped at the budget."""
+        return self._pending
+
+    def resume(self) -> None:
+        """Continue parsing the bytes left by the previous call."""
+        try:
+            self.__loop__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Return a writable view of the parser buffer to receive bytes into."""
+        if sizehint <= 0:
+            sizehint = RECEIVE_BUFFER_SIZE
+        end = self._end
+        if len(self._data_received) - end < sizehint:
+            end = self._make_room()
+            missing = sizehint - len(self._data_received) + end
+            if missing > 0:
+                self._data_received.extend(bytes(missing))
+        self._view = memoryview(self._data_received)[end:]
+        return self._view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """Parse the bytes written into the buffer returned by get_buffer()."""
+        assert self._view is not None, "get_buffer() was not called"
+        # Release the view so that the buffer can be resized again
+        self._view.release()
+        self._view = None
+        self._end += nbytes
         try:
             self.__loop__.__next__()
         except StopIteration:
             raise ParserClosedError()
 
+    def _write(self, data: bytes | bytearray | memoryview) -> None:
+        """Append data to the buffer."""
+        size = len(data)
+        end = self._end
+        if len(self._data_received) - end < size:
+            end = self._make_room()
+        self._data_received[end : end + size] = data
+        self._end = end + size
+
+    def _make_room(self) -> int:
+        """Discard parsed bytes from the buffer and return the write offset.
+
+        This is only called when the room left after the data received is
+        too small, so parsed bytes are discarded at most once per buffer fill.
+        """
+        data_received = self._data_received
+        pos = self._pos
+        end = self._end
+        if pos == 0:
+            return end
+        if self._zero_copy:
+            # Payloads may still be views into the parsed bytes, in which
+            # case the buffer cannot be modified and the unparsed bytes are
+            # moved to a new buffer, leaving the old one to the payloads.
+            try:
+                del data_received[:pos]
+            except BufferError:
+                self._data_received = data_received[pos:end]
+        elif pos < end:
+            # Move unparsed bytes to the start of the buffer
+            data_received[: end - pos] = data_received[pos:end]
+        self._pos = 0
+        self._end = end - pos
+        return self._end
+
     def __parse__(self) -> Iterator[None]:
         """Parse some bytes."""
 
         expected_header_size = 0
         expected_total_size = 0
-        partial_msg: MsgEvent | HMsgEvent | None = None
+        sid = 0
+        subject = reply_to = ""
         state = AWAITING_CONTROL_LINE
+        zero_copy = self._zero_copy
+        handlers = self._handlers
+        on_msg = self._on_msg
+        on_ping = self._on_ping
+        on_pong = self._on_pong
+        subject_cache = self._subject_cache
+        decode = subject_cache.decode if subject_cache is not None else None
+        # Callbacks and batches need decoded arguments, only events are lazy
+        lazy = (
+            self._lazy and handlers is None and on_msg is None and self._batch is None
+        )
+        # Batches without callbacks keep the raw arguments as lazy events do,
+        # and copy the bytes of their messages once per read.
+        batched = self._batch is not None and handlers is None and on_msg is None
+        lazy_args = b""
+        line_cache: ControlLineCache | None = (
+            None if lazy or batched else self._control_line_cache
+        )
+        line_key = b""
+        # Bytes of a control line split across reads which were already
+        # searched for CRLF, so that they are not searched on each read.
+        scanned = 0
+        on_payload_chunk = self._on_payload_chunk
+        payload_spool = self._payload_spool
+        # Message events are taken from the pool when there is one
+        event_pool = self._event_pool
+        new_msg = MsgEvent if event_pool is None else event_pool.msg
+        new_hmsg = HMsgEvent if event_pool is None else event_pool.hmsg
+        payload_threshold = self._large_payload_threshold
+        if on_payload_chunk is None or payload_threshold is None:
+            payload_threshold = sys.maxsize
+        payload_remaining = 0
+        streamed_header: bytearray | memoryview | None = None
+        max_events = self._max_events
+        max_bytes = self._max_bytes
+        count_events = max_events < sys.maxsize
 
         while not self._closed:
-            # If there is no data to parse, yield None.
-            if not self._data_received:
-                yield None
-                continue
-
-            # Take the first byte
-            next_byte = self._data_received[0]
-
-            match state:
-                case 0:
-                    match next_byte:
-                        # case "M": Fast path for MSG
-                        case 77:
-                            try:
-                                end = self._data_received.index(CRLF)
-                            except ValueError:
-                                yield None
-                                continue
+            data_received = self._data_received
+            # Read offset into the buffer: bytes before it were already parsed.
+            pos = self._pos
+            # Bytes after this offset were not received yet.
+            size = self._end
+            if scanned:
+                # Only search the bytes received since the previous read
+                if data_received.find(CRLF, pos + scanned, size) < 0:
+                    if size - pos > self._max_control_line:
+                        raise LimitExceededError(
+                            "max_control_line", size - pos, self._max_control_line
+                        )
+                    scanned = size - pos - 1
+                    # Nothing can be parsed until the line is complete
+                    self._pending = False
+                    yield None
+                    continue
+                scanned = 0
+            events = self._events_received
+            append_event = events.append
+            streaming = self._streaming
+            batch = self._batch
+            range_batch = batch if batched else None
+            max_control_line = self._max_control_line
+            max_payload = self._max_payload
+            # Payloads are sliced out of the buffer, or out of a read-only
+            # view of the buffer in zero-copy mode.
+            view = memoryview(data_received).toreadonly() if zero_copy else None
+            chunk = data_received if view is None else view
+            # Each call stops once its budget of events or bytes is spent
+            events_limit = len(events) + max_events
+            stop = size if max_bytes >= size - pos else pos + max_bytes
+            pausing = streaming or count_events
+            # Parse operations until the buffer is exhausted, an operation
+            # is split across reads, or the budget is spent.
+            while pos < stop:
+                # Pause after each event when streaming, or once the budget
+                # of events is spent
+                if pausing and ((streaming and events) or len(events) >= events_limit):
+                    break
+                match state:
+                    case 0:
+                        # Take the next byte
+                        match data_received[pos]:
+                            # case "M": Fast path for MSG
+                            case 77:
+                                try:
+                                    end = data_received.index(CRLF, pos, size)
+                                except ValueError:
+                                    scanned = 1
+                                    break
+                                if end - pos > max_control_line:
+                                    raise LimitExceededError(
+                                        "max_control_line", end - pos, max_control_line
+                                    )
 
-                            data = self._data_received[4:end]
-                            args = data.split(b" ")
-                            match len(args):
-                                case 4:
-                                    subject, raw_sid, reply_to, raw_total_size = args
-                                case 3:
-                                    reply_to = b""
-                                    subject, raw_sid, raw_total_size = args
-                                case _:
-                                    raise ProtocolError()
-                            try:
-                                sid = int(raw_sid)
-                                expected_total_size = int(raw_total_size)
-                            except Exception as e:
-                                raise ProtocolError() from e
-                            if (
-                                len(self._data_received[end + 2 :])
-                                >= expected_total_size + CRLF_SIZE
-                            ):
-                                self._events_received.append(
-                                    MsgEvent(
-                                        sid=sid,
-                                        subject=subject.decode(),
-                                        reply_to=reply_to.decode(),
-                                        payload=self._data_received[
-                                            end + 2 : end + 2 + expected_total_size
-                                        ],
+                                if lazy or range_batch is not None:
+                                    # Only the payload size is parsed, the other
+                                    # arguments are decoded by the event when
+                                    # they are first read, or once per batch.
+                                    sep = data_received.rfind(b" ", pos + 4, end)
+                                    if sep < 0:
+                                        raise ProtocolError()
+                                    try:
+                                        expected_total_size = int(
+                                            data_received[sep + 1 : end]
+                                        )
+                                    except Exception as e:
+                                        raise ProtocolError() from e
+                                    lazy_args = bytes(data_received[pos + 4 : sep])
+                                    pos = end + CRLF_SIZE
+                                    state = AWAITING_MSG_PAYLOAD
+                                    continue
+                                if line_cache is not None:
+                                    # Repeated control lines are not parsed again.
+                                    line_key = bytes(data_received[pos:end])
+                                    line_args = line_cache.get(line_key)
+                                    if line_args is not None:
+                                        (
+                                            subject,
+                                            sid,
+                                            reply_to,
+                                            _,
+                                            expected_total_size,
+                                        ) = line_args
+                                        pos = end + CRLF_SIZE
+                                        state = AWAITING_MSG_PAYLOAD
+                                        continue
+                                args = data_received[pos + 4 : end].split(b" ")
+                                match len(args):
+                                    case 4:
+                                        (
+                                            raw_subject,
+                                            raw_sid,
+                                            raw_reply_to,
+                                            raw_total_size,
+                                        ) = args
+                                    case 3:
+                                        raw_reply_to = b""
+                                        raw_subject, raw_sid, raw_total_size = args
+                                    case _:
+                                        raise ProtocolError()
+                                try:
+                                    sid = int(raw_sid)
+                                    expected_total_size = int(raw_total_size)
+                                except Exception as e:
+                                    raise ProtocolError() from e
+                                if decode is None:
+                                    subject = raw_subject.decode()
+                                    reply_to = raw_reply_to.decode()
+                                else:
+                                    subject = decode(raw_subject)
+                                    reply_to = (
+                                        decode(raw_reply_to) if raw_reply_to else ""
                                     )
-                                )
-                                self._data_received = self._data_received[
-                                    end + expected_total_size + 7 :
-                                ]
-                                continue
-                            else:
-                                partial_msg = MsgEvent(
-                                    sid=sid,
-                                    subject=subject.decode(),
-                                    reply_to=reply_to.decode(),
-                                    payload=bytearray(),
-                                )
+                                if line_cache is not None:
+                                    line_cache.put(
+                                        line_key,
+                                        (
+                                            subject,
+                                            sid,
+                                            reply_to,
+                                            0,
+                                            expected_total_size,
+                                        ),
+                                    )
+                                pos = end + CRLF_SIZE
                                 state = AWAITING_MSG_PAYLOAD
-                                self._data_received: bytearray = self._data_received[
-                                    end + 2 :
-                                ]
-                                yield None
-                                continue
-                        # case "H": Fast path for HMSG
-                        case 72:
-                            try:
-                                end = self._data_received.index(CRLF)
-                            except ValueError:
-                                yield None
                                 continue
-                            args = self._data_received[5:end].split(b" ")
-                            match len(args):
-                                case 5:
-                                    (
-                                        subject,
-                                        raw_sid,
-                                        reply_to,
-                                        raw_header_size,
-                                        raw_total_size,
-                                    ) = args
-                                case 4:
-                                    reply_to = b""
-                                    (
-                                        subject,
-                                        raw_sid,
-                                        raw_header_size,
-                                        raw_total_size,
-                                    ) = args
-                                case _:
-                                    raise ProtocolError()
-                            try:
-                                expected_header_size = int(raw_header_size)
-                                expected_total_size = int(raw_total_size)
-                                sid = int(raw_sid)
-                            except Exception as e:
-                                raise ProtocolError() from e
-                            if (
-                                len(self._data_received[end + 2 :])
-                                >= expected_total_size + CRLF_SIZE
-                            ):
-                                if (
-                                    self._data_received[
-                                        end + expected_header_size - 2 : end
-                                        + 2
-                                        + expected_header_size
-                                    ]
-                                    != STOP_HEADER
-                                ):
-                                    raise ProtocolError()
-                                self._events_received.append(
-                                    HMsgEvent(
-                                        sid=sid,
-                                        subject=subject.decode(),
-                                        reply_to=reply_to.decode(),
-                                        payload=self._data_received[
-                                            end + 2 + expected_header_size : end
-                                            + 2
-                                            + expected_total_size
-                                        ],
-                                        header=self._data_received[
-                                            end + 2 : end - 2 + expected_header_size
-                                        ],
+                            # case "H": Fast path for HMSG
+                            case 72:
+                                try:
+                                    end = data_received.index(CRLF, pos, size)
+                                except ValueError:
+                                    scanned = 1
+                                    break
+                                if end - pos > max_control_line:
+                                    raise LimitExceededError(
+                                        "max_control_line", end - pos, max_control_line
                                     )
-                                )
-                                self._data_received = self._data_received[
-                                    end + expected_total_size + 7 :
-                                ]
-                                continue
-                            else:
-                                partial_msg = HMsgEvent(
-                                    sid=sid,
-                                    subject=subject.decode(),
-                                    reply_to=reply_to.decode(),
-                                    payload=bytearray(),
-                                    header=bytearray(),
-                                )
+                                if lazy or range_batch is not None:
+                                    sep = data_received.rfind(b" ", pos + 5, end)
+                                    header_sep = data_received.rfind(b" ", pos + 5, sep)
+                                    if sep < 0 or header_sep < 0:
+                                        raise ProtocolError()
+                                    try:
+                                        expected_header_size = int(
+                                            data_received[header_sep + 1 : sep]
+                                        )
+                                        expected_total_size = int(
+                                            data_received[sep + 1 : end]
+                                        )
+                                    except Exception as e:
+                                        raise ProtocolError() from e
+                                    lazy_args = bytes(
+                                        data_received[pos + 5 : header_sep]
+                                    )
+                                    pos = end + CRLF_SIZE
+                                    state = AWAITING_HMSG_PAYLOAD
+                                    continue
+                                if line_cache is not None:
+                                    line_key = bytes(data_received[pos:end])
+                                    line_args = line_cache.get(line_key)
+                                    if line_args is not None:
+                                        (
+                                            subject,
+                                            sid,
+                                            reply_to,
+                                            expected_header_size,
+                                            expected_total_size,
+                                        ) = line_args
+                                        pos = end + CRLF_SIZE
+                                        state = AWAITING_HMSG_PAYLOAD
+                                        continue
+                                args = data_received[pos + 5 : end].split(b" ")
+                                match len(args):
+                                    case 5:
+                                        (
+                                            raw_subject,
+                                            raw_sid,
+                                            raw_reply_to,
+                                            raw_header_size,
+                                            raw_total_size,
+                                        ) = args
+                                    case 4:
+                                        raw_reply_to = b""
+                                        (
+                                            raw_subject,
+                                            raw_sid,
+                                            raw_header_size,
+                                            raw_total_size,
+                                        ) = args
+                                    case _:
+                                        raise ProtocolError()
+                                try:
+                                    expected_header_size = int(raw_header_size)
+                                    expected_total_size = int(raw_total_size)
+                                    sid = int(raw_sid)
+                                except Exception as e:
+                                    raise ProtocolError() from e
+                                if decode is None:
+                                    subject = raw_subject.decode()
+                                    reply_to = raw_reply_to.decode()
+                                else:
+                                    subject = decode(raw_subject)
+                                    reply_to = (
+                                        decode(raw_reply_to) if raw_reply_to else ""
+                                    )
+                                if line_cache is not None:
+                                    line_cache.put(
+                                        line_key,
+                                        (
+                                            subject,
+                                            sid,
+                                            reply_to,
+                                            expected_header_size,
+                                            expected_total_size,
+                                        ),
+                                    )
+                                pos = end + CRLF_SIZE
                                 state = AWAITING_HMSG_PAYLOAD
-                                self._data_received = self._data_received[end + 2 :]
-                                yield None
                                 continue
-                        # case "P": Fast path for PING and PONG
-                        case 80:
-                            # Fast path for PING or PONG
-                            if len(self._data_received) >= PING_OR_PONG_OP_LEN:
-                                if self._data_received[:PING_OR_PONG_OP_LEN] == PING_OP:
-                                    self._events_received.append(PING_EVENT)
-                                elif (
-                                    self._data_received[:PING_OR_PONG_OP_LEN] == PONG_OP
-                                ):
-                                    self._events_received.append(PONG_EVENT)
+                            # case "P": Fast path for PING and PONG
+                            case 80:
+                                # Fast path for PING or PONG
+                                if size - pos >= PING_OR_PONG_OP_LEN:
+                                    op = data_received[pos : pos + PING_OR_PONG_OP_LEN]
+                                    if op == PING_OP:
+                                        if on_ping is None:
+                                            append_event(PING_EVENT)
+                                        else:
+                                            on_ping()
+                                    elif op == PONG_OP:
+                                        if on_pong is None:
+                                            append_event(PONG_EVENT)
+                                        else:
+                                            on_pong()
+                                    else:
+                                        raise ProtocolError()
+                                    pos += PING_OR_PONG_OP_LEN
+                                    continue
+                                # Split buffer
                                 else:
-                                    raise ProtocolError()
-                                self._data_received = self._data_received[
-                                    PING_OR_PONG_OP_LEN:
-                                ]
-                                continue
-                            # Split buffer
-                            else:
-                                yield None
-                                continue
-                        # case "I": Fast path for INFO
-                        case 73:
-                            try:
-                                end = self._data_received.index(CRLF)
-                            except ValueError:
-                                yield None
+                                    break
+                            # case "I": Fast path for INFO
+                            case 73:
+                                try:
+                                    end = data_received.index(CRLF, pos, size)
+                                except ValueError:
+                                    scanned = 1
+                                    break
+                                if end - pos > max_control_line:
+                                    raise LimitExceededError(
+                                        "max_control_line", end - pos, max_control_line
+                                    )
+                                try:
+                                    append_event(
+                                        parse_info(
+                                            data_received[pos + 5 : end],
+                                            self._json_loads,
+                                            self._lazy,
+                                        )
+                                    )
+                                except Exception as e:
+                                    raise ProtocolError() from e
+                                pos = end + CRLF_SIZE
                                 continue
-                            try:
-                                self._events_received.append(
-                                    parse_info(self._data_received[5:end])
-                                )
-                            except Exception as e:
-                                raise ProtocolError() from e
-                            self._data_received = self._data_received[end + 3 :]
-                            continue
-                        # case "+": Fast path for +OK
-                        case 43:
-                            if len(self._data_received) >= 5:
-                                if self._data_received[:5] != OK_OP:
+                            # case "+": Fast path for +OK
+                            case 43:
+                                if size - pos >= OK_OP_LEN:
+                                    if data_received[pos : pos + OK_OP_LEN] != OK_OP:
+                                        raise ProtocolError()
+                                    append_event(OK_EVENT)
+                                    pos += OK_OP_LEN
+                                    continue
+                                else:
+                                    break
+                            # case "-": Fast path for -ERR
+                            case 45:
+                                try:
+                                    end = data_received.index(CRLF, pos, size)
+                                except ValueError:
+                                    scanned = 1
+                                    break
+                                if end - pos > max_control_line:
+                                    raise LimitExceededError(
+                                        "max_control_line", end - pos, max_control_line
+                                    )
+                                msg = data_received[pos + 5 : end].decode()
+                                if msg[0] != "'":
                                     raise ProtocolError()
-                                self._events_received.append(OK_EVENT)
-                                self._data_received = self._data_received[5:]
-                                continue
-                            else:
-                                yield None
-                                continue
-                        # case "-": Fast path for -ERR
-                        case 45:
-                            try:
-                                end = self._data_received.index(CRLF)
-                            except ValueError:
-                                yield None
+                                if msg[-1] != "'":
+                                    raise ProtocolError()
+                                append_event(ErrorEvent(msg[1:-1].lower()))
+                                pos = end + CRLF_SIZE
                                 continue
-                            msg = self._data_received[5:end].decode()
-                            if msg[0] != "'":
+                            # Anything else is an error
+                            case _:
                                 raise ProtocolError()
-                            if msg[-1] != "'":
+                    # We're waiting for some HMSG header and payload
+                    case 1:
+                        if expected_total_size > max_payload:
+                            raise LimitExceededError(
+                                "max_payload", expected_total_size, max_payload
+                            )
+                        if (
+                            expected_total_size - expected_header_size
+                            > payload_threshold
+                        ):
+                            # Only the header is buffered, the payload is
+                            # passed to the sink as it is received.
+                            if size - pos < expected_header_size:
+                                break
+                            if (
+                                data_received[
+                                    pos + expected_header_size - 4 : pos
+                                    + expected_header_size
+                                ]
+                                != STOP_HEADER
+                            ):
                                 raise ProtocolError()
-                            self._events_received.append(ErrorEvent(msg[1:-1].lower()))
-                            self._data_received = self._data_received[end + CRLF_SIZE :]
+                            if lazy:
+                                sid = parse_msg_args(lazy_args)[0]
+                            elif range_batch is not None:
+                                sid, subject, reply_to = parse_msg_args(lazy_args)
+                            streamed_header = chunk[
+                                pos : pos + expected_header_size - 4
+                            ]
+                            payload_remaining = (
+                                expected_total_size - expected_header_size
+                            )
+                            pos += expected_header_size
+                            state = STREAMING_PAYLOAD
                             continue
-                        # Anything else is an error
-                        case _:
-                            raise ProtocolError()
-                # We're waiting for some HMSG header and payload
-                case 1:
-                    assert partial_msg is not None, "pending_msg is None"
-                    if len(self._data_received) >= expected_total_size + CRLF_SIZE:
+                        if size - pos < expected_total_size + CRLF_SIZE:
+                            break
                         if (
-                            self._data_received[
-                                expected_header_size - 4 : expected_header_size
+                            data_received[
+                                pos + expected_header_size - 4 : pos
+                                + expected_header_size
                             ]
                             != STOP_HEADER
                         ):
                             raise ProtocolError()
-                        partial_msg.header = self._data_received[
-                            : expected_header_size - 4
-                        ]
-                        partial_msg.payload = self._data_received[
-                            expected_header_size:expected_total_size
-                        ]
-                        self._data_received = self._data_received[
-                            expected_total_size + CRLF_SIZE + 1 :
+                        if range_batch is not None:
+                            range_batch.append_range(
+                                lazy_args,
+                                data_received,
+                                pos,
+                                expected_header_size,
+                                expected_total_size,
+                            )
+                            pos += expected_total_size + CRLF_SIZE
+                            state = AWAITING_CONTROL_LINE
+                            continue
+                        header = chunk[pos : pos + expected_header_size - 4]
+                        payload = chunk[
+                            pos + expected_header_size : pos + expected_total_size
                         ]
-                        self._events_received.append(partial_msg)
+                        pos += expected_total_size + CRLF_SIZE
                         state = AWAITING_CONTROL_LINE
+                        if lazy:
+                            append_event(LazyHMsgEvent(lazy_args, payload, header))
+                            continue
+                        handler = handlers.get(sid) if handlers is not None else None
+                        if handler is not None:
+                            handler(subject, reply_to, payload, header)
+                        elif on_msg is not None:
+                            on_msg(
+                                sid,
+                                subject,
+                                reply_to,
+                                payload,
+                                header,
+                            )
+                        elif batch is not None:
+                            batch.append(sid, subject, reply_to, payload, header)
+                        else:
+                            append_event(
+                                new_hmsg(
+                                    sid=sid,
+                                    subject=subject,
+                                    reply_to=reply_to,
+                                    payload=payload,
+                                    header=header,
+                                )
+                            )
                         continue
-                    else:
-                        yield None
-                        continue
-                # We're waiting for some MSG payload
-                case _:
-                    assert partial_msg is not None, "pending_msg is None"
-                    if len(self._data_received) >= expected_total_size + CRLF_SIZE:
-                        partial_msg.payload = self._data_received[:expected_total_size]
-                        self._data_received = self._data_received[
-                            expected_total_size + CRLF_SIZE + 1 :
-                        ]
-                        self._events_received.append(partial_msg)
+                    # We're waiting for some MSG payload
+                    case 2:
+                        if expected_total_size > max_payload:
+                            raise LimitExceededError(
+                                "max_payload", expected_total_size, max_payload
+                            )
+                        if expected_total_size > payload_threshold:
+                            # The payload is passed to the sink as it is received.
+                            if lazy:
+                                sid = parse_msg_args(lazy_args)[0]
+                            elif range_batch is not None:
+                                sid, subject, reply_to = parse_msg_args(lazy_args)
+                            streamed_header = None
+                            payload_remaining = expected_total_size
+                            state = STREAMING_PAYLOAD
+                            continue
+                        if size - pos < expected_total_size + CRLF_SIZE:
+                            break
+                        if range_batch is not None:
+                            range_batch.append_range(
+                                lazy_args, data_received, pos, 0, expected_total_size
+                            )
+                            pos += expected_total_size + CRLF_SIZE
+                            state = AWAITING_CONTROL_LINE
+                            continue
+                        payload = chunk[pos : pos + expected_total_size]
+                        pos += expected_total_size + CRLF_SIZE
                         state = AWAITING_CONTROL_LINE
+                        if lazy:
+                            append_event(LazyMsgEvent(lazy_args, payload))
+                            continue
+                        handler = handlers.get(sid) if handlers is not None else None
+                        if handler is not None:
+                            handler(
+                                subject,
+                                reply_to,
+                                payload,
+                                EMPTY_HEADER,
+                            )
+                        elif on_msg is not None:
+                            on_msg(
+                                sid,
+                                subject,
+                                reply_to,
+                                payload,
+                                EMPTY_HEADER,
+                            )
+                        elif batch is not None:
+                            batch.append(sid, subject, reply_to, payload, None)
+                        else:
+                            append_event(
+                                new_msg(
+                                    sid=sid,
+                                    subject=subject,
+                                    reply_to=reply_to,
+                                    payload=payload,
+                                )
+                            )
                         continue
-                    else:
-                        yield None
+                    # We're streaming a large payload
+                    case _:
+                        if payload_remaining:
+                            # Payload bytes are not kept in the buffer
+                            chunk_size = min(size - pos, payload_remaining)
+                            payload_remaining -= chunk_size
+                            payload_chunk = chunk[pos : pos + chunk_size]
+                            pos += chunk_size
+                            assert on_payload_chunk is not None
+                            on_payload_chunk(sid, payload_chunk, not payload_remaining)
+                            continue
+                        if size - pos < CRLF_SIZE:
+                            break
+                        # The message is delivered with an empty payload
+                        payload = (
+                            chunk[pos:pos]
+                            if payload_spool is None
+                            else payload_spool.release()
+                        )
+                        header = streamed_header
+                        streamed_header = None
+                        pos += CRLF_SIZE
+                        state = AWAITING_CONTROL_LINE
+                        if lazy:
+                            append_event(
+                                LazyMsgEvent(lazy_args, payload)
+                                if header is None
+                                else LazyHMsgEvent(lazy_args, payload, header)
+                            )
+                            continue
+                        handler = handlers.get(sid) if handlers is not None else None
+                        if handler is not None:
+                            handler(
+                                subject,
+                                reply_to,
+                                payload,
+                                EMPTY_HEADER if header is None else header,
+                            )
+                        elif on_msg is not None:
+                            on_msg(
+                                sid,
+                                subject,
+                                reply_to,
+                                payload,
+                                EMPTY_HEADER if header is None else header,
+                            )
+                        elif batch is not None:
+                            batch.append(sid, subject, reply_to, payload, header)
+                        elif header is None:
+                            append_event(new_msg(sid, subject, reply_to, payload))
+                        else:
+                            append_event(
+                                new_hmsg(sid, subject, reply_to, payload, header)
+                            )
                         continue
 
+            if range_batch is not None:
+                # Messages are copied before the buffer is modified
+                range_batch.flush()
+            # Bytes are left to parse without waiting for more data
+            self._pending = pos < size and (pos >= stop or len(events) >= events_limit)
+            # Bound the bytes buffered for an operation split across reads
+            if state == AWAITING_CONTROL_LINE:
+                if (
+                    size - pos > max_control_line
+                    and data_received.find(
+                        CRLF, pos, pos + max_control_line + CRLF_SIZE
+                    )
+                    < 0
+                ):
+                    raise LimitExceededError(
+                        "max_control_line", size - pos, max_control_line
+                    )
+            elif expected_total_size > max_payload:
+                raise LimitExceededError(
+                    "max_payload", expected_total_size, max_payload
+                )
+            if view is not None:
+                view.release()
+            elif pos == size:
+                # Everything was parsed: reuse the whole buffer, or drop
+                # parsed bytes when there is no spare room to preserve
+                if size == len(data_received):
+                    del data_received[:pos]
+                pos = self._end = 0
+            self._pos = pos
+            # Wait for more data
+            yield None
+
 
 if TYPE_CHECKING:
     from .common import Parser as ParserProtocol
@@ -0,0 +1,82 @@
+"""
+NATS protocol parser locating control lines with NumPy.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING
+
+import numpy
+from numpy.typing import NDArray
+
+from .parser_300 import LineEnds, Parser300
+
+
+def scan_crlf(data: bytearray, start: int, end: int) -> NDArray[numpy.intp]:
+    """Return the offsets of all CRLF found between start and end."""
+    # The array must not outlive this function: it prevents resizing data.
+    array = numpy.frombuffer(data, numpy.uint8, end - start, start)
+    # LF are searched first, then only those preceded by CR are kept
+    offsets = numpy.flatnonzero(array[1:] == 10)
+    offsets = offsets[array[offsets] == 13]
+    del array
+    offsets += start
+    return offsets
+
+
+class CrlfOffsets:
+    """Offsets of the CRLF found in the buffer, searched like the buffer.
+
+    Offsets are kept in a NumPy array and looked up by binary search, so
+    the CRLF found in payloads are skipped without being converted to
+    Python integers.
+    """
+
+    __slots__ = ["_search", "_item", "_count"]
+
+    def __init__(self, offsets: NDArray[numpy.intp]) -> None:
+        self._search = offsets.searchsorted
+        self._item = offsets.item
+        self._count = len(offsets)
+
+    def index(self, sub: bytes, start: int, end: int, /) -> int:
+        idx = self._search(start)
+        if idx == self._count:
+            raise ValueError("subsection not found")
+        return self._item(idx)
+
+
+class ParserNumpy(Parser300):
+    """NATS Protocol parser locating control lines with NumPy.
+
+    The unparsed bytes are scanned once per read using NumPy to locate
+    all CRLF, then operations are parsed by looking up the CRLF offsets
+    and jumping over payloads. Each lookup still costs more than searching
+    the control line end in the buffer, so this is slower than `Parser300`
+    even for large reads.
+    """
+
+    __slots__ = []
+
+    def __repr__(self) -> str:
+        return "<nats protocol parser backend=numpy>"
+
+    def _scan_lines(self, data: bytearray, start: int, end: int) -> LineEnds:
+        """Locate all CRLF of the unparsed bytes in a single pass."""
+        if self._on_payload_chunk is not None:
+            # Reads are mostly made of streamed payloads, which are not
+            # scanned: search control lines one by one instead.
+            return data
+        if self._max_events < sys.maxsize or self._max_bytes < sys.maxsize:
+            # Budgeted calls only parse part of the bytes received, which
+            # would otherwise be scanned again by each call.
+            return data
+        return CrlfOffsets(scan_crlf(data, start, end))
+
+
+if TYPE_CHECKING:
+    from .common import Parser as ParserProtocol
+
+    # Verify that Parser implements ParserProtocol
+    parser: ParserProtocol = ParserNumpy()
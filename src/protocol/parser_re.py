@@ -19,47 +19,49 @@ NATS protocol parser.
 from __future__ import annotations
 
 import re
-from typing import TYPE_CHECKING, Any, Dict
+import sys
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, Mapping
 
 from .common import (
+    EMPTY_HEADER,
     OK_EVENT,
     PING_EVENT,
     PONG_EVENT,
+    ControlLineCache,
     ErrorEvent,
     Event,
+    EventBatch,
+    EventPool,
     HMsgEvent,
+    JsonLoads,
+    LazyHMsgEvent,
+    LazyMsgEvent,
+    LimitExceededError,
+    MsgCallback,
     MsgEvent,
+    MsgHandler,
     ParserClosedError,
+    PayloadChunkCallback,
+    PingPongCallback,
+    PayloadSpool,
     ProtocolError,
+    SubjectCache,
     parse_info,
 )
 
-MSG_RE = re.compile(
-    b"MSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?(\\d+)\r\n",
-    re.ASCII,
-)
-HMSG_RE = re.compile(
-    b"HMSG\\s+([^\\s]+)\\s+([^\\s]+)\\s+(([^\\s]+)[^\\S\r\n]+)?([\\d]+)\\s+(\\d+)\r\n",
-    re.ASCII,
-)
-OK_RE = re.compile(
-    b"\\+OK\\s*\r\n",
-    re.ASCII,
-)
-ERR_RE = re.compile(
-    b"-ERR\\s+('.+')?\r\n",
-    re.ASCII,
-)
-PING_RE = re.compile(
-    b"PING\\s*\r\n",
-    re.ASCII,
-)
-PONG_RE = re.compile(
-    b"PONG\\s*\r\n",
-    re.ASCII,
-)
-INFO_RE = re.compile(
-    b"INFO\\s+([^\r\n]+)\r\n",
+# All operations are matched by a single pattern, the name of the
+# outer group matched is available as `Match.lastgroup`.
+OP_RE = re.compile(
+    b"(?P<msg>MSG\\s+(?P<msg_subject>[^\\s]+)\\s+(?P<msg_sid>[^\\s]+)\\s+"
+    b"(?:(?P<msg_reply>[^\\s]+)[^\\S\r\n]+)?(?P<msg_size>\\d+)\r\n)"
+    b"|(?P<hmsg>HMSG\\s+(?P<hmsg_subject>[^\\s]+)\\s+(?P<hmsg_sid>[^\\s]+)\\s+"
+    b"(?:(?P<hmsg_reply>[^\\s]+)[^\\S\r\n]+)?(?P<hmsg_header_size>[\\d]+)\\s+"
+    b"(?P<hmsg_size>\\d+)\r\n)"
+    b"|(?P<ping>PING\\s*\r\n)"
+    b"|(?P<pong>PONG\\s*\r\n)"
+    b"|(?P<ok>\\+OK\\s*\r\n)"
+    b"|(?P<err>-ERR\\s+(?P<err_msg>'.+')?\r\n)"
+    b"|(?P<info>INFO\\s+(?P<info_line>[^\r\n]+)\r\n)",
     re.ASCII,
 )
 
@@ -90,7 +92,8 @@ ERR_OP_SIZE = len(ERR_OP)
 # States
 AWAITING_CONTROL_LINE = 1
 AWAITING_MSG_PAYLOAD = 2
-MAX_CONTROL_LINE_SIZE = 4096
+STREAMING_PAYLOAD = 3
+RECEIVE_BUFFER_SIZE = 64 * 1024
 
 # Protocol Errors
 STALE_CONNECTION = "stale connection"
@@ -99,24 +102,119 @@ PERMISSIONS_ERR = "permissions violation"
 
 
 class ParserRE:
-    def __init__(self, *args: object, **kwargs: object) -> None:
+    def __init__(
+        self,
+        zero_copy: bool = False,
+        on_msg: MsgCallback | None = None,
+        handlers: Mapping[int, MsgHandler] | None = None,
+        subject_cache: SubjectCache | None = None,
+        lazy: bool = False,
+        batch: bool = False,
+        control_line_cache: ControlLineCache | None = None,
+        max_control_line: int | None = None,
+        max_payload: int | None = None,
+        large_payload_threshold: int | None = None,
+        on_payload_chunk: PayloadChunkCallback | None = None,
+        payload_spool: PayloadSpool | None = None,
+        event_pool: EventPool | None = None,
+        json_loads: JsonLoads | None = None,
+        max_events: int | None = None,
+        max_bytes: int | None = None,
+        on_ping: PingPongCallback | None = None,
+        on_pong: PingPongCallback | None = None,
+    ) -> None:
+        self._zero_copy = zero_copy
+        self._handlers = handlers
+        self._on_msg = on_msg
+        self._subject_cache = subject_cache
+        # Callbacks and batches need decoded arguments, only events are lazy
+        self._lazy = lazy and handlers is None and on_msg is None and not batch
+        self._batch = EventBatch() if batch else None
+        # Batches without callbacks keep the raw arguments as lazy events do,
+        # and copy the bytes of their messages once per read.
+        self._batched = batch and handlers is None and on_msg is None
+        # Spooled payloads are written to a temporary file by the sink
+        self._payload_spool = payload_spool
+        # Message events are taken from the pool when there is one
+        self._new_msg = MsgEvent if event_pool is None else event_pool.msg
+        self._new_hmsg = HMsgEvent if event_pool is None else event_pool.hmsg
+        # INFO events are lazy even when messages are dispatched to callbacks
+        self._json_loads = json_loads
+        self._lazy_info = lazy
+        if payload_spool is not None:
+            on_payload_chunk = payload_spool.write
+        # Payloads larger than the threshold are passed to the sink as
+        # they are received instead of being buffered.
+        self._large_payload_threshold = (
+            sys.maxsize
+            if large_payload_threshold is None or on_payload_chunk is None
+            else large_payload_threshold
+        )
+        self._on_payload_chunk = on_payload_chunk
+        # Limits are checked against operations received from the server,
+        # and are not enforced until they are set.
+        self._max_control_line = sys.maxsize
+        self._max_payload = sys.maxsize
+        self.set_limits(max_control_line, max_payload)
+        # Each call stops once its budget is spent, and the remaining bytes
+        # are parsed by the next call or by resume().
+        self._max_events = sys.maxsize if max_events is None else max_events
+        self._max_bytes = sys.maxsize if max_bytes is None else max_bytes
+        # PING and PONG operations are passed to callbacks as soon as they
+        # are parsed instead of producing events, when callbacks are set.
+        self._on_ping = on_ping
+        self._on_pong = on_pong
         self.reset()
 
     def __repr__(self) -> str:
         return "<nats protocol parser backend=re>"
 
     def reset(self) -> None:
-        self.buf = bytearray()
+        # Bytes between _pos and _end are waiting to be parsed, bytes after
+        # _end are spare room for the next bytes received.
+        self.buf: bytearray = bytearray()
+        self._pos = 0
+        self._end = 0
+        self._view: memoryview | None = None
         self._closed = False
         self._state = AWAITING_CONTROL_LINE
         self.needed = 0
         self.header_needed = 0
+        self._payload_remaining: int = 0
+        self._streamed_header: bytearray | memoryview | None = None
         self.msg_arg: Dict[str, Any] = {}
         self._events: list[Event] = []
+        self._streaming = False
+        self._pending = False
+        # Bytes of a control line split across reads which were already
+        # searched for CRLF.
+        self._scanned = 0
         self.__parser__ = self.__parse__()
 
     def close(self) -> None:
         self._closed = True
+        if self._payload_spool is not None:
+            self._payload_spool.close()
+
+    def set_limits(
+        self, max_control_line: int | None = None, max_payload: int | None = None
+    ) -> None:
+        if max_control_line is not None:
+            if max_control_line <= 0:
+                raise ValueError(f"invalid control line limit: {max_control_line}")
+            self._max_control_line = max_control_line
+        if max_payload is not None:
+            if max_payload < 0:
+                raise ValueError(f"invalid payload limit: {max_payload}")
+            self._max_payload = max_payload
+
+    def batch_received(self) -> EventBatch:
+        batch = self._batch
+        if batch is None:
+            return EventBatch()
+        batch.flush()
+        self._batch = EventBatch()
+        return batch
 
     def events_received(self) -> list[Event]:
         events = self._events
@@ -124,144 +222,362 @@ class ParserRE:
         return events
 
     def parse(self, data: bytes | bytearray) -> None:
-        self.buf.extend(data)
+        self._write(data)
         try:
             self.__parser__.__next__()
         except StopIteration:
             raise ParserClosedError()
 
-    def __parse__(self):
-        """
-        Parses the wire protocol from NATS for the client
-        and dispatches the subscription callbacks.
+    def parse_many(self, chunks: Iterable[bytes | bytearray | memoryview]) -> None:
+        """Parse several chunks received at once.
+
+        Chunks are appended to the buffer and parsed in a single pass.
         """
-        while not self._closed:
-            if not self.buf:
-                yield None
-                continue
-            if self._state == AWAITING_CONTROL_LINE:
-                msg = HMSG_RE.match(self.buf)
-                if msg:
-                    try:
-                        subject, sid, _, reply, header_size, needed_bytes = msg.groups()
-                        self.msg_arg["subject"] = subject
-                        self.msg_arg["sid"] = int(sid)
-                        if reply:
-                            self.msg_arg["reply"] = reply
-                        else:
-                            self.msg_arg["reply"] = b""
-                        self.needed = int(needed_bytes)
-                        self.header_needed = int(header_size)
-                        del self.buf[: msg.end()]
-                        self._state = AWAITING_MSG_PAYLOAD
-                        continue
-                    except Exception:
-                        raise ProtocolError()
-
-                msg = MSG_RE.match(self.buf)
-                if msg:
-                    try:
-                        subject, sid, _, reply, needed_bytes = msg.groups()
-                        self.msg_arg["subject"] = subject
-                        self.msg_arg["sid"] = int(sid)
-                        if reply:
-                            self.msg_arg["reply"] = reply
-                        else:
-                            self.msg_arg["reply"] = b""
-                        self.needed = int(needed_bytes)
-                        del self.buf[: msg.end()]
-                        self._state = AWAITING_MSG_PAYLOAD
-                        continue
-                    except Exception:
-                        raise ProtocolError()
-
-                ok = OK_RE.match(self.buf)
-                if ok:
-                    # Do nothing and just skip.
-                    del self.buf[: ok.end()]
-                    self._events.append(OK_EVENT)
-                    continue
+        for data in chunks:
+            self._write(data)
+        try:
+            self.__parser__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
 
-                err = ERR_RE.match(self.buf)
-                if err:
-                    err_msg = err.groups()
-                    emsg = err_msg[0].decode().lower()
-                    self._events.append(ErrorEvent(emsg[1:-1]))
-                    del self.buf[: err.end()]
-                    continue
+    def parse_iter(self, data: bytes | bytearray) -> Iterator[Event]:
+        yield from self.events_received()
+        self._write(data)
+        while True:
+            self._streaming = True
+            try:
+                self.__parser__.__next__()
+            except StopIteration:
+                raise ParserClosedError()
+            finally:
+                self._streaming = False
+            if not self._events:
+                return
+            yield from self.events_received()
 
-                ping = PING_RE.match(self.buf)
-                if ping:
-                    del self.buf[: ping.end()]
-                    self._events.append(PING_EVENT)
-                    continue
+    def pending(self) -> bool:
+        """Return True when the previous call stopped at the budget."""
+        return self._pending
 
-                pong = PONG_RE.match(self.buf)
-                if pong:
-                    del self.buf[: pong.end()]
-                    self._events.append(PONG_EVENT)
-                    continue
+    def resume(self) -> None:
+        """Continue parsing the bytes left by the previous call."""
+        try:
+            self.__parser__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
 
-                info = INFO_RE.match(self.buf)
-                if info:
-                    info_line = info.groups()[0]
-                    self._events.append(parse_info(info_line))
-                    del self.buf[: info.end()]
-                    continue
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        if sizehint <= 0:
+            sizehint = RECEIVE_BUFFER_SIZE
+        if len(self.buf) - self._end < sizehint:
+            self._make_room()
+            missing = sizehint - len(self.buf) + self._end
+            if missing > 0:
+                self.buf.extend(bytes(missing))
+        self._view = memoryview(self.buf)[self._end :]
+        return self._view
 
-                if len(self.buf) < MAX_CONTROL_LINE_SIZE and _CRLF_ in self.buf:
-                    # FIXME: By default server uses a max protocol
-                    # line of 4096 bytes but it can be tuned in latest
-                    # releases, in that case we won't reach here but
-                    # client ping/pong interval would disconnect
-                    # eventually.
-                    raise ProtocolError()
-                else:
-                    # If nothing matched at this point, then it must
-                    # be a split buffer and need to gather more bytes.
-                    yield None
-                    continue
+    def buffer_updated(self, nbytes: int) -> None:
+        assert self._view is not None, "get_buffer() was not called"
+        self._view.release()
+        self._view = None
+        self._end += nbytes
+        try:
+            self.__parser__.__next__()
+        except StopIteration:
+            raise ParserClosedError()
 
-            else:
-                if len(self.buf) >= self.needed + CRLF_SIZE:
-                    hdr = None
-                    subject = self.msg_arg["subject"]
-                    sid = self.msg_arg["sid"]
-                    reply = self.msg_arg["reply"]
+    def _write(self, data: bytes | bytearray | memoryview) -> None:
+        size = len(data)
+        if len(self.buf) - self._end < size:
+            self._make_room()
+        end = self._end
+        self.buf[end : end + size] = data
+        self._end = end + size
 
-                    # Consume msg payload from buffer and set next parser state.
-                    if self.header_needed > 0:
-                        hbuf = bytes(self.buf[: self.header_needed])
-                        payload = bytes(self.buf[self.header_needed : self.needed])
-                        hdr = hbuf[:-4]
-                        del self.buf[: self.needed + CRLF_SIZE]
-                        self.header_needed = 0
-                        self._events.append(
-                            HMsgEvent(
-                                sid,
-                                subject.decode(),
-                                reply.decode(),
-                                bytearray(payload),
-                                bytearray(hdr or b""),
+    def _make_room(self) -> None:
+        # Discard parsed bytes. In zero-copy mode, payloads may still be
+        # views into the buffer, in which case unparsed bytes are moved to
+        # a new buffer instead.
+        pos = self._pos
+        if pos == 0:
+            return
+        try:
+            del self.buf[:pos]
+        except BufferError:
+            self.buf = self.buf[pos : self._end]
+        self._end -= pos
+        self._pos = 0
+
+    def __parse__(self) -> Iterator[None]:
+        """
+        Parses the wire protocol from NATS for the client
+        and dispatches the subscription callbacks.
+
+        Operations are matched at the read offset using a single
+        pattern, so parsed bytes are only discarded once the buffer
+        is full.
+        """
+        while not self._closed:
+            buf = self.buf
+            pos = self._pos
+            end = self._end
+            if self._scanned:
+                # Match the control line split across reads only once its
+                # end was received, searching only the bytes received since
+                # the previous read.
+                if buf.find(_CRLF_, pos + self._scanned, end) < 0:
+                    if end - pos > self._max_control_line:
+                        raise LimitExceededError(
+                            "max_control_line", end - pos, self._max_control_line
+                        )
+                    self._scanned = end - pos - 1
+                    # Nothing can be parsed until the line is complete
+                    self._pending = False
+                    yield None
+                    continue
+                self._scanned = 0
+            events = self._events
+            streaming = self._streaming
+            # In zero-copy mode, payload and header are read-only views
+            # into the buffer.
+            view = memoryview(buf).toreadonly() if self._zero_copy else None
+            chunk = buf if view is None else view
+            # Each call stops once its budget of events or bytes is spent
+            max_bytes = self._max_bytes
+            events_limit = len(events) + self._max_events
+            stop = end if max_bytes >= end - pos else pos + max_bytes
+            pausing = streaming or events_limit < sys.maxsize
+            while pos < stop:
+                if pausing and ((streaming and events) or len(events) >= events_limit):
+                    break
+                if self._state == AWAITING_CONTROL_LINE:
+                    match = OP_RE.match(buf, pos, end)
+                    if match is None:
+                        max_control_line = self._max_control_line
+                        if (
+                            buf.find(
+                                _CRLF_,
+                                pos,
+                                min(end, pos + max_control_line + CRLF_SIZE),
+                            )
+                            >= 0
+                        ):
+                            # A complete control line which does not match
+                            # any operation.
+                            raise ProtocolError()
+                        if end - pos > max_control_line:
+                            raise LimitExceededError(
+                                "max_control_line", end - pos, max_control_line
                             )
+                        # If nothing matched at this point, then it must
+                        # be a split buffer and need to gather more bytes.
+                        self._scanned = end - pos - 1
+                        break
+                    line_size = match.end() - CRLF_SIZE - pos
+                    if line_size > self._max_control_line:
+                        raise LimitExceededError(
+                            "max_control_line", line_size, self._max_control_line
                         )
+                    op = match.lastgroup
+                    if op == "msg":
+                        try:
+                            subject, sid, reply, needed_bytes = match.group(
+                                "msg_subject", "msg_sid", "msg_reply", "msg_size"
+                            )
+                            self.msg_arg["subject"] = subject
+                            self.msg_arg["sid"] = int(sid)
+                            self.msg_arg["reply"] = reply or b""
+                            self.needed = int(needed_bytes)
+                            if self._lazy or self._batched:
+                                self.msg_arg["args"] = bytes(
+                                    buf[
+                                        match.start("msg_subject") : match.end(
+                                            "msg_reply" if reply else "msg_sid"
+                                        )
+                                    ]
+                                )
+                        except Exception:
+                            raise ProtocolError()
+                        if self.needed > self._max_payload:
+                            raise LimitExceededError(
+                                "max_payload", self.needed, self._max_payload
+                            )
+                        self._state = AWAITING_MSG_PAYLOAD
+                    elif op == "hmsg":
+                        try:
+                            subject, sid, reply, header_size, needed_bytes = (
+                                match.group(
+                                    "hmsg_subject",
+                                    "hmsg_sid",
+                                    "hmsg_reply",
+                                    "hmsg_header_size",
+                                    "hmsg_size",
+                                )
+                            )
+                            self.msg_arg["subject"] = subject
+                            self.msg_arg["sid"] = int(sid)
+                            self.msg_arg["reply"] = reply or b""
+                            self.needed = int(needed_bytes)
+                            self.header_needed = int(header_size)
+                            if self._lazy or self._batched:
+                                self.msg_arg["args"] = bytes(
+                                    buf[
+                                        match.start("hmsg_subject") : match.end(
+                                            "hmsg_reply" if reply else "hmsg_sid"
+                                        )
+                                    ]
+                                )
+                        except Exception:
+                            raise ProtocolError()
+                        if self.needed > self._max_payload:
+                            raise LimitExceededError(
+                                "max_payload", self.needed, self._max_payload
+                            )
+                        self._state = AWAITING_MSG_PAYLOAD
+                    elif op == "ping":
+                        if self._on_ping is None:
+                            events.append(PING_EVENT)
+                        else:
+                            self._on_ping()
+                    elif op == "pong":
+                        if self._on_pong is None:
+                            events.append(PONG_EVENT)
+                        else:
+                            self._on_pong()
+                    elif op == "ok":
+                        events.append(OK_EVENT)
+                    elif op == "err":
+                        emsg = match.group("err_msg").decode().lower()
+                        events.append(ErrorEvent(emsg[1:-1]))
                     else:
-                        payload = bytes(self.buf[: self.needed])
-                        del self.buf[: self.needed + CRLF_SIZE]
-                        self._events.append(
-                            MsgEvent(
-                                sid,
-                                subject.decode(),
-                                reply.decode(),
-                                bytearray(payload),
+                        events.append(
+                            parse_info(
+                                match.group("info_line"),
+                                self._json_loads,
+                                self._lazy_info,
                             )
                         )
-                    self._state = AWAITING_CONTROL_LINE
+                    pos = match.end()
+                    continue
 
-                else:
+                sid = self.msg_arg["sid"]
+                if self._state == STREAMING_PAYLOAD:
+                    if self._payload_remaining:
+                        # Payload bytes are not kept in the buffer
+                        chunk_size = min(end - pos, self._payload_remaining)
+                        self._payload_remaining -= chunk_size
+                        assert self._on_payload_chunk is not None
+                        self._on_payload_chunk(
+                            sid,
+                            chunk[pos : pos + chunk_size],
+                            not self._payload_remaining,
+                        )
+                        pos += chunk_size
+                        continue
+                    if end - pos < CRLF_SIZE:
+                        break
+                    # The message is delivered with an empty payload
+                    payload = (
+                        chunk[pos:pos]
+                        if self._payload_spool is None
+                        else self._payload_spool.release()
+                    )
+                    header = self._streamed_header
+                    self._streamed_header = None
+                    pos += CRLF_SIZE
+                elif self.needed - self.header_needed > self._large_payload_threshold:
+                    # Only the header is buffered, the payload is passed to
+                    # the sink as it is received.
+                    if end - pos < self.header_needed:
+                        break
+                    if self.header_needed > 0:
+                        self._streamed_header = chunk[
+                            pos : pos + self.header_needed - 4
+                        ]
+                    else:
+                        self._streamed_header = None
+                    self._payload_remaining = self.needed - self.header_needed
+                    pos += self.header_needed
+                    self.header_needed = 0
+                    self._state = STREAMING_PAYLOAD
+                    continue
+                elif end - pos < self.needed + CRLF_SIZE:
                     # Wait until we have enough bytes in buffer.
-                    yield None
+                    break
+                elif self._batched:
+                    assert self._batch is not None
+                    self._batch.append_range(
+                        self.msg_arg["args"], buf, pos, self.header_needed, self.needed
+                    )
+                    self.header_needed = 0
+                    pos += self.needed + CRLF_SIZE
+                    self._state = AWAITING_CONTROL_LINE
                     continue
+                elif self.header_needed > 0:
+                    payload = chunk[pos + self.header_needed : pos + self.needed]
+                    header = chunk[pos : pos + self.header_needed - 4]
+                    self.header_needed = 0
+                    pos += self.needed + CRLF_SIZE
+                else:
+                    payload = chunk[pos : pos + self.needed]
+                    header = None
+                    pos += self.needed + CRLF_SIZE
+                if self._lazy:
+                    subject = reply = ""
+                elif self._subject_cache is None:
+                    subject = self.msg_arg["subject"].decode()
+                    reply = self.msg_arg["reply"].decode()
+                else:
+                    subject = self._subject_cache.decode(self.msg_arg["subject"])
+                    reply = (
+                        self._subject_cache.decode(self.msg_arg["reply"])
+                        if self.msg_arg["reply"]
+                        else ""
+                    )
+                # Msg payload was consumed from buffer, set next parser state.
+                self._state = AWAITING_CONTROL_LINE
+                handler = (
+                    self._handlers.get(sid) if self._handlers is not None else None
+                )
+                if handler is not None:
+                    handler(
+                        subject,
+                        reply,
+                        payload,
+                        EMPTY_HEADER if header is None else header,
+                    )
+                elif self._on_msg is not None:
+                    self._on_msg(
+                        sid,
+                        subject,
+                        reply,
+                        payload,
+                        EMPTY_HEADER if header is None else header,
+                    )
+                elif self._batch is not None:
+                    self._batch.append(sid, subject, reply, payload, header)
+                elif self._lazy and header is not None:
+                    events.append(LazyHMsgEvent(self.msg_arg["args"], payload, header))
+                elif self._lazy:
+                    events.append(LazyMsgEvent(self.msg_arg["args"], payload))
+                elif header is not None:
+                    events.append(self._new_hmsg(sid, subject, reply, payload, header))
+                else:
+                    events.append(self._new_msg(sid, subject, reply, payload))
+
+            if self._batch is not None:
+                # Messages are copied before the buffer is modified
+                self._batch.flush()
+            # Bytes are left to parse without waiting for more data
+            self._pending = pos < end and (pos >= stop or len(events) >= events_limit)
+            if view is not None:
+                view.release()
+            elif pos == end:
+                # Everything was parsed: reuse the whole buffer
+                pos = self._end = 0
+            self._pos = pos
+            yield None
 
 
 if TYPE_CHECKING:
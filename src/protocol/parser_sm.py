@@ -0,0 +1,773 @@
+"""
+NATS protocol parser implemented as an explicit state machine.
+"""
+
+from __future__ import annotations
+
+import sys
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Mapping
+
+from .common import (
+    CRLF,
+    CRLF_SIZE,
+    EMPTY_HEADER,
+    OK_EVENT,
+    PING_EVENT,
+    PONG_EVENT,
+    ControlLineCache,
+    ErrorEvent,
+    Event,
+    EventBatch,
+    EventPool,
+    HMsgEvent,
+    JsonLoads,
+    LazyHMsgEvent,
+    LazyMsgEvent,
+    LimitExceededError,
+    MsgCallback,
+    MsgEvent,
+    MsgHandler,
+    ParserClosedError,
+    PayloadChunkCallback,
+    PingPongCallback,
+    PayloadSpool,
+    ProtocolError,
+    SubjectCache,
+    parse_info,
+    parse_msg_args,
+)
+from .parser_300 import (
+    AWAITING_CONTROL_LINE,
+    AWAITING_HMSG_PAYLOAD,
+    AWAITING_MSG_PAYLOAD,
+    OK_OP,
+    OK_OP_LEN,
+    PING_OP,
+    PING_OR_PONG_OP_LEN,
+    PONG_OP,
+    RECEIVE_BUFFER_SIZE,
+    STOP_HEADER,
+    STREAMING_PAYLOAD,
+)
+
+# Returned by operation handlers when more bytes are needed
+NEED_MORE_DATA = -1
+
+# An operation handler parses the operation starting at the read offset
+# and returns the offset of the next operation, or NEED_MORE_DATA.
+OpHandler = Callable[[bytearray, int, int], int]
+
+
+class ParserSM:
+    """NATS Protocol parser without generator.
+
+    The parser state is kept in attributes between calls, and each call to
+    `parse()` runs a loop which returns once all received bytes are parsed
+    or when an operation is split across reads. Control lines are parsed by
+    a handler looked up using the first byte of the operation.
+    """
+
+    __slots__ = [
+        "_closed",
+        "_zero_copy",
+        "_handlers",
+        "_on_msg",
+        "_on_ping",
+        "_on_pong",
+        "_subject_cache",
+        "_lazy",
+        "_batch",
+        "_batched",
+        "_control_line_cache",
+        "_max_control_line",
+        "_max_payload",
+        "_max_events",
+        "_max_bytes",
+        "_pending",
+        "_large_payload_threshold",
+        "_on_payload_chunk",
+        "_payload_spool",
+        "_new_msg",
+        "_new_hmsg",
+        "_json_loads",
+        "_lazy_info",
+        "_data_received",
+        "_pos",
+        "_end",
+        "_view",
+        "_events_received",
+        "_streaming",
+        "_scanned",
+        "_state",
+        "_sid",
+        "_subject",
+        "_reply_to",
+        "_lazy_args",
+        "_header_size",
+        "_total_size",
+        "_payload_remaining",
+        "_streamed_header",
+        "_ops",
+    ]
+
+    def __init__(
+        self,
+        zero_copy: bool = False,
+        on_msg: MsgCallback | None = None,
+        handlers: Mapping[int, MsgHandler] | None = None,
+        subject_cache: SubjectCache | None = None,
+        lazy: bool = False,
+        batch: bool = False,
+        control_line_cache: ControlLineCache | None = None,
+        max_control_line: int | None = None,
+        max_payload: int | None = None,
+        large_payload_threshold: int | None = None,
+        on_payload_chunk: PayloadChunkCallback | None = None,
+        payload_spool: PayloadSpool | None = None,
+        event_pool: EventPool | None = None,
+        json_loads: JsonLoads | None = None,
+        max_events: int | None = None,
+        max_bytes: int | None = None,
+        on_ping: PingPongCallback | None = None,
+        on_pong: PingPongCallback | None = None,
+    ) -> None:
+        self._closed = False
+        self._zero_copy = zero_copy
+        # Messages are dispatched to callbacks instead of producing events
+        # when a handler is registered for their sid or when on_msg is set.
+        self._handlers = handlers
+        self._on_msg = on_msg
+        self._subject_cache = subject_cache
+        # Callbacks and batches need decoded arguments, only events are lazy
+        self._lazy = lazy and handlers is None and on_msg is None and not batch
+        self._batch = EventBatch() if batch else None
+        # Batches without callbacks keep the raw arguments as lazy events do,
+        # and copy the bytes of their messages once per call.
+        self._batched = batch and handlers is None and on_msg is None
+        # Spooled payloads are written to a temporary file by the sink
+        self._payload_spool = payload_spool
+        # Message events are taken from the pool when there is one
+        self._new_msg = MsgEvent if event_pool is None else event_pool.msg
+        self._new_hmsg = HMsgEvent if event_pool is None else event_pool.hmsg
+        # INFO events are lazy even when messages are dispatched to callbacks
+        self._json_loads = json_loads
+        self._lazy_info = lazy
+        if payload_spool is not None:
+            on_payload_chunk = payload_spool.write
+        # Payloads larger than the threshold are passed to the sink as
+        # they are received instead of being buffered.
+        self._large_payload_threshold = (
+            sys.maxsize
+            if large_payload_threshold is None or on_payload_chunk is None
+            else large_payload_threshold
+        )
+        self._on_payload_chunk = on_payload_chunk
+        self._control_line_cache = control_line_cache
+        # Limits are checked against operations received from the server,
+        # and are not enforced until they are set.
+        self._max_control_line = sys.maxsize
+        self._max_payload = sys.maxsize
+        self.set_limits(max_control_line, max_payload)
+        # Each call stops once its budget is spent, and the remaining bytes
+        # are parsed by the next call or by resume().
+        self._max_events = sys.maxsize if max_events is None else max_events
+        self._max_bytes = sys.maxsize if max_bytes is None else max_bytes
+        # PING and PONG operations are passed to callbacks as soon as they
+        # are parsed instead of producing events, when callbacks are set.
+        self._on_ping = on_ping
+        self._on_pong = on_pong
+        self._pending = False
+        # Bytes between _pos and _end are waiting to be parsed, bytes after
+        # _end are spare room for the next bytes received.
+        self._data_received = bytearray()
+        self._pos = 0
+        self._end = 0
+        self._view: memoryview | None = None
+        self._events_received: list[Event] = []
+        # When streaming, the parser pauses after each event
+        self._streaming = False
+        # Bytes of a control line split across reads which were already
+        # searched for CRLF, so that they are not searched on each read.
+        self._scanned = 0
+        # State of the message being parsed
+        self._state = AWAITING_CONTROL_LINE
+        self._sid = 0
+        self._subject = ""
+        self._reply_to = ""
+        self._lazy_args = b""
+        self._header_size = 0
+        self._total_size = 0
+        self._payload_remaining = 0
+        self._streamed_header: bytearray | memoryview | None = None
+        # Control line handlers indexed by the first byte of the operation
+        ops: List[OpHandler] = [self._parse_invalid] * 256
+        ops[77] = self._parse_msg  # "M"
+        ops[72] = self._parse_hmsg  # "H"
+        ops[80] = self._parse_ping_or_pong  # "P"
+        ops[73] = self._parse_info  # "I"
+        ops[43] = self._parse_ok  # "+"
+        ops[45] = self._parse_err  # "-"
+        self._ops = ops
+
+    def __repr__(self) -> str:
+        return "<nats protocol parser backend=sm>"
+
+    def close(self) -> None:
+        """Close the parser."""
+        self._closed = True
+        if self._payload_spool is not None:
+            self._payload_spool.close()
+
+    def set_limits(
+        self, max_control_line: int | None = None, max_payload: int | None = None
+    ) -> None:
+        """Update the protocol limits. Limits set to None are left unchanged."""
+        if max_control_line is not None:
+            if max_control_line <= 0:
+                raise ValueError(f"invalid control line limit: {max_control_line}")
+            self._max_control_line = max_control_line
+        if max_payload is not None:
+            if max_payload < 0:
+                raise ValueError(f"invalid payload limit: {max_payload}")
+            self._max_payload = max_payload
+
+    def batch_received(self) -> EventBatch:
+        """Pop and return the messages received in batch mode."""
+        batch = self._batch
+        if batch is None:
+            return EventBatch()
+        batch.flush()
+        self._batch = EventBatch()
+        return batch
+
+    def events_received(self) -> list[Event]:
+        """Pop and return the events generated by the parser."""
+        events = self._events_received
+        self._events_received = []
+        return events
+
+    def parse(self, data: bytes | bytearray) -> None:
+        self._write(data)
+        self._run()
+
+    def parse_many(self, chunks: Iterable[bytes | bytearray | memoryview]) -> None:
+        """Parse several chunks received at once.
+
+        Chunks are appended to the buffer and parsed in a single pass.
+        """
+        for data in chunks:
+            self._write(data)
+        self._run()
+
+    def parse_iter(self, data: bytes | bytearray) -> Iterator[Event]:
+        """Parse the data and yield events one by one as they are parsed.
+
+        Events are not decoded until the previous one is consumed. If the
+        iterator is not exhausted, remaining bytes are parsed on next call.
+        """
+        yield from self.events_received()
+        self._write(data)
+        while True:
+            self._streaming = True
+            try:
+                self._run()
+            finally:
+                self._streaming = False
+            if not self._events_received:
+                return
+            yield from self.events_received()
+
+    def pending(self) -> bool:
+        """Return True when the previous call stopped at the budget."""
+        return self._pending
+
+    def resume(self) -> None:
+        """Continue parsing the bytes left by the previous call."""
+        self._run()
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """Return a writable view of the parser buffer to receive bytes into."""
+        if sizehint <= 0:
+            sizehint = RECEIVE_BUFFER_SIZE
+        end = self._end
+        if len(self._data_received) - end < sizehint:
+            end = self._make_room()
+            missing = sizehint - len(self._data_received) + end
+            if missing > 0:
+                self._data_received.extend(bytes(missing))
+        self._view = memoryview(self._data_received)[end:]
+        return self._view
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """Parse the bytes written into the buffer returned by get_buffer()."""
+        assert self._view is not None, "get_buffer() was not called"
+        # Release the view so that the buffer can be resized again
+        self._view.release()
+        self._view = None
+        self._end += nbytes
+        self._run()
+
+    def _write(self, data: bytes | bytearray | memoryview) -> None:
+        """Append data to the buffer."""
+        size = len(data)
+        end = self._end
+        if len(self._data_received) - end < size:
+            end = self._make_room()
+        self._data_received[end : end + size] = data
+        self._end = end + size
+
+    def _make_room(self) -> int:
+        """Discard parsed bytes from the buffer and return the write offset."""
+        data_received = self._data_received
+        pos = self._pos
+        end = self._end
+        if pos == 0:
+            return end
+        if self._zero_copy:
+            # Payloads may still be views into the parsed bytes
+            try:
+                del data_received[:pos]
+            except BufferError:
+                self._data_received = data_received[pos:end]
+        elif pos < end:
+            # Move unparsed bytes to the start of the buffer
+            data_received[: end - pos] = data_received[pos:end]
+        self._pos = 0
+        self._end = end - pos
+        return self._end
+
+    def _run(self) -> None:
+        """Parse the bytes received until more bytes are needed."""
+        if self._closed:
+            raise ParserClosedError()
+        data_received = self._data_received
+        pos = self._pos
+        size = self._end
+        scanned = self._scanned
+        if scanned:
+            # Only search the bytes received since the previous read
+            if data_received.find(CRLF, pos + scanned, size) < 0:
+                if size - pos > self._max_control_line:
+                    self._closed = True
+                    raise LimitExceededError(
+                        "max_control_line", size - pos, self._max_control_line
+                    )
+                self._scanned = size - pos - 1
+                # Nothing can be parsed until the line is complete
+                self._pending = False
+                return
+            self._scanned = 0
+        events = self._events_received
+        streaming = self._streaming
+        ops = self._ops
+        # Each call stops once its budget of events or bytes is spent
+        max_bytes = self._max_bytes
+        events_limit = len(events) + self._max_events
+        stop = size if max_bytes >= size - pos else pos + max_bytes
+        pausing = streaming or events_limit < sys.maxsize
+        view = memoryview(data_received).toreadonly() if self._zero_copy else None
+        chunk = data_received if view is None else view
+        try:
+            while pos < stop:
+                # Pause after each event when streaming, or once the budget
+                # of events is spent
+                if pausing and ((streaming and events) or len(events) >= events_limit):
+                    break
+                if self._state == AWAITING_CONTROL_LINE:
+                    next_pos = ops[data_received[pos]](data_received, pos, size)
+                elif self._state == AWAITING_MSG_PAYLOAD:
+                    next_pos = self._parse_msg_payload(chunk, pos, size)
+                elif self._state == AWAITING_HMSG_PAYLOAD:
+                    next_pos = self._parse_hmsg_payload(chunk, pos, size)
+                else:
+                    next_pos = self._stream_payload(chunk, pos, size)
+                if next_pos == NEED_MORE_DATA:
+                    break
+                pos = next_pos
+            if self._batch is not None:
+                # Messages are copied before the buffer is modified
+                self._batch.flush()
+            # Bytes are left to parse without waiting for more data
+            self._pending = pos < size and (pos >= stop or len(events) >= events_limit)
+            # Bound the bytes buffered for an operation split across reads
+            max_control_line = self._max_control_line
+            if self._state == AWAITING_CONTROL_LINE:
+                if (
+                    size - pos > max_control_line
+                    and data_received.find(
+                        CRLF, pos, pos + max_control_line + CRLF_SIZE
+                    )
+                    < 0
+                ):
+                    raise LimitExceededError(
+                        "max_control_line", size - pos, max_control_line
+                    )
+            elif self._total_size > self._max_payload:
+                raise LimitExceededError(
+                    "max_payload", self._total_size, self._max_payload
+                )
+        except BaseException:
+            # The parser cannot be resumed after an error
+            self._closed = True
+            raise
+        finally:
+            if view is not None:
+                view.release()
+        if view is not None:
+            # Payloads may still be views into the parsed bytes, so they
+            # cannot be overwritten and are discarded once room is needed.
+            self._pos = pos
+            return
+        if pos == size:
+            # Everything was parsed: reuse the whole buffer, or drop
+            # parsed bytes when there is no spare room to preserve
+            if size == len(data_received):
+                del data_received[:pos]
+            pos = self._end = 0
+        self._pos = pos
+
+    def _parse_invalid(self, data: bytearray, pos: int, size: int) -> int:
+        raise ProtocolError()
+
+    def _parse_msg(self, data: bytearray, pos: int, size: int) -> int:
+        end = data.find(CRLF, pos, size)
+        if end < 0:
+            self._scanned = size - pos - 1
+            return NEED_MORE_DATA
+        if end - pos > self._max_control_line:
+            raise LimitExceededError(
+                "max_control_line", end - pos, self._max_control_line
+            )
+        if self._lazy or self._batched:
+            # Only the payload size is parsed, the other arguments are
+            # decoded by the event when they are first read, or once per
+            # batch.
+            sep = data.rfind(b" ", pos + 4, end)
+            if sep < 0:
+                raise ProtocolError()
+            try:
+                self._total_size = int(data[sep + 1 : end])
+            except Exception as e:
+                raise ProtocolError() from e
+            self._lazy_args = bytes(data[pos + 4 : sep])
+            self._state = AWAITING_MSG_PAYLOAD
+            return end + CRLF_SIZE
+        line_cache = self._control_line_cache
+        line_key = b""
+        if line_cache is not None:
+            # Repeated control lines are not parsed again.
+            line_key = bytes(data[pos:end])
+            line_args = line_cache.get(line_key)
+            if line_args is not None:
+                (
+                    self._subject,
+                    self._sid,
+                    self._reply_to,
+                    _,
+                    self._total_size,
+                ) = line_args
+                self._state = AWAITING_MSG_PAYLOAD
+                return end + CRLF_SIZE
+        args = data[pos + 4 : end].split(b" ")
+        if len(args) == 4:
+            raw_subject, raw_sid, raw_reply_to, raw_total_size = args
+        elif len(args) == 3:
+            raw_reply_to = b""
+            raw_subject, raw_sid, raw_total_size = args
+        else:
+            raise ProtocolError()
+        try:
+            self._sid = int(raw_sid)
+            self._total_size = int(raw_total_size)
+        except Exception as e:
+            raise ProtocolError() from e
+        subject_cache = self._subject_cache
+        if subject_cache is None:
+            self._subject = raw_subject.decode()
+            self._reply_to = raw_reply_to.decode()
+        else:
+            self._subject = subject_cache.decode(raw_subject)
+            self._reply_to = subject_cache.decode(raw_reply_to) if raw_reply_to else ""
+        if line_cache is not None:
+            line_cache.put(
+                line_key,
+                (self._subject, self._sid, self._reply_to, 0, self._total_size),
+            )
+        self._state = AWAITING_MSG_PAYLOAD
+        return end + CRLF_SIZE
+
+    def _parse_hmsg(self, data: bytearray, pos: int, size: int) -> int:
+        end = data.find(CRLF, pos, size)
+        if end < 0:
+            self._scanned = size - pos - 1
+            return NEED_MORE_DATA
+        if end - pos > self._max_control_line:
+            raise LimitExceededError(
+                "max_control_line", end - pos, self._max_control_line
+            )
+        if self._lazy or self._batched:
+            sep = data.rfind(b" ", pos + 5, end)
+            header_sep = data.rfind(b" ", pos + 5, sep)
+            if sep < 0 or header_sep < 0:
+                raise ProtocolError()
+            try:
+                self._header_size = int(data[header_sep + 1 : sep])
+                self._total_size = int(data[sep + 1 : end])
+            except Exception as e:
+                raise ProtocolError() from e
+            self._lazy_args = bytes(data[pos + 5 : header_sep])
+            self._state = AWAITING_HMSG_PAYLOAD
+            return end + CRLF_SIZE
+        line_cache = self._control_line_cache
+        line_key = b""
+        if line_cache is not None:
+            line_key = bytes(data[pos:end])
+            line_args = line_cache.get(line_key)
+            if line_args is not None:
+                (
+                    self._subject,
+                    self._sid,
+                    self._reply_to,
+                    self._header_size,
+                    self._total_size,
+                ) = line_args
+                self._state = AWAITING_HMSG_PAYLOAD
+                return end + CRLF_SIZE
+        args = data[pos + 5 : end].split(b" ")
+        if len(args) == 5:
+            raw_subject, raw_sid, raw_reply_to, raw_header_size, raw_total_size = args
+        elif len(args) == 4:
+            raw_reply_to = b""
+            raw_subject, raw_sid, raw_header_size, raw_total_size = args
+        else:
+            raise ProtocolError()
+        try:
+            self._header_size = int(raw_header_size)
+            self._total_size = int(raw_total_size)
+            self._sid = int(raw_sid)
+        except Exception as e:
+            raise ProtocolError() from e
+        subject_cache = self._subject_cache
+        if subject_cache is None:
+            self._subject = raw_subject.decode()
+            self._reply_to = raw_reply_to.decode()
+        else:
+            self._subject = subject_cache.decode(raw_subject)
+            self._reply_to = subject_cache.decode(raw_reply_to) if raw_reply_to else ""
+        if line_cache is not None:
+            line_cache.put(
+                line_key,
+                (
+                    self._subject,
+                    self._sid,
+                    self._reply_to,
+                    self._header_size,
+                    self._total_size,
+                ),
+            )
+        self._state = AWAITING_HMSG_PAYLOAD
+        return end + CRLF_SIZE
+
+    def _parse_ping_or_pong(self, data: bytearray, pos: int, size: int) -> int:
+        if size - pos < PING_OR_PONG_OP_LEN:
+            return NEED_MORE_DATA
+        op = data[pos : pos + PING_OR_PONG_OP_LEN]
+        if op == PING_OP:
+            if self._on_ping is None:
+                self._events_received.append(PING_EVENT)
+            else:
+                self._on_ping()
+        elif op == PONG_OP:
+            if self._on_pong is None:
+                self._events_received.append(PONG_EVENT)
+            else:
+                self._on_pong()
+        else:
+            raise ProtocolError()
+        return pos + PING_OR_PONG_OP_LEN
+
+    def _parse_info(self, data: bytearray, pos: int, size: int) -> int:
+        end = data.find(CRLF, pos, size)
+        if end < 0:
+            self._scanned = size - pos - 1
+            return NEED_MORE_DATA
+        if end - pos > self._max_control_line:
+            raise LimitExceededError(
+                "max_control_line", end - pos, self._max_control_line
+            )
+        try:
+            self._events_received.append(
+                parse_info(data[pos + 5 : end], self._json_loads, self._lazy_info)
+            )
+        except Exception as e:
+            raise ProtocolError() from e
+        return end + CRLF_SIZE
+
+    def _parse_ok(self, data: bytearray, pos: int, size: int) -> int:
+        if size - pos < OK_OP_LEN:
+            return NEED_MORE_DATA
+        if data[pos : pos + OK_OP_LEN] != OK_OP:
+            raise ProtocolError()
+        self._events_received.append(OK_EVENT)
+        return pos + OK_OP_LEN
+
+    def _parse_err(self, data: bytearray, pos: int, size: int) -> int:
+        end = data.find(CRLF, pos, size)
+        if end < 0:
+            self._scanned = size - pos - 1
+            return NEED_MORE_DATA
+        if end - pos > self._max_control_line:
+            raise LimitExceededError(
+                "max_control_line", end - pos, self._max_control_line
+            )
+        msg = data[pos + 5 : end].decode()
+        if msg[0] != "'":
+            raise ProtocolError()
+        if msg[-1] != "'":
+            raise ProtocolError()
+        self._events_received.append(ErrorEvent(msg[1:-1].lower()))
+        return end + CRLF_SIZE
+
+    def _parse_msg_payload(
+        self, chunk: bytearray | memoryview, pos: int, size: int
+    ) -> int:
+        total_size = self._total_size
+        if total_size > self._max_payload:
+            raise LimitExceededError("max_payload", total_size, self._max_payload)
+        if total_size > self._large_payload_threshold:
+            # The payload is passed to the sink as it is received.
+            if self._lazy:
+                self._sid = parse_msg_args(self._lazy_args)[0]
+            elif self._batched:
+                self._sid, self._subject, self._reply_to = parse_msg_args(
+                    self._lazy_args
+                )
+            self._streamed_header = None
+            self._payload_remaining = total_size
+            self._state = STREAMING_PAYLOAD
+            return pos
+        if size - pos < total_size + CRLF_SIZE:
+            return NEED_MORE_DATA
+        self._state = AWAITING_CONTROL_LINE
+        if self._batched:
+            assert self._batch is not None
+            self._batch.append_range(
+                self._lazy_args, self._data_received, pos, 0, total_size
+            )
+            return pos + total_size + CRLF_SIZE
+        payload = chunk[pos : pos + total_size]
+        self._dispatch(payload, None)
+        return pos + total_size + CRLF_SIZE
+
+    def _parse_hmsg_payload(
+        self, chunk: bytearray | memoryview, pos: int, size: int
+    ) -> int:
+        header_size = self._header_size
+        total_size = self._total_size
+        if total_size > self._max_payload:
+            raise LimitExceededError("max_payload", total_size, self._max_payload)
+        if total_size - header_size > self._large_payload_threshold:
+            # Only the header is buffered, the payload is passed to the
+            # sink as it is received.
+            if size - pos < header_size:
+                return NEED_MORE_DATA
+            if chunk[pos + header_size - 4 : pos + header_size] != STOP_HEADER:
+                raise ProtocolError()
+            if self._lazy:
+                self._sid = parse_msg_args(self._lazy_args)[0]
+            elif self._batched:
+                self._sid, self._subject, self._reply_to = parse_msg_args(
+                    self._lazy_args
+                )
+            self._streamed_header = chunk[pos : pos + header_size - 4]
+            self._payload_remaining = total_size - header_size
+            self._state = STREAMING_PAYLOAD
+            return pos + header_size
+        if size - pos < total_size + CRLF_SIZE:
+            return NEED_MORE_DATA
+        if chunk[pos + header_size - 4 : pos + header_size] != STOP_HEADER:
+            raise ProtocolError()
+        self._state = AWAITING_CONTROL_LINE
+        if self._batched:
+            assert self._batch is not None
+            self._batch.append_range(
+                self._lazy_args, self._data_received, pos, header_size, total_size
+            )
+            return pos + total_size + CRLF_SIZE
+        header = chunk[pos : pos + header_size - 4]
+        payload = chunk[pos + header_size : pos + total_size]
+        self._dispatch(payload, header)
+        return pos + total_size + CRLF_SIZE
+
+    def _stream_payload(
+        self, chunk: bytearray | memoryview, pos: int, size: int
+    ) -> int:
+        remaining = self._payload_remaining
+        if remaining:
+            # Payload bytes are not kept in the buffer
+            chunk_size = min(size - pos, remaining)
+            remaining = self._payload_remaining = remaining - chunk_size
+            assert self._on_payload_chunk is not None
+            self._on_payload_chunk(
+                self._sid, chunk[pos : pos + chunk_size], not remaining
+            )
+            return pos + chunk_size
+        if size - pos < CRLF_SIZE:
+            return NEED_MORE_DATA
+        self._state = AWAITING_CONTROL_LINE
+        # The message is delivered with an empty payload
+        header = self._streamed_header
+        self._streamed_header = None
+        spool = self._payload_spool
+        self._dispatch(chunk[pos:pos] if spool is None else spool.release(), header)
+        return pos + CRLF_SIZE
+
+    def _dispatch(
+        self,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview | None,
+    ) -> None:
+        """Deliver a message to a callback, to the batch or as an event."""
+        if self._lazy:
+            if header is None:
+                self._events_received.append(LazyMsgEvent(self._lazy_args, payload))
+            else:
+                self._events_received.append(
+                    LazyHMsgEvent(self._lazy_args, payload, header)
+                )
+            return
+        sid = self._sid
+        handlers = self._handlers
+        handler = handlers.get(sid) if handlers is not None else None
+        if handler is not None:
+            handler(
+                self._subject,
+                self._reply_to,
+                payload,
+                EMPTY_HEADER if header is None else header,
+            )
+        elif self._on_msg is not None:
+            self._on_msg(
+                sid,
+                self._subject,
+                self._reply_to,
+                payload,
+                EMPTY_HEADER if header is None else header,
+            )
+        elif self._batch is not None:
+            self._batch.append(sid, self._subject, self._reply_to, payload, header)
+        elif header is None:
+            self._events_received.append(
+                self._new_msg(sid, self._subject, self._reply_to, payload)
+            )
+        else:
+            self._events_received.append(
+                self._new_hmsg(sid, self._subject, self._reply_to, payload, header)
+            )
+
+
+if TYPE_CHECKING:
+    from .common import Parser as ParserProtocol
+
+    # Verify that Parser implements ParserProtocol
+    parser: ParserProtocol = ParserSM()
@@ -0,0 +1,508 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from importlib.util import find_spec
+from typing import Awaitable, Callable
+
+import pytest
+from benchmarks.data_factory import info
+from benchmarks.server import STREAM_SUBJECT, StandInServer
+from connection import (
+    Connection,
+    ConnectionClosedError,
+    RttHistogram,
+    ServerError,
+    StaleConnectionError,
+    WriteBufferFullError,
+)
+from protocol import Backend
+
+BACKENDS = [
+    Backend.PARSER_300,
+    Backend.PARSER_310,
+    Backend.PARSER_RE,
+    Backend.PARSER_NUMPY,
+    Backend.PARSER_SM,
+]
+
+
+def skip_unavailable(backend: Backend) -> None:
+    if sys.version_info < (3, 10) and backend == Backend.PARSER_310:
+        pytest.skip("Parser 3.10 is not available in this Python version")
+    if backend == Backend.PARSER_NUMPY and find_spec("numpy") is None:
+        pytest.skip("Parser NumPy requires numpy")
+
+
+ClientHandler = Callable[[asyncio.StreamReader, asyncio.StreamWriter], Awaitable[None]]
+
+
+def run_with_server(
+    handle_client: ClientHandler,
+    test: Callable[[int], Awaitable[None]],
+) -> None:
+    async def main() -> None:
+        listener = await asyncio.start_server(handle_client, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            await asyncio.wait_for(test(port), 5)
+
+    asyncio.run(main())
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestConnection:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+
+    def test_publish_and_subscribe(self) -> None:
+        received: list[tuple[str, str, bytes]] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, name="test")
+            await connection.connect(port=port)
+            assert connection.server_info is not None
+            connection.subscribe(
+                "foo",
+                lambda subject, reply_to, payload, header: received.append(
+                    (subject, reply_to, bytes(payload))
+                ),
+            )
+            connection.publish("foo", b"hello")
+            connection.publish("foo", b"world", reply_to="bar")
+            connection.publish("other", b"ignored")
+            await connection.flush()
+            await connection.close()
+            assert connection.is_closed
+            with pytest.raises(ConnectionClosedError):
+                connection.publish("foo", b"closed")
+
+        run_with_server(StandInServer().handle_client, test)
+        assert received == [("foo", "", b"hello"), ("foo", "bar", b"world")]
+
+    def test_publish_with_header(self) -> None:
+        received: list[tuple[bytes, bytes]] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            connection.subscribe(
+                "foo",
+                lambda subject, reply_to, payload, header: received.append(
+                    (bytes(header), bytes(payload))
+                ),
+            )
+            connection.publish("foo", b"hello", header=b"NATS/1.0\r\nfoo: bar\r\n\r\n")
+            await connection.flush()
+            await connection.close()
+
+        run_with_server(StandInServer().handle_client, test)
+        # Parsers strip the empty line ending the header
+        assert received == [(b"NATS/1.0\r\nfoo: bar", b"hello")]
+
+    def test_subscribe_invalid_subject(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            with pytest.raises(ValueError):
+                connection.subscribe(
+                    "foo bar", lambda subject, reply_to, payload, header: None
+                )
+            await connection.close()
+
+        run_with_server(StandInServer().handle_client, test)
+
+    @pytest.mark.parametrize("zero_copy", [False, True])
+    def test_receive_stream(self, zero_copy: bool) -> None:
+        received: list[bytes] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(
+                self.backend, zero_copy=zero_copy, max_bytes_per_read=256
+            )
+            await connection.connect(port=port)
+            sid = connection.subscribe(
+                STREAM_SUBJECT,
+                lambda subject, reply_to, payload, header: received.append(
+                    bytes(payload)
+                ),
+            )
+            await connection.flush()
+            connection.unsubscribe(sid)
+            await connection.close()
+
+        run_with_server(StandInServer(1000, 64).handle_client, test)
+        assert received == [b"x" * 64] * 1000
+
+    def test_publish_is_coalesced(self) -> None:
+        received: list[bytes] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, flush_threshold=1024)
+            await connection.connect(port=port)
+            connection.subscribe(
+                "foo",
+                lambda subject, reply_to, payload, header: received.append(
+                    bytes(payload)
+                ),
+            )
+            await connection.flush()
+            for i in range(10):
+                connection.publish("foo", b"%d" % i)
+            # Operations are written on the next iteration of the event loop
+            assert connection.pending_size == 10 * len(b"PUB foo 1\r\n0\r\n")
+            await asyncio.sleep(0)
+            assert connection.pending_size == 0
+            # Or once the threshold is reached
+            connection.publish("foo", b"x" * 1024)
+            assert connection.pending_size == 0
+            await connection.flush()
+            await connection.close()
+
+        run_with_server(StandInServer().handle_client, test)
+        assert received == [b"%d" % i for i in range(10)] + [b"x" * 1024]
+
+    def test_publish_backpressure(self) -> None:
+        reading = asyncio.Event()
+
+        async def test(port: int) -> None:
+            connection = Connection(
+                self.backend, flush_threshold=1024, max_pending_size=64 * 1024
+            )
+            await connection.connect(port=port)
+            payload = b"x" * 32 * 1024
+            with pytest.raises(WriteBufferFullError):
+                # Socket buffers fill up since the server does not read
+                for _ in range(100_000):
+                    connection.publish("foo", payload)
+            with pytest.raises(WriteBufferFullError):
+                connection.publish("foo", payload)
+            reading.set()
+            await connection.drain()
+            connection.publish("foo", payload)
+            await connection.flush()
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reading.wait()
+            while True:
+                data = await reader.read(1024 * 1024)
+                if not data:
+                    break
+                if data.endswith(b"PING\r\n"):
+                    writer.write(b"PONG\r\n")
+
+        run_with_server(handle_client, test)
+
+    def test_invalid_write_buffer_limits(self) -> None:
+        with pytest.raises(ValueError):
+            Connection(self.backend, flush_threshold=0)
+        with pytest.raises(ValueError):
+            Connection(self.backend, flush_threshold=1024, max_pending_size=512)
+
+    @pytest.mark.parametrize("header", [b"", b"NATS/1.0\r\nfoo: bar\r\n\r\n"])
+    @pytest.mark.parametrize("writelines", [False, True])
+    def test_publish_large_payload(
+        self, header: bytes, writelines: bool, monkeypatch: pytest.MonkeyPatch
+    ) -> None:
+        monkeypatch.setattr("connection.connection.WRITELINES_SENDMSG", writelines)
+        received: list[bytes] = []
+        payloads = [b"a" * 10, b"b" * 100_000, b"c" * 10, b"d" * 2 * 1024 * 1024]
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, large_payload_threshold=1024)
+            await connection.connect(port=port)
+            connection.subscribe(
+                "foo",
+                lambda subject, reply_to, payload, header: received.append(
+                    bytes(payload)
+                ),
+            )
+            for payload in payloads:
+                connection.publish("foo", payload, header=header)
+                if len(payload) >= 1024:
+                    # Large payloads are written along with pending operations
+                    assert connection.pending_size == 0
+                else:
+                    assert connection.pending_size > 0
+            await connection.flush()
+            await connection.close()
+
+        run_with_server(StandInServer().handle_client, test)
+        assert received == payloads
+
+    def test_publish_max_payload(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            with pytest.raises(ValueError):
+                connection.publish("foo", b"x" * 65)
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info(max_payload=64).encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+
+    def test_publish_without_max_payload(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            connection.publish("foo", b"x" * 1024)
+            await connection.flush()
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            raw_info = json.loads(info()[5:])
+            del raw_info["max_payload"]
+            writer.write(f"INFO {json.dumps(raw_info)}\r\n".encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+
+    def test_server_ping_is_answered(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            await connection.flush()
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            line = await reader.readuntil(b"\r\n")
+            assert json.loads(line[8:])["verbose"] is False
+            assert await reader.readuntil(b"\r\n") == b"PING\r\n"
+            writer.write(b"PONG\r\nPING\r\n")
+            assert await reader.readuntil(b"\r\n") == b"PONG\r\n"
+            assert await reader.readuntil(b"\r\n") == b"PING\r\n"
+            writer.write(b"PONG\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+
+    def test_server_ping_is_answered_before_messages(self) -> None:
+        pongs: list[bytes] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            await connection.connect(port=port)
+            received = asyncio.Event()
+            connection.subscribe(
+                "foo", lambda subject, reply_to, payload, header: received.set()
+            )
+            await connection.flush()
+            # The server sends two messages then a PING in a single write
+            connection.publish("trigger")
+            await received.wait()
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.readuntil(b"PUB trigger 0\r\n\r\n")
+            writer.write(b"PING\r\nMSG foo 1 0\r\n\r\n")
+            pongs.append(await reader.readuntil(b"\r\n"))
+            await reader.read()
+
+        run_with_server(handle_client, test)
+        assert pongs == [b"PONG\r\n"]
+
+    def test_keepalive(self) -> None:
+        pings = 0
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, ping_interval=0.01)
+            await connection.connect(port=port)
+            assert len(connection.rtt_histogram) == 1
+            await asyncio.sleep(0.1)
+            # The PONG of each PING sent on the interval is measured
+            assert len(connection.rtt_histogram) >= 3
+            assert not connection.is_closed
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            nonlocal pings
+            writer.write(info().encode())
+            while True:
+                try:
+                    await reader.readuntil(b"PING\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                pings += 1
+                writer.write(b"PONG\r\n")
+
+        run_with_server(handle_client, test)
+        assert pings >= 3
+
+    def test_stale_connection(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(
+                self.backend, ping_interval=0.01, max_outstanding_pings=3
+            )
+            await connection.connect(port=port)
+            # The flush PING is outstanding along with the interval PINGs
+            with pytest.raises(StaleConnectionError):
+                await connection.flush()
+            assert connection.is_closed
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            # Only the handshake PING is answered
+            writer.write(b"PONG\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+
+    def test_invalid_keepalive(self) -> None:
+        with pytest.raises(ValueError):
+            Connection(self.backend, ping_interval=0)
+        with pytest.raises(ValueError):
+            Connection(self.backend, max_outstanding_pings=0)
+
+    def test_server_error_during_handshake(self) -> None:
+        async def test(port: int) -> None:
+            connection = Connection(self.backend)
+            with pytest.raises(ServerError) as exc_info:
+                await connection.connect(port=port)
+            assert exc_info.value.message == "authorization violation"
+            assert connection.is_closed
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"-ERR 'Authorization Violation'\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+
+    def test_non_fatal_server_error(self) -> None:
+        errors: list[ServerError] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, on_error=errors.append)
+            await connection.connect(port=port)
+            connection.publish("foo", b"denied")
+            await connection.flush()
+            assert not connection.is_closed
+            assert connection.last_error is errors[0]
+            await connection.close()
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.readuntil(b"PING\r\n")
+            writer.write(
+                b"-ERR 'Permissions Violation for Publish to \"foo\"'\r\nPONG\r\n"
+            )
+            await reader.read()
+
+        run_with_server(handle_client, test)
+        assert [error.message for error in errors] == [
+            'permissions violation for publish to "foo"'
+        ]
+
+    def test_fatal_server_error(self) -> None:
+        errors: list[ServerError] = []
+
+        async def test(port: int) -> None:
+            connection = Connection(self.backend, on_error=errors.append)
+            await connection.connect(port=port)
+            with pytest.raises(ServerError) as exc_info:
+                await connection.flush()
+            assert exc_info.value.message == "stale connection"
+            assert connection.is_closed
+
+        async def handle_client(
+            reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+        ) -> None:
+            writer.write(info().encode())
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"PONG\r\n")
+            await reader.readuntil(b"PING\r\n")
+            writer.write(b"-ERR 'Stale Connection'\r\n")
+            await reader.read()
+
+        run_with_server(handle_client, test)
+        assert errors == []
+
+
+class TestRttHistogram:
+    def test_observe(self) -> None:
+        histogram = RttHistogram(bounds=(0.001, 0.01))
+        assert histogram.last is None
+        for rtt in (0.0005, 0.001, 0.005, 0.5):
+            histogram.observe(rtt)
+        assert len(histogram) == 4
+        assert histogram.last == 0.5
+        assert histogram.buckets() == [(0.001, 2), (0.01, 1), (float("inf"), 1)]
+        assert histogram.mean() == pytest.approx(0.126625)
+        assert histogram.percentile(0) == 0.0005
+        assert histogram.percentile(50) == 0.005
+        assert histogram.percentile(100) == 0.5
+
+    def test_window(self) -> None:
+        histogram = RttHistogram(window=2, bounds=(0.001, 0.01))
+        for rtt in (0.0005, 0.005, 0.5):
+            histogram.observe(rtt)
+        # The oldest sample was evicted
+        assert len(histogram) == 2
+        assert histogram.buckets() == [(0.001, 0), (0.01, 1), (float("inf"), 1)]
+        histogram.clear()
+        assert len(histogram) == 0
+        assert histogram.mean() == 0.0
+        assert histogram.buckets() == [(0.001, 0), (0.01, 0), (float("inf"), 0)]
+
+    def test_invalid(self) -> None:
+        with pytest.raises(ValueError):
+            RttHistogram(window=0)
+        with pytest.raises(ValueError):
+            RttHistogram(bounds=())
+        with pytest.raises(ValueError):
+            RttHistogram(bounds=(0.01, 0.001))
+        with pytest.raises(ValueError):
+            RttHistogram().percentile(101)
+
+    def test_repr(self) -> None:
+        histogram = RttHistogram()
+        assert repr(histogram) == "RttHistogram(window=128, size=0, last=-)"
+        histogram.observe(0.0015)
+        assert repr(histogram) == "RttHistogram(window=128, size=1, last=1.500ms)"
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+from protocol import encoder
+from protocol.encoder import (
+    encode_connect,
+    encode_hpub,
+    encode_hpub_control_line,
+    encode_ping,
+    encode_pong,
+    encode_pub,
+    encode_pub_control_line,
+    encode_sub,
+    encode_unsub,
+)
+
+
+def test_encode_pub() -> None:
+    buf = bytearray()
+    encode_pub(buf, "foo", b"hello")
+    assert buf == b"PUB foo 5\r\nhello\r\n"
+
+
+def test_encode_pub_empty() -> None:
+    buf = bytearray()
+    encode_pub(buf, "foo")
+    assert buf == b"PUB foo 0\r\n\r\n"
+
+
+def test_encode_pub_with_reply() -> None:
+    buf = bytearray()
+    encode_pub(buf, "foo", b"hello", reply_to="bar")
+    encode_pub(buf, "foo", memoryview(b"world"))
+    assert buf == b"PUB foo bar 5\r\nhello\r\nPUB foo 5\r\nworld\r\n"
+
+
+def test_encode_pub_large_payload() -> None:
+    buf = bytearray()
+    payload = b"x" * (encoder.SIZE_TABLE_SIZE + 1)
+    encode_pub(buf, "foo", payload)
+    assert buf == b"PUB foo %d\r\n%s\r\n" % (len(payload), payload)
+
+
+@pytest.mark.parametrize("subject", ["", "foo bar", " foo", "foo\t", "foo\r\n"])
+def test_encode_pub_invalid_subject(subject: str) -> None:
+    buf = bytearray()
+    with pytest.raises(ValueError) as exc:
+        encode_pub(buf, subject, b"hello")
+    assert exc.match("nats: invalid subject")
+    assert buf == b""
+
+
+def test_encode_pub_invalid_reply_subject() -> None:
+    with pytest.raises(ValueError) as exc:
+        encode_pub(bytearray(), "foo", b"hello", reply_to="bar baz")
+    assert exc.match("nats: invalid reply subject")
+
+
+def test_encode_pub_prefix_cache_is_bounded(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(encoder, "PREFIX_CACHE_SIZE", 2)
+    monkeypatch.setattr(encoder, "_pub_prefixes", {})
+    buf = bytearray()
+    for subject in ["a", "b", "c", "a"]:
+        encode_pub(buf, subject, b"x")
+    assert len(encoder._pub_prefixes) == 2  # pyright: ignore[reportPrivateUsage]
+    assert buf == b"PUB a 1\r\nx\r\nPUB b 1\r\nx\r\nPUB c 1\r\nx\r\nPUB a 1\r\nx\r\n"
+
+
+def test_encode_hpub() -> None:
+    buf = bytearray()
+    header = b"NATS/1.0\r\nfoo: bar\r\n\r\n"
+    encode_hpub(buf, "foo", header, b"hello")
+    encode_hpub(buf, "foo", header, reply_to="bar")
+    assert buf == (
+        b"HPUB foo 22 27\r\nNATS/1.0\r\nfoo: bar\r\n\r\nhello\r\n"
+        b"HPUB foo bar 22 22\r\nNATS/1.0\r\nfoo: bar\r\n\r\n\r\n"
+    )
+
+
+def test_encode_pub_control_line() -> None:
+    buf = bytearray()
+    encode_pub_control_line(buf, "foo", 5)
+    encode_pub_control_line(buf, "foo", 1024 * 1024, reply_to="bar")
+    assert buf == b"PUB foo 5\r\nPUB foo bar 1048576\r\n"
+
+
+def test_encode_hpub_control_line() -> None:
+    buf = bytearray()
+    encode_hpub_control_line(buf, "foo", 22, 5)
+    encode_hpub_control_line(buf, "foo", 22, 0, reply_to="bar")
+    assert buf == b"HPUB foo 22 27\r\nHPUB foo bar 22 22\r\n"
+
+
+def test_encode_sub() -> None:
+    buf = bytearray()
+    encode_sub(buf, "foo", 1)
+    encode_sub(buf, "foo", 100_000, queue="workers")
+    assert buf == b"SUB foo 1\r\nSUB foo workers 100000\r\n"
+
+
+def test_encode_sub_negative_sid() -> None:
+    buf = bytearray()
+    with pytest.raises(ValueError) as exc:
+        encode_sub(buf, "foo", -1)
+    assert exc.match("nats: invalid sid")
+    assert buf == b""
+
+
+def test_encode_sub_invalid_queue() -> None:
+    with pytest.raises(ValueError) as exc:
+        encode_sub(bytearray(), "foo", 1, queue="a b")
+    assert exc.match("nats: invalid queue group")
+
+
+def test_encode_unsub() -> None:
+    buf = bytearray()
+    encode_unsub(buf, 1)
+    encode_unsub(buf, 2, max_msgs=10)
+    assert buf == b"UNSUB 1\r\nUNSUB 2 10\r\n"
+
+
+def test_encode_connect() -> None:
+    buf = bytearray()
+    encode_connect(buf, {"verbose": False, "name": "test"})
+    assert buf.startswith(b"CONNECT ")
+    assert buf.endswith(b"\r\n")
+    assert json.loads(buf[8:]) == {"verbose": False, "name": "test"}
+
+
+def test_encode_ping_pong() -> None:
+    buf = bytearray()
+    encode_ping(buf)
+    encode_pong(buf)
+    assert buf == b"PING\r\nPONG\r\n"
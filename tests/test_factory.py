@@ -34,6 +34,17 @@ def test_make_parser_re() -> None:
     assert type(parser).__name__ == "ParserRE"
 
 
+def test_make_parser_sm() -> None:
+    parser = make_parser(Backend.PARSER_SM)
+    assert type(parser).__name__ == "ParserSM"
+
+
+def test_make_parser_numpy() -> None:
+    pytest.importorskip("numpy")
+    parser = make_parser(Backend.PARSER_NUMPY)
+    assert type(parser).__name__ == "ParserNumpy"
+
+
 def test_make_parser_invalid() -> None:
     with pytest.raises(ValueError) as exc:
         make_parser("invalid")  # type: ignore
@@ -1,22 +1,57 @@
 from __future__ import annotations
 
 import json
+import random
+import socket
 import sys
+from collections import deque
+from importlib.util import find_spec
+from pathlib import Path
 
 import pytest
 from protocol import Backend, make_parser
 from protocol.common import (
+    EMPTY_HEADER,
     OK_EVENT,
     PING_EVENT,
     PONG_EVENT,
+    ControlLineCache,
     ErrorEvent,
+    Event,
+    EventBatch,
+    EventPool,
     HMsgEvent,
     InfoEvent,
+    LimitExceededError,
+    LazyHMsgEvent,
+    LazyInfoEvent,
+    LazyMsgEvent,
     MsgEvent,
+    Operation,
     ParserClosedError,
+    PayloadSpool,
     ProtocolError,
+    SubjectCache,
     Version,
+    parse_info,
 )
+from protocol.parser_re import ParserRE
+
+
+BACKENDS = [
+    Backend.PARSER_300,
+    Backend.PARSER_310,
+    Backend.PARSER_RE,
+    Backend.PARSER_NUMPY,
+    Backend.PARSER_SM,
+]
+
+
+def skip_unavailable(backend: Backend) -> None:
+    if sys.version_info < (3, 10) and backend == Backend.PARSER_310:
+        pytest.skip("Parser 3.10 is not available in this Python version")
+    if backend == Backend.PARSER_NUMPY and find_spec("numpy") is None:
+        pytest.skip("Parser NumPy requires numpy")
 
 
 def make_server_info(
@@ -92,7 +127,7 @@ def make_server_info(
 
 @pytest.mark.parametrize(
     "backend",
-    [Backend.PARSER_300, Backend.PARSER_310, Backend.PARSER_RE],
+    BACKENDS,
 )
 class TestParserBasic:
     def skip_if(self, backend: str, reason: str) -> None:
@@ -102,8 +137,7 @@ class TestParserBasic:
     @pytest.fixture(autouse=True)
     def setup(self, backend: Backend) -> None:
         self.backend = backend
-        if sys.version_info < (3, 10) and backend == Backend.PARSER_310:
-            pytest.skip("Parser 3.10 is not available in this Python version")
+        skip_unavailable(backend)
         self.parser = make_parser(backend)
 
     @pytest.mark.parametrize(
@@ -625,6 +659,44 @@ class TestParserBasic:
             ErrorEvent(message="the other error message"),
         ]
 
+    @pytest.mark.parametrize(
+        "data",
+        [
+            [
+                b"+OK\r\nMSG the.subject 1 5\r\nhello\r\nPING\r\n"
+                b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+                b"-ERR 'the error message'\r\nPONG\r\n"
+            ],
+            [
+                b"+OK\r\nMSG the.subject 1 5\r\nhel",
+                b"lo\r\nPING\r\nHMSG the.subject 2 12 17\r\nNATS/1.0\r\n",
+                b"\r\nworld\r\n-ERR 'the error message'\r\nPONG\r\n",
+            ],
+        ],
+    )
+    def test_parse_coalesced_ops(self, data: list[bytes]):
+        for chunk in data:
+            self.parser.parse(chunk)
+        assert self.parser.events_received() == [
+            OK_EVENT,
+            MsgEvent(
+                sid=1,
+                subject="the.subject",
+                reply_to="",
+                payload=bytearray(b"hello"),
+            ),
+            PING_EVENT,
+            HMsgEvent(
+                sid=2,
+                subject="the.subject",
+                reply_to="",
+                payload=bytearray(b"world"),
+                header=bytearray(b"NATS/1.0"),
+            ),
+            ErrorEvent(message="the error message"),
+            PONG_EVENT,
+        ]
+
     @pytest.mark.parametrize("data", [[b"invalid\r\n"]])
     def test_error_invalid_string(self, data: list[bytes]):
         with pytest.raises(ProtocolError) as exc:
@@ -970,3 +1042,1275 @@ class TestParserRepr:
     def test_parser_re_repr(self) -> None:
         parser = make_parser(Backend.PARSER_RE)
         assert repr(parser) == "<nats protocol parser backend=re>"
+
+    def test_parser_sm_repr(self) -> None:
+        parser = make_parser(Backend.PARSER_SM)
+        assert repr(parser) == "<nats protocol parser backend=sm>"
+
+    def test_parser_numpy_repr(self) -> None:
+        skip_unavailable(Backend.PARSER_NUMPY)
+        parser = make_parser(Backend.PARSER_NUMPY)
+        assert repr(parser) == "<nats protocol parser backend=numpy>"
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserZeroCopy:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.parser = make_parser(backend, zero_copy=True)
+
+    def test_parse_msg_payload_is_readonly_view(self) -> None:
+        self.parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+        [event] = self.parser.events_received()
+        assert isinstance(event, MsgEvent)
+        assert isinstance(event.payload, memoryview)
+        assert event.payload.readonly
+        assert event.payload == b"hello"
+
+    def test_parse_hmsg_header_and_payload_are_readonly_views(self) -> None:
+        self.parser.parse(b"HMSG the.subject 1 12 17\r\nNATS/1.0\r\n\r\nhello\r\n")
+        [event] = self.parser.events_received()
+        assert isinstance(event, HMsgEvent)
+        assert isinstance(event.header, memoryview)
+        assert isinstance(event.payload, memoryview)
+        assert event.header.readonly
+        assert event.payload.readonly
+        assert event.header == b"NATS/1.0"
+        assert event.payload == b"hello"
+
+    def test_parse_while_views_are_alive(self) -> None:
+        self.parser.parse(b"MSG the.subject 1 5\r\nhello\r\nMSG the.subject 2 5\r\nwor")
+        self.parser.parse(b"ld\r\nPING\r\n")
+        self.parser.parse(b"HMSG the.subject 3 12 13\r\nNATS/1.0\r\n\r\n!\r\n")
+        assert self.parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            MsgEvent(2, "the.subject", "", bytearray(b"world")),
+            PING_EVENT,
+            HMsgEvent(3, "the.subject", "", bytearray(b"!"), bytearray(b"NATS/1.0")),
+        ]
+
+    def test_copy_outlives_release(self) -> None:
+        self.parser.parse(
+            b"MSG the.subject 1 5\r\nhello\r\n"
+            b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+        )
+        events = self.parser.events_received()
+        copies = [event.copy() for event in events if isinstance(event, MsgEvent)]
+        copies += [event.copy() for event in events if isinstance(event, HMsgEvent)]
+        for event in events:
+            event.release()
+        assert isinstance(events[0], MsgEvent)
+        with pytest.raises(ValueError):
+            bytes(events[0].payload)
+        assert copies == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            HMsgEvent(
+                2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+            ),
+        ]
+        assert isinstance(copies[0].payload, bytearray)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("zero_copy", [False, True])
+class TestParserBufferedProtocol:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend, zero_copy: bool) -> None:
+        skip_unavailable(backend)
+        self.parser = make_parser(backend, zero_copy=zero_copy)
+
+    def receive(self, data: bytes, sizehint: int = -1) -> None:
+        while data:
+            buffer = self.parser.get_buffer(sizehint)
+            assert len(buffer) >= max(sizehint, 1)
+            nbytes = min(len(buffer), len(data))
+            buffer[:nbytes] = data[:nbytes]
+            self.parser.buffer_updated(nbytes)
+            data = data[nbytes:]
+
+    @pytest.mark.parametrize("sizehint", [-1, 0, 1, 64, 1024])
+    def test_receive_into_buffer(self, sizehint: int) -> None:
+        stream = (
+            b"+OK\r\nMSG the.subject 1 5\r\nhello\r\nPING\r\n"
+            b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\nPONG\r\n"
+        )
+        for idx in range(0, len(stream), 7):
+            self.receive(stream[idx : idx + 7], sizehint)
+        assert self.parser.events_received() == [
+            OK_EVENT,
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            HMsgEvent(
+                2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+            ),
+            PONG_EVENT,
+        ]
+
+    def test_receive_into_buffer_and_parse(self) -> None:
+        self.receive(b"MSG the.subject 1 5\r\nhel")
+        self.parser.parse(b"lo\r\nPI")
+        self.receive(b"NG\r\nMSG the.subject 2 5\r\nworld\r\n")
+        assert self.parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            MsgEvent(2, "the.subject", "", bytearray(b"world")),
+        ]
+
+    def test_receive_keeps_spare_room(self) -> None:
+        # Payloads are kept alive, and may be views into the buffer
+        events: list[Event] = []
+        self.receive(b"PING\r\n")
+        size = buffer_size(self.parser)
+        for sid in range(64):
+            self.receive(b"MSG the.subject %d 5\r\nhello\r\n" % sid, 1024)
+            events.extend(self.parser.events_received())
+        # Parsed bytes are only discarded once the spare room is used up
+        assert buffer_size(self.parser) == size
+        assert len(events) == 65
+
+    def test_receive_into_socket(self) -> None:
+        left, right = socket.socketpair()
+        with left, right:
+            left.sendall(b"MSG the.subject 1 5\r\nhello\r\nPING\r\n")
+            nbytes = right.recv_into(self.parser.get_buffer())
+            self.parser.buffer_updated(nbytes)
+        assert self.parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+        ]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserIter:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.parser = make_parser(backend)
+
+    def test_parse_iter(self) -> None:
+        events = list(self.parser.parse_iter(b"+OK\r\nMSG the.subject 1 5\r\nhel"))
+        events += list(self.parser.parse_iter(b"lo\r\nPING\r\nPONG\r\n"))
+        assert events == [
+            OK_EVENT,
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            PONG_EVENT,
+        ]
+        assert self.parser.events_received() == []
+
+    def test_parse_iter_is_lazy(self) -> None:
+        events = self.parser.parse_iter(b"PING\r\nINFO \r\n")
+        assert next(events) == PING_EVENT
+        with pytest.raises(ProtocolError):
+            next(events)
+
+    def test_parse_iter_yields_pending_events_first(self) -> None:
+        self.parser.parse(b"PING\r\n")
+        assert list(self.parser.parse_iter(b"PONG\r\n")) == [PING_EVENT, PONG_EVENT]
+
+    def test_parse_iter_interrupted(self) -> None:
+        events = self.parser.parse_iter(b"PING\r\nPONG\r\n+OK\r\n")
+        assert next(events) == PING_EVENT
+        self.parser.parse(b"PING\r\n")
+        assert self.parser.events_received() == [PONG_EVENT, OK_EVENT, PING_EVENT]
+
+    def test_parse_iter_closed_parser(self) -> None:
+        self.parser.close()
+        with pytest.raises(ParserClosedError):
+            list(self.parser.parse_iter(b"PING\r\n"))
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserDispatch:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+        self.received: list[tuple[object, ...]] = []
+
+    def on_msg(
+        self,
+        sid: int,
+        subject: str,
+        reply_to: str,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
+    ) -> None:
+        self.received.append((sid, subject, reply_to, bytes(payload), bytes(header)))
+
+    def handler(
+        self,
+        subject: str,
+        reply_to: str,
+        payload: bytearray | memoryview,
+        header: bytearray | memoryview,
+    ) -> None:
+        self.received.append((subject, reply_to, bytes(payload), bytes(header)))
+
+    def test_dispatch_to_on_msg(self) -> None:
+        parser = make_parser(self.backend, on_msg=self.on_msg)
+        parser.parse(b"MSG the.subject 1 the.reply 5\r\nhel")
+        parser.parse(b"lo\r\nPING\r\nHMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\n")
+        parser.parse(b"world\r\n")
+        assert self.received == [
+            (1, "the.subject", "the.reply", b"hello", b""),
+            (2, "the.subject", "", b"world", b"NATS/1.0"),
+        ]
+        assert parser.events_received() == [PING_EVENT]
+
+    def test_dispatch_to_handlers(self) -> None:
+        handlers = {1: self.handler}
+        parser = make_parser(self.backend, handlers=handlers)
+        parser.parse(
+            b"MSG the.subject 1 5\r\nhello\r\n"
+            b"HMSG the.subject 1 the.reply 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+            b"MSG other.subject 2 1\r\n!\r\n"
+        )
+        assert self.received == [
+            ("the.subject", "", b"hello", b""),
+            ("the.subject", "the.reply", b"world", b"NATS/1.0"),
+        ]
+        # Messages without handler are returned as events
+        assert parser.events_received() == [
+            MsgEvent(2, "other.subject", "", bytearray(b"!")),
+        ]
+        # Handlers are looked up on each message
+        del handlers[1]
+        parser.parse(b"MSG the.subject 1 1\r\n?\r\n")
+        assert parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"?")),
+        ]
+
+    def test_handlers_take_precedence_over_on_msg(self) -> None:
+        parser = make_parser(
+            self.backend, on_msg=self.on_msg, handlers={1: self.handler}
+        )
+        parser.parse(
+            b"MSG the.subject 1 5\r\nhello\r\nMSG the.subject 2 5\r\nworld\r\n"
+        )
+        assert self.received == [
+            ("the.subject", "", b"hello", b""),
+            (2, "the.subject", "", b"world", b""),
+        ]
+        assert parser.events_received() == []
+
+    def test_dispatch_ping_pong(self) -> None:
+        parser = make_parser(
+            self.backend,
+            on_msg=self.on_msg,
+            on_ping=lambda: self.received.append(("PING",)),
+            on_pong=lambda: self.received.append(("PONG",)),
+        )
+        parser.parse(b"MSG the.subject 1 5\r\nhello\r\nPING\r\nPO")
+        # PING is passed to its callback before the following operations
+        assert self.received == [
+            (1, "the.subject", "", b"hello", b""),
+            ("PING",),
+        ]
+        parser.parse(b"NG\r\nMSG the.subject 1 5\r\nworld\r\n+OK\r\n")
+        assert self.received[2:] == [
+            ("PONG",),
+            (1, "the.subject", "", b"world", b""),
+        ]
+        assert parser.events_received() == [OK_EVENT]
+
+    def test_dispatch_zero_copy(self) -> None:
+        views: list[memoryview] = []
+
+        def handler(
+            subject: str,
+            reply_to: str,
+            payload: bytearray | memoryview,
+            header: bytearray | memoryview,
+        ) -> None:
+            assert isinstance(payload, memoryview)
+            assert isinstance(header, memoryview)
+            views.extend((payload, header))
+
+        parser = make_parser(self.backend, zero_copy=True, handlers={1: handler})
+        parser.parse(b"HMSG the.subject 1 12 17\r\nNATS/1.0\r\n\r\nhello\r\n")
+        parser.parse(b"MSG the.subject 1 5\r\nworld\r\n")
+        assert [bytes(view) for view in views] == [b"hello", b"NATS/1.0", b"world", b""]
+        assert all(view.readonly for view in views)
+
+    def test_callback_error_closes_parser(self) -> None:
+        def on_msg(*args: object) -> None:
+            raise RuntimeError("boom")
+
+        parser = make_parser(self.backend, on_msg=on_msg)
+        with pytest.raises(RuntimeError):
+            parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+        with pytest.raises(ParserClosedError):
+            parser.parse(b"PING\r\n")
+
+
+class TestSubjectCache:
+    def test_decode_returns_same_object(self) -> None:
+        cache = SubjectCache()
+        subject = cache.decode(bytearray(b"the.subject"))
+        assert subject == "the.subject"
+        assert cache.decode(b"the.subject") is subject
+        assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+
+    def test_least_recently_used_subject_is_evicted(self) -> None:
+        cache = SubjectCache(maxsize=2)
+        cache.decode(b"a")
+        cache.decode(b"b")
+        cache.decode(b"a")
+        cache.decode(b"c")
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (1, 3)
+        cache.decode(b"a")
+        assert (cache.hits, cache.misses) == (2, 3)
+        cache.decode(b"b")
+        assert (cache.hits, cache.misses) == (2, 4)
+
+    def test_clear(self) -> None:
+        cache = SubjectCache()
+        cache.decode(b"a")
+        cache.decode(b"a")
+        cache.clear()
+        assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+
+    def test_invalid_size(self) -> None:
+        with pytest.raises(ValueError):
+            SubjectCache(maxsize=0)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+def test_parse_with_subject_cache(backend: Backend) -> None:
+    skip_unavailable(backend)
+    cache = SubjectCache()
+    parser = make_parser(backend, subject_cache=cache)
+    parser.parse(
+        b"MSG the.subject 1 the.reply 5\r\nhello\r\n"
+        b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+        b"MSG the.reply 3 the.subject 1\r\n!\r\n"
+    )
+    first, second, third = parser.events_received()
+    assert first == MsgEvent(1, "the.subject", "the.reply", bytearray(b"hello"))
+    assert second == HMsgEvent(
+        2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+    )
+    assert third == MsgEvent(3, "the.reply", "the.subject", bytearray(b"!"))
+    assert isinstance(first, MsgEvent)
+    assert isinstance(second, HMsgEvent)
+    assert isinstance(third, MsgEvent)
+    assert second.subject is first.subject
+    assert third.subject is first.reply_to
+    assert third.reply_to is first.subject
+    assert (cache.hits, cache.misses) == (3, 2)
+
+
+class TestControlLineCache:
+    def test_get_and_put(self) -> None:
+        cache = ControlLineCache()
+        assert cache.get(b"MSG a 1") is None
+        cache.put(b"MSG a 1", ("a", 1, "", 0, 5))
+        assert cache.get(b"MSG a 1") == ("a", 1, "", 0, 5)
+        assert (cache.hits, cache.misses, len(cache)) == (1, 1, 1)
+        assert cache.hit_ratio == 0.5
+
+    def test_least_recently_used_line_is_evicted(self) -> None:
+        cache = ControlLineCache(maxsize=2)
+        cache.put(b"MSG a 1", ("a", 1, "", 0, 5))
+        cache.put(b"MSG b 2", ("b", 2, "", 0, 5))
+        cache.get(b"MSG a 1")
+        cache.put(b"MSG c 3", ("c", 3, "", 0, 5))
+        assert len(cache) == 2
+        assert cache.get(b"MSG b 2") is None
+        assert cache.get(b"MSG a 1") == ("a", 1, "", 0, 5)
+
+    def test_clear(self) -> None:
+        cache = ControlLineCache()
+        cache.put(b"MSG a 1", ("a", 1, "", 0, 5))
+        cache.get(b"MSG a 1")
+        cache.clear()
+        assert (cache.hits, cache.misses, len(cache)) == (0, 0, 0)
+        assert cache.hit_ratio == 0.0
+
+    def test_invalid_size(self) -> None:
+        with pytest.raises(ValueError):
+            ControlLineCache(maxsize=0)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [backend for backend in BACKENDS if backend != Backend.PARSER_RE],
+)
+def test_parse_with_control_line_cache(backend: Backend) -> None:
+    skip_unavailable(backend)
+    cache = ControlLineCache()
+    parser = make_parser(backend, control_line_cache=cache)
+    parser.parse(
+        b"MSG the.subject 1 the.reply 5\r\nhello\r\n"
+        b"MSG the.subject 1 the.reply 5\r\nworld\r\n"
+        b"MSG the.subject 1 the.reply 2\r\nhi\r\n"
+        b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nhello\r\n"
+        b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+    )
+    assert parser.events_received() == [
+        MsgEvent(1, "the.subject", "the.reply", bytearray(b"hello")),
+        MsgEvent(1, "the.subject", "the.reply", bytearray(b"world")),
+        MsgEvent(1, "the.subject", "the.reply", bytearray(b"hi")),
+        HMsgEvent(2, "the.subject", "", bytearray(b"hello"), bytearray(b"NATS/1.0")),
+        HMsgEvent(2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")),
+    ]
+    assert (cache.hits, cache.misses, len(cache)) == (2, 3, 3)
+    assert cache.hit_ratio == 0.4
+
+
+@pytest.mark.parametrize(
+    "backend",
+    [backend for backend in BACKENDS if backend != Backend.PARSER_RE],
+)
+def test_parse_with_shared_control_line_cache(backend: Backend) -> None:
+    skip_unavailable(backend)
+    cache = ControlLineCache()
+    first = make_parser(backend, control_line_cache=cache)
+    second = make_parser(backend, control_line_cache=cache)
+    first.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+    second.parse(b"MSG the.subject 1 5\r\nworld\r\n")
+    assert second.events_received() == [
+        MsgEvent(1, "the.subject", "", bytearray(b"world"))
+    ]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+class TestEventPool:
+    def test_events_are_reused(self) -> None:
+        pool = EventPool()
+        msg = pool.msg(1, "the.subject", "", bytearray(b"hello"))
+        hmsg = pool.hmsg(2, "the.subject", "", bytearray(), bytearray(b"NATS/1.0"))
+        pool.put(msg)
+        pool.put(hmsg)
+        assert len(pool) == 2
+        # References to payload and header are dropped
+        assert msg.payload == b"" and hmsg.header == b""
+        assert pool.msg(3, "other", "reply", bytearray(b"world")) is msg
+        assert msg == MsgEvent(3, "other", "reply", bytearray(b"world"))
+        assert pool.hmsg(4, "other", "", bytearray(), bytearray(b"A")) is hmsg
+        assert (pool.allocated, pool.reused, len(pool)) == (2, 2, 0)
+
+    def test_other_events_are_ignored(self) -> None:
+        pool = EventPool()
+        pool.put(PING_EVENT)
+        pool.put(LazyMsgEvent(b"the.subject 1", bytearray()))
+        assert len(pool) == 0
+
+    def test_events_are_returned_once(self) -> None:
+        pool = EventPool()
+        msg = pool.msg(1, "the.subject", "", bytearray(b"hello"))
+        hmsg = pool.hmsg(2, "the.subject", "", bytearray(), bytearray(b"NATS/1.0"))
+        for _ in range(2):
+            pool.put(msg)
+            pool.put(hmsg)
+        assert len(pool) == 2
+        first = pool.msg(3, "the.subject", "", bytearray(b"world"))
+        second = pool.msg(4, "the.subject", "", bytearray(b"world"))
+        assert first is msg and second is not msg
+
+    def test_full_pool_drops_events(self) -> None:
+        pool = EventPool(maxsize=1)
+        pool.put(MsgEvent(1, "the.subject", "", bytearray()))
+        pool.put(MsgEvent(1, "the.subject", "", bytearray()))
+        assert len(pool) == 1
+        pool.clear()
+        assert len(pool) == 0
+
+    def test_invalid_size(self) -> None:
+        with pytest.raises(ValueError):
+            EventPool(maxsize=0)
+
+
+def test_msg_event_header() -> None:
+    event = MsgEvent(1, "the.subject", "", bytearray())
+    assert event.header == bytearray()
+    assert isinstance(event.header, bytearray)
+
+
+def test_pooled_msg_events_share_empty_header() -> None:
+    pool = EventPool()
+    first = pool.msg(1, "the.subject", "", bytearray())
+    second = pool.msg(2, "the.subject", "", bytearray())
+    assert first.header is second.header is EMPTY_HEADER
+    assert first.header == b""
+    assert isinstance(first.header, memoryview) and first.header.readonly
+    pool.put(first)
+    assert pool.msg(3, "the.subject", "", bytearray()).header is EMPTY_HEADER
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+def test_parse_with_event_pool(backend: Backend) -> None:
+    skip_unavailable(backend)
+    pool = EventPool()
+    parser = make_parser(backend, event_pool=pool)
+    data = (
+        b"MSG the.subject 1 5\r\nhello\r\nPING\r\n"
+        b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+    )
+    parser.parse(data)
+    events = parser.events_received()
+    assert events == [
+        MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+        PING_EVENT,
+        HMsgEvent(2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")),
+    ]
+    for event in events:
+        pool.put(event)
+    parser.parse(data)
+    reused = parser.events_received()
+    assert [id(event) for event in reused] == [id(event) for event in events]
+    assert reused[0] == MsgEvent(1, "the.subject", "", bytearray(b"hello"))
+    assert (pool.allocated, pool.reused) == (2, 2)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserLazy:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+
+    def test_parse_lazy_events(self) -> None:
+        parser = make_parser(self.backend, lazy=True)
+        parser.parse(b"MSG the.subject 1 the.reply 5\r\nhel")
+        parser.parse(
+            b"lo\r\nHMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+            b"HMSG the.subject 3 the.reply 12 12\r\nNATS/1.0\r\n\r\n\r\n"
+        )
+        events = parser.events_received()
+        assert [type(event) for event in events] == [
+            LazyMsgEvent,
+            LazyHMsgEvent,
+            LazyHMsgEvent,
+        ]
+        assert events == [
+            MsgEvent(1, "the.subject", "the.reply", bytearray(b"hello")),
+            HMsgEvent(
+                2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+            ),
+            HMsgEvent(
+                3, "the.subject", "the.reply", bytearray(), bytearray(b"NATS/1.0")
+            ),
+        ]
+        assert isinstance(events[0], MsgEvent)
+        assert events[0].copy() == MsgEvent(
+            1, "the.subject", "the.reply", bytearray(b"hello")
+        )
+
+    def test_lazy_is_ignored_with_callbacks(self) -> None:
+        received: list[int] = []
+        parser = make_parser(
+            self.backend,
+            lazy=True,
+            on_msg=lambda sid, *args: received.append(sid),  # pyright: ignore
+        )
+        parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+        assert received == [1]
+
+    def test_parse_lazy_info(self) -> None:
+        parser = make_parser(self.backend, lazy=True)
+        parser.parse(make_server_info(connect_urls=["10.0.0.1:4222"]).encode())
+        [event] = parser.events_received()
+        assert isinstance(event, LazyInfoEvent)
+        assert event.connect_urls == ["10.0.0.1:4222"]
+        assert event.version == Version(0, 0, 0, "test")
+        assert event.max_payload == 1048576
+        assert event.nonce is None
+
+    def test_parse_info_with_json_loads(self) -> None:
+        decoded: list[bytes] = []
+
+        def json_loads(data: bytearray | bytes) -> object:
+            decoded.append(bytes(data))
+            return json.loads(data)
+
+        parser = make_parser(self.backend, json_loads=json_loads)
+        info = make_server_info()
+        parser.parse(info.encode())
+        [event] = parser.events_received()
+        assert isinstance(event, InfoEvent)
+        assert event.server_id == "test"
+        assert decoded == [info[5:-2].encode()]
+
+    def test_parse_info_not_an_object(self) -> None:
+        parser = make_parser(self.backend, lazy=True)
+        with pytest.raises(ProtocolError):
+            parser.parse(b"INFO []\r\n")
+
+
+class TestLazyInfoEvent:
+    def test_fields_are_read_on_first_access(self) -> None:
+        raw = json.loads(make_server_info(nonce="abc")[5:-2])
+        event = LazyInfoEvent(raw)
+        assert event.nonce == "abc"
+        raw["nonce"] = "xyz"
+        assert event.nonce == "abc"
+        assert event.tls_required is None
+        event.port = 4222
+        assert event.port == 4222
+
+    def test_equals_eager_event(self) -> None:
+        data = make_server_info()[5:-2].encode()
+        assert LazyInfoEvent(json.loads(data)) == parse_info(data)
+        assert parse_info(data) == LazyInfoEvent(json.loads(data))
+
+    def test_invalid_fields_raise_on_access(self) -> None:
+        event = LazyInfoEvent({"server_id": "test", "version": "1.2.3.4"})
+        assert event.server_id == "test"
+        with pytest.raises(ProtocolError):
+            event.host
+        with pytest.raises(ProtocolError):
+            event.version
+
+
+class TestLazyMsgEvent:
+    def test_attributes_are_decoded_on_first_access(self) -> None:
+        event = LazyMsgEvent(b"the.subject 1 the.reply", bytearray(b"hello"))
+        assert event.sid == 1
+        assert event.subject == "the.subject"
+        assert event.reply_to == "the.reply"
+        event.subject = "other.subject"
+        assert event == MsgEvent(1, "other.subject", "the.reply", bytearray(b"hello"))
+
+    def test_invalid_arguments_raise_on_access(self) -> None:
+        event = LazyMsgEvent(b"the.subject x", bytearray(b"hello"))
+        assert event.payload == b"hello"
+        with pytest.raises(ProtocolError):
+            event.sid
+
+    def test_hmsg_attributes_are_decoded_on_first_access(self) -> None:
+        event = LazyHMsgEvent(
+            b"the.subject 1", bytearray(b"hello"), bytearray(b"NATS/1.0")
+        )
+        assert event == HMsgEvent(
+            1, "the.subject", "", bytearray(b"hello"), bytearray(b"NATS/1.0")
+        )
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserBatch:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.parser = make_parser(backend, batch=True)
+
+    def test_parse_batch(self) -> None:
+        self.parser.parse(b"MSG the.subject 1 the.reply 5\r\nhel")
+        self.parser.parse(
+            b"lo\r\nPING\r\nHMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+            b"MSG the.reply 3 1\r\n!\r\n"
+        )
+        batch = self.parser.batch_received()
+        assert len(batch) == 3
+        assert list(batch.kind) == [Operation.MSG, Operation.HMSG, Operation.MSG]
+        assert list(batch.sid) == [1, 2, 3]
+        assert batch.subjects == ["the.subject", "the.reply"]
+        assert list(batch.subject) == [0, 0, 1]
+        assert list(batch.reply_to) == [1, -1, -1]
+        assert list(batch.payload_size) == [5, 5, 1]
+        assert list(batch.header_size) == [0, 8, 0]
+        assert [batch.payload(i) for i in range(3)] == [b"hello", b"world", b"!"]
+        assert [batch.header(i) for i in range(3)] == [b"", b"NATS/1.0", b""]
+        assert list(batch.events()) == [
+            MsgEvent(1, "the.subject", "the.reply", bytearray(b"hello")),
+            HMsgEvent(
+                2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+            ),
+            MsgEvent(3, "the.reply", "", bytearray(b"!")),
+        ]
+        # Other operations are still returned as events
+        assert self.parser.events_received() == [PING_EVENT]
+        assert len(self.parser.batch_received()) == 0
+
+    def test_parse_batch_large_stream(self) -> None:
+        for sid in range(1000):
+            self.parser.parse(b"MSG the.subject %d 5\r\nhello\r\n" % sid)
+        batch = self.parser.batch_received()
+        assert list(batch.sid) == list(range(1000))
+        assert batch.data == b"hello" * 1000
+        assert batch.subjects == ["the.subject"]
+
+    def test_parse_batch_with_handlers(self, backend: Backend) -> None:
+        received: list[tuple[str, bytes]] = []
+        self.parser = make_parser(
+            backend,
+            batch=True,
+            handlers={
+                1: lambda subject, reply_to, payload, header: received.append(
+                    (subject, bytes(payload))
+                )
+            },
+        )
+        self.parser.parse(
+            b"MSG the.subject 1 5\r\nhello\r\nMSG the.subject 2 the.reply 5\r\n"
+            b"world\r\n"
+        )
+        # Messages dispatched to callbacks are not added to the batch
+        assert received == [("the.subject", b"hello")]
+        batch = self.parser.batch_received()
+        assert list(batch.sid) == [2]
+        assert batch.subjects == ["the.subject", "the.reply"]
+        assert batch.data == b"world"
+
+
+def test_batch_received_without_batch_mode() -> None:
+    parser = make_parser()
+    parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+    assert isinstance(parser.batch_received(), EventBatch)
+    assert len(parser.batch_received()) == 0
+    assert len(parser.events_received()) == 1
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("read_size", [1, 7, 64, 1 << 20])
+def test_parse_large_stream(backend: Backend, read_size: int) -> None:
+    skip_unavailable(backend)
+    parser = make_parser(backend)
+    payload = b"hello\r\nworld\r\n" * 64
+    stream = (
+        b"MSG the.subject 1 %d\r\n%s\r\nPING\r\n"
+        b"HMSG the.subject 2 12 %d\r\nNATS/1.0\r\n\r\n%s\r\n"
+        % (len(payload), payload, len(payload) + 12, payload)
+    ) * 16
+    events: list[Event] = []
+    for idx in range(0, len(stream), read_size):
+        parser.parse(stream[idx : idx + read_size])
+        events.extend(parser.events_received())
+    assert (
+        events
+        == [
+            MsgEvent(1, "the.subject", "", bytearray(payload)),
+            PING_EVENT,
+            HMsgEvent(2, "the.subject", "", bytearray(payload), bytearray(b"NATS/1.0")),
+        ]
+        * 16
+    )
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("zero_copy", [False, True])
+@pytest.mark.parametrize("read_size", [1, 7, 64])
+def test_parse_many(backend: Backend, zero_copy: bool, read_size: int) -> None:
+    skip_unavailable(backend)
+    parser = make_parser(backend, zero_copy=zero_copy)
+    stream = (
+        b"MSG the.subject 1 5\r\nhello\r\nPING\r\n"
+        b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nworld\r\n"
+    ) * 16
+    reads = [stream[idx : idx + read_size] for idx in range(0, len(stream), read_size)]
+    events: list[Event] = []
+    for idx in range(0, len(reads), 8):
+        parser.parse_many(memoryview(read) for read in reads[idx : idx + 8])
+        events.extend(parser.events_received())
+    assert (
+        events
+        == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            HMsgEvent(
+                2, "the.subject", "", bytearray(b"world"), bytearray(b"NATS/1.0")
+            ),
+        ]
+        * 16
+    )
+
+
+def make_msg_stream(count: int) -> bytearray:
+    """Return a stream of messages with random payload sizes."""
+    rng = random.Random(0)
+    stream = bytearray()
+    for _ in range(count):
+        size = rng.randint(10, 400)
+        stream += b"MSG the.subject 1 %d\r\n%s\r\n" % (size, b"x" * size)
+    return stream
+
+
+def buffer_size(parser: object) -> int:
+    """Return the size of the parser buffer, including its spare room."""
+    name = "_data_received" if hasattr(parser, "_data_received") else "buf"
+    return len(getattr(parser, name))
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("zero_copy", [False, True])
+def test_parse_buffer_is_bounded(backend: Backend, zero_copy: bool) -> None:
+    skip_unavailable(backend)
+    parser = make_parser(backend, zero_copy=zero_copy)
+    stream = make_msg_stream(20_000)
+    count = 0
+    for idx in range(0, len(stream), 4096):
+        parser.parse(stream[idx : idx + 4096])
+        count += len(parser.events_received())
+        # Parsed bytes are discarded instead of growing the buffer
+        assert buffer_size(parser) <= 2 * 4096
+    assert count == 20_000
+
+
+def test_parse_zero_copy_buffer_is_reclaimed() -> None:
+    parser = make_parser(Backend.PARSER_SM, zero_copy=True)
+    stream = make_msg_stream(20_000)
+    # Payloads of the last messages are still alive after each read
+    events: deque[Event] = deque(maxlen=64)
+    for idx in range(0, len(stream), 4096):
+        parser.parse(stream[idx : idx + 4096])
+        events.extend(parser.events_received())
+        assert buffer_size(parser) <= 2 * 4096
+    # Parsed bytes are discarded once the payloads are released and room
+    # is needed, leaving only the last bytes received in the buffer
+    events.clear()
+    parser.parse(b"PING\r\n")
+    assert parser.events_received() == [PING_EVENT]
+    assert buffer_size(parser) == len(b"PING\r\n")
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("read_size", [1, 2, 3])
+def test_parse_control_line_split_across_reads(
+    backend: Backend, read_size: int
+) -> None:
+    skip_unavailable(backend)
+    parser = make_parser(backend)
+    urls = [f"10.0.0.{idx}:4222" for idx in range(64)]
+    stream = make_server_info(connect_urls=urls).encode()
+    stream += b"MSG the.subject 1 5\r\nhello\r\n-ERR 'Stale Connection'\r\n"
+    events: list[Event] = []
+    for idx in range(0, len(stream), read_size):
+        parser.parse(stream[idx : idx + read_size])
+        events.extend(parser.events_received())
+    assert len(events) == 3
+    assert isinstance(events[0], InfoEvent)
+    assert events[0].connect_urls == urls
+    assert events[1:] == [
+        MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+        ErrorEvent("stale connection"),
+    ]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserPayloadStreaming:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+        self.chunks: list[tuple[int, bytes, bool]] = []
+
+    def on_payload_chunk(
+        self, sid: int, chunk: bytearray | memoryview, final: bool
+    ) -> None:
+        self.chunks.append((sid, bytes(chunk), final))
+
+    def payloads(self) -> dict[int, bytes]:
+        payloads: dict[int, bytes] = {}
+        for sid, chunk, _ in self.chunks:
+            payloads[sid] = payloads.get(sid, b"") + chunk
+        return payloads
+
+    @pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+    def test_stream_large_payloads(self, read_size: int) -> None:
+        parser = make_parser(
+            self.backend,
+            large_payload_threshold=16,
+            on_payload_chunk=self.on_payload_chunk,
+        )
+        payload = b"hello\r\nworld\r\n" * 8
+        stream = (
+            b"MSG the.subject 1 the.reply %d\r\n%s\r\nPING\r\n"
+            b"MSG the.subject 1 5\r\nsmall\r\n"
+            b"HMSG the.subject 2 12 %d\r\nNATS/1.0\r\n\r\n%s\r\n"
+            % (len(payload), payload, len(payload) + 12, payload)
+        )
+        events: list[Event] = []
+        for idx in range(0, len(stream), read_size):
+            parser.parse(stream[idx : idx + read_size])
+            events.extend(parser.events_received())
+        # Streamed messages are delivered with an empty payload
+        assert events == [
+            MsgEvent(1, "the.subject", "the.reply", bytearray()),
+            PING_EVENT,
+            MsgEvent(1, "the.subject", "", bytearray(b"small")),
+            HMsgEvent(2, "the.subject", "", bytearray(), bytearray(b"NATS/1.0")),
+        ]
+        assert self.payloads() == {1: payload, 2: payload}
+        assert [final for _, _, final in self.chunks].count(True) == 2
+        assert all(chunk for _, chunk, _ in self.chunks)
+
+    @pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+    def test_stream_to_batch(self, read_size: int) -> None:
+        parser = make_parser(
+            self.backend,
+            batch=True,
+            large_payload_threshold=16,
+            on_payload_chunk=self.on_payload_chunk,
+        )
+        payload = b"hello\r\nworld\r\n" * 8
+        stream = (
+            b"MSG the.subject 1 the.reply 5\r\nfirst\r\n"
+            b"HMSG the.subject 2 12 %d\r\nNATS/1.0\r\n\r\n%s\r\n"
+            b"MSG the.reply 3 4\r\nlast\r\n" % (len(payload) + 12, payload)
+        )
+        for idx in range(0, len(stream), read_size):
+            parser.parse(stream[idx : idx + read_size])
+        # Streamed messages are stored between messages copied from the buffer
+        assert list(parser.batch_received().events()) == [
+            MsgEvent(1, "the.subject", "the.reply", bytearray(b"first")),
+            HMsgEvent(2, "the.subject", "", bytearray(), bytearray(b"NATS/1.0")),
+            MsgEvent(3, "the.reply", "", bytearray(b"last")),
+        ]
+        assert self.payloads() == {2: payload}
+
+    def test_stream_to_on_msg(self) -> None:
+        received: list[tuple[object, ...]] = []
+
+        def on_msg(
+            sid: int,
+            subject: str,
+            reply_to: str,
+            payload: bytearray | memoryview,
+            header: bytearray | memoryview,
+        ) -> None:
+            received.append((sid, subject, bytes(payload), bytes(header)))
+
+        parser = make_parser(
+            self.backend,
+            on_msg=on_msg,
+            large_payload_threshold=4,
+            on_payload_chunk=self.on_payload_chunk,
+        )
+        parser.parse(b"HMSG the.subject 2 12 17\r\nNATS/1.0\r\n\r\nhel")
+        parser.parse(b"lo\r\nMSG the.subject 1 5\r\nworld\r\n")
+        assert received == [
+            (2, "the.subject", b"", b"NATS/1.0"),
+            (1, "the.subject", b"", b""),
+        ]
+        assert self.chunks == [
+            (2, b"hel", False),
+            (2, b"lo", True),
+            (1, b"world", True),
+        ]
+
+    def test_stream_lazy(self) -> None:
+        parser = make_parser(
+            self.backend,
+            lazy=True,
+            large_payload_threshold=4,
+            on_payload_chunk=self.on_payload_chunk,
+        )
+        parser.parse(b"MSG the.subject 3 5\r\nhello\r\n")
+        [event] = parser.events_received()
+        assert isinstance(event, LazyMsgEvent)
+        assert event.sid == 3
+        assert bytes(event.payload) == b""
+        assert self.chunks == [(3, b"hello", True)]
+
+
+class TestPayloadSpool:
+    def test_write_and_release(self, tmp_path: Path) -> None:
+        spool = PayloadSpool(str(tmp_path))
+        spool.write(1, bytearray(b"hello "), False)
+        spool.write(1, memoryview(b"world"), True)
+        payload = spool.release()
+        assert payload.readonly
+        assert bytes(payload) == b"hello world"
+        assert spool.spilled == 1
+        # Temporary files are removed once mapped
+        assert list(tmp_path.iterdir()) == []
+
+    def test_release_without_payload(self) -> None:
+        spool = PayloadSpool()
+        assert bytes(spool.release()) == b""
+        assert spool.spilled == 0
+
+    def test_close(self) -> None:
+        spool = PayloadSpool()
+        spool.write(1, bytearray(b"hello"), False)
+        spool.close()
+        assert bytes(spool.release()) == b""
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+@pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+def test_parse_with_payload_spool(backend: Backend, read_size: int) -> None:
+    skip_unavailable(backend)
+    spool = PayloadSpool()
+    parser = make_parser(backend, large_payload_threshold=16, payload_spool=spool)
+    payload = b"hello\r\nworld\r\n" * 8
+    stream = (
+        b"MSG the.subject 1 %d\r\n%s\r\nMSG the.subject 1 5\r\nsmall\r\n"
+        b"HMSG the.subject 2 12 %d\r\nNATS/1.0\r\n\r\n%s\r\n"
+        % (len(payload), payload, len(payload) + 12, payload)
+    )
+    events: list[Event] = []
+    for idx in range(0, len(stream), read_size):
+        parser.parse(stream[idx : idx + read_size])
+        events.extend(parser.events_received())
+    assert events == [
+        MsgEvent(1, "the.subject", "", bytearray(payload)),
+        MsgEvent(1, "the.subject", "", bytearray(b"small")),
+        HMsgEvent(2, "the.subject", "", bytearray(payload), bytearray(b"NATS/1.0")),
+    ]
+    spooled = [event.payload for event in events if isinstance(event, MsgEvent)]
+    assert isinstance(spooled[0], memoryview) and spooled[0].readonly
+    assert isinstance(events[2], HMsgEvent)
+    assert isinstance(events[2].payload, memoryview)
+    assert spool.spilled == 2
+
+
+def test_stream_requires_threshold_and_callback() -> None:
+    with pytest.raises(ValueError):
+        make_parser(large_payload_threshold=16)
+    with pytest.raises(ValueError):
+        make_parser(on_payload_chunk=lambda sid, chunk, final: None)
+    with pytest.raises(ValueError):
+        make_parser(payload_spool=PayloadSpool())
+    with pytest.raises(ValueError):
+        make_parser(
+            large_payload_threshold=16,
+            on_payload_chunk=lambda sid, chunk, final: None,
+            payload_spool=PayloadSpool(),
+        )
+    with pytest.raises(ValueError):
+        make_parser(
+            large_payload_threshold=-1,
+            on_payload_chunk=lambda sid, chunk, final: None,
+        )
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserLimits:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+
+    @pytest.mark.parametrize("read_size", [1, 7, 1 << 20])
+    def test_control_line_too_long(self, read_size: int) -> None:
+        parser = make_parser(self.backend, max_control_line=64)
+        data = b"MSG " + b"a" * 100
+        with pytest.raises(LimitExceededError) as exc_info:
+            for idx in range(0, len(data), read_size):
+                parser.parse(data[idx : idx + read_size])
+        assert exc_info.value.limit == "max_control_line"
+        assert exc_info.value.max_size == 64
+        assert isinstance(exc_info.value, ProtocolError)
+        with pytest.raises(ParserClosedError):
+            parser.parse(b"PING\r\n")
+
+    @pytest.mark.parametrize(
+        "line",
+        [
+            b"MSG the.subject 1 " + b"a" * 64 + b" 5",
+            b"HMSG the.subject 1 " + b"a" * 64 + b" 12 17",
+            b"INFO " + json.dumps({"server_id": "a" * 64}).encode(),
+            b"-ERR '" + b"a" * 64 + b"'",
+        ],
+    )
+    def test_complete_control_line_too_long(self, line: bytes) -> None:
+        parser = make_parser(self.backend, max_control_line=64)
+        # The whole line is received in a single read
+        with pytest.raises(LimitExceededError) as exc_info:
+            parser.parse(b"PING\r\n" + line + b"\r\n")
+        assert exc_info.value.limit == "max_control_line"
+        assert exc_info.value.size == len(line)
+        assert exc_info.value.max_size == 64
+
+    def test_control_line_within_limit(self) -> None:
+        parser = make_parser(self.backend, max_control_line=32)
+        parser.parse(b"MSG the.subject 1 the")
+        parser.parse(b".reply 5\r\nhello\r\n")
+        assert parser.events_received() == [
+            MsgEvent(1, "the.subject", "the.reply", bytearray(b"hello"))
+        ]
+        # Complete operations left in buffer while streaming are not limited
+        events = list(parser.parse_iter(b"PING\r\n" * 16))
+        assert events == [PING_EVENT] * 16
+
+    @pytest.mark.parametrize(
+        "data",
+        [
+            b"MSG the.subject 1 2048\r\n",
+            b"HMSG the.subject 1 12 2048\r\n",
+        ],
+    )
+    def test_payload_too_large(self, data: bytes) -> None:
+        parser = make_parser(self.backend, max_payload=1024)
+        # The error is raised before the payload is received
+        with pytest.raises(LimitExceededError) as exc_info:
+            parser.parse(data)
+        assert exc_info.value.limit == "max_payload"
+        assert (exc_info.value.size, exc_info.value.max_size) == (2048, 1024)
+
+    def test_set_limits_from_info(self) -> None:
+        parser = make_parser(self.backend)
+        parser.parse(make_server_info(max_payload=4).encode())
+        parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+        [info, msg] = parser.events_received()
+        assert isinstance(info, InfoEvent)
+        assert msg == MsgEvent(1, "the.subject", "", bytearray(b"hello"))
+        parser.set_limits(max_payload=info.max_payload)
+        parser.parse(b"MSG the.subject 1 4\r\nhell\r\n")
+        with pytest.raises(LimitExceededError):
+            parser.parse(b"MSG the.subject 1 5\r\nhello\r\n")
+
+    def test_invalid_limits(self) -> None:
+        with pytest.raises(ValueError):
+            make_parser(self.backend, max_control_line=0)
+        with pytest.raises(ValueError):
+            make_parser(self.backend, max_payload=-1)
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+class TestParserBudget:
+    @pytest.fixture(autouse=True)
+    def setup(self, backend: Backend) -> None:
+        skip_unavailable(backend)
+        self.backend = backend
+
+    def test_max_events(self) -> None:
+        parser = make_parser(self.backend, max_events=3)
+        parser.parse(b"MSG the.subject 1 5\r\nhello\r\nPING\r\n" * 4)
+        assert parser.pending()
+        assert parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+        ]
+        parser.resume()
+        assert parser.pending()
+        assert len(parser.events_received()) == 3
+        # New bytes are parsed after the bytes left by the previous call
+        parser.parse(b"PONG\r\n")
+        assert not parser.pending()
+        assert parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+            PING_EVENT,
+            PONG_EVENT,
+        ]
+
+    @pytest.mark.parametrize("zero_copy", [False, True])
+    def test_max_bytes(self, zero_copy: bool) -> None:
+        received: list[bytes] = []
+        parser = make_parser(
+            self.backend,
+            zero_copy=zero_copy,
+            on_msg=lambda sid, subject, reply_to, payload, header: received.append(
+                bytes(payload)
+            ),
+            max_bytes=64,
+        )
+        parser.parse(b"MSG the.subject 1 5\r\nhello\r\n" * 16)
+        calls = 1
+        while parser.pending():
+            assert len(received) < 16
+            parser.resume()
+            calls += 1
+        assert received == [b"hello"] * 16
+        assert calls > 4
+
+    def test_split_operation_is_not_pending(self) -> None:
+        parser = make_parser(self.backend, max_events=1)
+        parser.parse(b"PING\r\nMSG the.subject 1 5\r\nhel")
+        assert parser.pending()
+        assert parser.events_received() == [PING_EVENT]
+        parser.resume()
+        assert not parser.pending()
+        assert parser.events_received() == []
+        parser.parse(b"lo\r\n")
+        assert parser.events_received() == [
+            MsgEvent(1, "the.subject", "", bytearray(b"hello"))
+        ]
+
+    def test_split_control_line_is_not_pending(self) -> None:
+        parser = make_parser(self.backend, max_events=1)
+        parser.parse(b"PING\r\nMSG the.sub")
+        assert parser.pending()
+        parser.resume()
+        assert not parser.pending()
+        # The end of the control line is still missing
+        parser.parse(b"ject 1 5")
+        assert not parser.pending()
+        parser.parse(b"\r\nhello\r\n")
+        assert not parser.pending()
+        assert parser.events_received() == [
+            PING_EVENT,
+            MsgEvent(1, "the.subject", "", bytearray(b"hello")),
+        ]
+
+    def test_invalid_budget(self) -> None:
+        with pytest.raises(ValueError):
+            make_parser(self.backend, max_events=0)
+        with pytest.raises(ValueError):
+            make_parser(self.backend, max_bytes=0)
+
+
+def test_parser_re_reset() -> None:
+    parser = ParserRE(max_events=1)
+    parser.parse(b"PING\r\nPING\r\n")
+    assert parser.pending()
+    parser.reset()
+    assert not parser.pending()
+    parser.parse(b"PONG\r\n")
+    assert parser.events_received() == [PONG_EVENT]
+
+
+@pytest.mark.parametrize(
+    "backend",
+    BACKENDS,
+)
+def test_parser_is_closed_after_error(backend: Backend) -> None:
+    skip_unavailable(backend)
+    parser = make_parser(backend)
+    with pytest.raises(ProtocolError):
+        parser.parse(b"MSG the.subject x 5\r\nhello\r\n")
+    with pytest.raises(ParserClosedError):
+        parser.parse(b"PING\r\n")